@@ -1,18 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, JSONResponse, PlainTextResponse
 from starlette.responses import RedirectResponse
 from uvicorn import run as app_run
 
 from sensorFaultDetection.utils import read_yaml
-from sensorFaultDetection.pipeline.training_pipeline import TrainingPipeline
-from sensorFaultDetection.pipeline.prediction_pipeline import PredictionPipeline
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.config.configuration import ConfigurationManager
+from sensorFaultDetection.pipeline.training_job import TrainingJobRunner
+from sensorFaultDetection.pipeline.prediction_pipeline import PredictionPipeline, MicroBatcher, read_request_body
+from sensorFaultDetection.components.prediction import Prediction
+from sensorFaultDetection.drift_monitor import OnlineDriftMonitor
+from sensorFaultDetection.instrumentation import METRICS, run_report_to_prometheus
 
 try:
     params = read_yaml('params.yaml')    
     APP_HOST = params.APP_HOST
     APP_PORT = params.APP_PORT
+    PREDICTION_MAX_BATCH_SIZE = params.PREDICTION_MAX_BATCH_SIZE
+    PREDICTION_BATCH_WINDOW_MS = params.PREDICTION_BATCH_WINDOW_MS
 except Exception as e:
     raise e
 
@@ -20,6 +27,13 @@ except Exception as e:
 
 app = FastAPI()
 
+# created once per process, /predict reuses it instead of reading the yaml files per request
+prediction_config = None
+micro_batcher = None
+drift_monitor = None
+training_job_runner = None
+instrumentation_config = None
+
 origins = ["*"]
 
 app.add_middleware(
@@ -31,6 +45,42 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def load_prediction_model():
+    global prediction_config, micro_batcher, drift_monitor, training_job_runner, instrumentation_config
+    config = ConfigurationManager()
+    prediction_config = config.get_prediction_config()
+    instrumentation_config = config.get_instrumentation_config()
+    training_job_runner = TrainingJobRunner(config=config.get_training_job_config())
+    try:
+        PredictionPipeline(None, config=prediction_config).warm_up()
+    except Exception as e:
+        # the server still starts without a trained model, it is loaded on the first request after training
+        logging.info(f'WARNING: prediction model is not loaded at startup! {e}')
+
+    prediction = Prediction(filename=None, config=prediction_config)
+    # the predicted rows are added to windows of the traffic, which are checked for drift against the train set
+    drift_monitor_config = config.get_drift_monitor_config()
+    if drift_monitor_config.enabled:
+        drift_monitor = OnlineDriftMonitor(config= drift_monitor_config,
+                                           get_baseline= prediction.get_drift_baseline,
+                                           on_drift= training_job_runner.submit if drift_monitor_config.retrain_on_drift else None)
+        drift_monitor.start()
+    micro_batcher = MicroBatcher(predict= prediction.predict_classes,
+                                 max_batch_size= PREDICTION_MAX_BATCH_SIZE,
+                                 max_latency_ms= PREDICTION_BATCH_WINDOW_MS,
+                                 on_batch= drift_monitor.update if drift_monitor is not None else None)
+    micro_batcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_micro_batcher():
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+    if drift_monitor is not None:
+        await drift_monitor.stop()
+
+
 @app.get("/", tags=["authentication"])
 async def index():
     return RedirectResponse(url="/docs")
@@ -38,19 +88,38 @@ async def index():
 
 @app.get("/train")
 async def trainRouteClient():
-    try:       
-        training_pipeline = TrainingPipeline()             
-        if training_pipeline.is_pipeline_running:
-            return Response('Training pipeline is already running!')
-
-        training_pipeline.run_pipeline()
+    # training runs in a separate process, the request only starts it and returns the job id
+    try:
+        job_id, is_started = training_job_runner.submit()
+        if not is_started:
+            return JSONResponse(status_code=409, content={'message': 'Training pipeline is already running!', 'job_id': job_id})
 
-        return Response("Training successful!!")
+        return JSONResponse(status_code=202, content={'message': 'Training is started!', 'job_id': job_id})
 
     except Exception as e:
         return Response(f"Error Occurred! {e}")
 
 
+@app.get("/train/{job_id}")
+async def trainStatusRouteClient(job_id: str):
+    try:
+        return JSONResponse(content=training_job_runner.get_status(job_id))
+
+    except Exception as e:
+        return JSONResponse(status_code=404, content={'error': f'Error Occurred! {e}'})
+
+
+
+
+@app.get("/metrics")
+async def metricsRouteClient():
+    # Prometheus text format: totals of the steps measured in this worker and the steps of the last training run
+    try:
+        content = METRICS.to_prometheus() + run_report_to_prometheus(instrumentation_config.run_report_file)
+        return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
+
+    except Exception as e:
+        return JSONResponse(status_code=500, content={'error': f'Error Occurred! {e}'})
 
 
 @app.get("/predict")
@@ -59,7 +128,7 @@ async def predictRouteClient():
     try:  
         df = None
 
-        prediction_pipeline = PredictionPipeline(df)
+        prediction_pipeline = PredictionPipeline(df, config=prediction_config)
 
         prediction_pipeline.predict()
 
@@ -71,5 +140,23 @@ async def predictRouteClient():
         return Response(f"Error Occurred! {e}")
 
 
+@app.post("/predict")
+async def predictBatchRouteClient(request: Request):
+    # sensor rows as JSON records or an Arrow IPC stream, concurrent requests are scored in micro-batches
+    try:
+        body = await request.body()
+        df = read_request_body(body, request.headers.get('content-type', ''))
+        df = Prediction(filename=None, config=prediction_config).validate_input_dataframe(df)
+    except Exception as e:
+        return JSONResponse(status_code=400, content={'error': f'Invalid input! {e}'})
+
+    try:
+        y_pred = await micro_batcher.predict(df)
+        return JSONResponse(content={'predicted_class': y_pred.tolist()})
+
+    except Exception as e:
+        return JSONResponse(status_code=500, content={'error': f'Error Occurred! {e}'})
+
+
 if __name__ == "__main__":
     app_run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
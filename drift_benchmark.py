@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+
+# the per-column ks_2samp loop the drift check used before against the vectorized engine of drift.py, on
+# sensor-like columns with missing values, run from the project root e.g. `python drift_benchmark.py`
+NUMBER_OF_COLUMNS = 164
+NAN_RATE = 0.05
+SHAPES = [(60000, 12000), (60000, 50), (5000, 800)] # rows of the base and of the current sample
+REPEATS = 3
+THRESHOLD = 0.05
+
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+from sensorFaultDetection.drift import detect_dataset_drift
+from sensorFaultDetection.utils import get_n_jobs
+
+
+def make_sample(number_of_rows: int, random_generator: np.random.Generator) -> pd.DataFrame:
+    # right-skewed readings with many zeros and ties like the sensor columns, some columns shifted
+    shift = np.where(np.arange(NUMBER_OF_COLUMNS) % 10 == 0, random_generator.normal(0, 0.1), 0)
+    values = np.round(random_generator.lognormal(3 + shift, 1, (number_of_rows, NUMBER_OF_COLUMNS)))
+    values[random_generator.random(values.shape) < 0.3] = 0
+    values[random_generator.random(values.shape) < NAN_RATE] = np.nan
+    return pd.DataFrame(values, columns=[f'sensor_{j:03d}' for j in range(NUMBER_OF_COLUMNS)])
+
+
+def detect_dataset_drift_loop(base_dataframe: pd.DataFrame, current_dataframe: pd.DataFrame, threshold: float) -> tuple:
+    # one ks_2samp per column, missing values dropped like the vectorized engine does
+    report = {}
+    for column in base_dataframe.columns:
+        pvalue = ks_2samp(base_dataframe[column].dropna(), current_dataframe[column].dropna()).pvalue
+        report[column] = {'p_value': float(pvalue), 'drift_status': not pvalue >= threshold}
+    return not any(column_report['drift_status'] for column_report in report.values()), report
+
+
+def get_time(function, *args) -> tuple:
+    # best of REPEATS runs and the result of the last one
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    random_generator = np.random.default_rng(0)
+    n_jobs = get_n_jobs(-1)
+    for base_rows, current_rows in SHAPES:
+        base_dataframe = make_sample(base_rows, random_generator)
+        current_dataframe = make_sample(current_rows, random_generator)
+
+        loop_time, (_, expected) = get_time(detect_dataset_drift_loop, base_dataframe, current_dataframe, THRESHOLD)
+        engine_time, (_, report) = get_time(detect_dataset_drift, base_dataframe, current_dataframe, THRESHOLD)
+        line = f'{base_rows:6d} x {current_rows:6d}: loop {loop_time:6.2f}s, vectorized {engine_time:6.2f}s'
+        if n_jobs > 1:
+            parallel_time, _ = get_time(detect_dataset_drift, base_dataframe, current_dataframe, THRESHOLD, n_jobs)
+            line += f', {n_jobs} processes {parallel_time:6.2f}s'
+
+        pvalue_difference = max(abs(report[column]['p_value'] - expected[column]['p_value']) for column in expected)
+        assert pvalue_difference <= 1e-12, f'p-values differ by {pvalue_difference}'
+        assert all(report[column]['drift_status'] == expected[column]['drift_status'] for column in expected)
+        print(f'{line}, largest p-value difference {pvalue_difference:.1e}')
@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import subprocess
+
+# cold start of every entry point: each module is imported in a fresh interpreter, the best of
+# REPEATS runs is reported, run from the project root e.g. `python import_benchmark.py`
+REPEATS = 5
+ENTRY_POINTS = [
+    'app',
+    'sensorFaultDetection.pipeline.stage_01_data_ingestion',
+    'sensorFaultDetection.pipeline.stage_02_data_validation',
+    'sensorFaultDetection.pipeline.stage_03_data_transformation',
+    'sensorFaultDetection.pipeline.stage_04_model_trainer',
+    'sensorFaultDetection.pipeline.stage_05_model_evaluation',
+    'sensorFaultDetection.pipeline.training_pipeline',
+]
+
+
+def get_import_time(module: str) -> float:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.path.join(os.getcwd(), 'src'),
+                                                                     os.environ.get('PYTHONPATH')])))
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f'import {module}'], env=env, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    baseline = get_import_time('os')
+    print(f'{"interpreter start":60s} {baseline:.3f}s')
+    for module in ENTRY_POINTS:
+        print(f'{module:60s} {get_import_time(module):.3f}s')
@@ -6,16 +6,21 @@ from sensorFaultDetection.pipeline.stage_02_data_validation import DataValidatio
 from sensorFaultDetection.pipeline.stage_03_data_transformation import DataTransformationPipeline
 from sensorFaultDetection.pipeline.stage_04_model_trainer import ModelTrainerPipeline
 from sensorFaultDetection.pipeline.stage_05_model_evaluation import ModelEvaluationPipeline
+from sensorFaultDetection.pipeline.stage_cache import StageCache
+from sensorFaultDetection.config.configuration import ConfigurationManager
+from sensorFaultDetection.instrumentation import METRICS
 #from sensorFaultDetection.pipeline.training_pipeline import TrainingPipeline
 #from sensorFaultDetection.pipeline.prediction_pipeline import PredictionPipeline
 
+# stages whose inputs did not change since their last run are skipped
+stage_cache = StageCache(config= ConfigurationManager().get_stage_cache_config())
 
 STAGE_NAME = "Data Ingestion Stage"
 
 try:
     logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
     obj = DataIngestionPipeline()
-    obj.main()
+    stage_cache.run_stage(STAGE_NAME, obj)
     logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
     
 except Exception as e:
@@ -27,7 +32,7 @@ STAGE_NAME = "Data Validation Stage"
 try:
     logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
     obj = DataValidationPipeline()
-    obj.main()
+    stage_cache.run_stage(STAGE_NAME, obj)
     logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
     
 except Exception as e:
@@ -39,7 +44,7 @@ STAGE_NAME = "Data Transformation Stage"
 try:
     logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
     obj = DataTransformationPipeline()
-    obj.main()
+    stage_cache.run_stage(STAGE_NAME, obj)
     logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
     
 except Exception as e:
@@ -51,7 +56,7 @@ STAGE_NAME = "Model Training Stage"
 try:
     logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
     obj = ModelTrainerPipeline()
-    obj.main()
+    stage_cache.run_stage(STAGE_NAME, obj)
     logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
     
 except Exception as e:
@@ -62,12 +67,15 @@ STAGE_NAME = "Model Evaluation Stage"
 try:
     logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
     obj = ModelEvaluationPipeline()
-    obj.main()
+    stage_cache.run_stage(STAGE_NAME, obj)
     logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
     
 except Exception as e:
     raise CustomException(e, sys)
 
+# wall and cpu time, peak memory, rows and bytes of every stage above
+METRICS.write_run_report(ConfigurationManager().get_instrumentation_config().run_report_file)
+
 '''STAGE_NAME = "Training Pipeline"
 
 try:
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import subprocess
+import numpy as np
+
+# load time and latency of the best model of the local artifacts on rows of the valid test set, run from the
+# project root e.g. `python prediction_benchmark.py`, a pickled SensorModel given as
+# `python prediction_benchmark.py artifacts/model_trainer/<id>/model.pkl` is measured for comparison
+BATCH_SIZES = [1, 8, 64, 512, 4096]
+MIN_SECONDS = 1.0
+LOAD_REPEATS = 5
+
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+from sensorFaultDetection.config.configuration import ConfigurationManager
+from sensorFaultDetection.components.prediction import Prediction
+from sensorFaultDetection.compiled_model import load_sensor_model
+from sensorFaultDetection.utils import read_dataframe
+
+
+def get_latency(predict, batch) -> float:
+    # median seconds per call of the calls made in MIN_SECONDS, after one warm up call
+    predict(batch)
+    times = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < MIN_SECONDS:
+        call_start = time.perf_counter()
+        predict(batch)
+        times.append(time.perf_counter() - call_start)
+    return float(np.median(times))
+
+
+def get_load_time(model_path: str) -> tuple:
+    """
+    Returns:
+        tuple: best of LOAD_REPEATS cold loads in a fresh interpreter, imports included,
+            and the median of warm loads in this process
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.join(os.getcwd(), 'src'),
+                                                                     os.environ.get('PYTHONPATH')])))
+    code = ('import time; start = time.perf_counter(); '
+            'from sensorFaultDetection.compiled_model import load_sensor_model; '
+            f'load_sensor_model({model_path!r}); print(time.perf_counter() - start)')
+    cold = min(float(subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True,
+                                    text=True).stdout.split()[-1]) for _ in range(LOAD_REPEATS))
+    return cold, get_latency(load_sensor_model, model_path)
+
+
+if __name__ == '__main__':
+    config = ConfigurationManager()
+    model_paths = [Prediction(filename=None, config=config.get_prediction_config()).get_best_model_path()] + sys.argv[1:]
+    models = [load_sensor_model(model_path) for model_path in model_paths]
+    columns = getattr(models[0], 'columns', None) or config.get_prediction_config().schema_numerical_columns
+    df = read_dataframe(config.get_model_evaluation_config().valid_test_file)[columns]
+
+    for model_path, model in zip(model_paths, models):
+        cold, warm = get_load_time(model_path)
+        print(f'{model_path}: {model!r}, load {cold * 1e3:.0f}ms cold, {warm * 1e3:.1f}ms warm')
+        for batch_size in BATCH_SIZES:
+            batch = df.iloc[np.arange(batch_size) % len(df)]
+            print(f'{batch_size:8d} rows {get_latency(model.predict, batch) * 1e6:10.0f}us')
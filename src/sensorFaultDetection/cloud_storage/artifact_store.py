@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import datetime
+import yaml
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.utils import get_file_hash
+from sensorFaultDetection.cloud_storage.s3_syncer import S3Sync, SyncResult
+from sensorFaultDetection.entity.config_entity import ArtifactStoreConfig, S3SyncConfig
+
+
+class ArtifactStore:
+    """
+    content addressed store of the artifacts of every training run in s3
+
+    Every file is uploaded once to `<objects_prefix>/<sha256>`, whatever its path and run.
+    A run is a manifest at `<runs_prefix>/<run_id>/manifest.yaml` that maps the relative path
+    of each artifact to its hash and size, so the bytes uploaded by a run are those of the
+    files whose content no earlier run uploaded. The manifest is written last, a run is only
+    listed once all its objects exist.
+    """
+    def __init__(self, config: ArtifactStoreConfig, s3_sync_config: S3SyncConfig, client=None):
+        self.config = config
+        self.s3_sync = S3Sync(s3_sync_config, client=client)
+        self.client = self.s3_sync.client
+
+    def get_object_key(self, sha256: str) -> str:
+        return f'{self.config.objects_prefix}/{sha256}'
+
+    def get_manifest_key(self, run_id: str) -> str:
+        return f'{self.config.runs_prefix}/{run_id}/manifest.yaml'
+
+    def is_object_stored(self, bucket: str, sha256: str) -> bool:
+        try:
+            self.client.head_object(Bucket= bucket, Key= self.get_object_key(sha256))
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise e
+
+    def upload_run(self, folder: Path, bucket: str, run_id: str) -> SyncResult:
+        """
+        uploads the files of `folder` missing in the store and the manifest of the run
+        Returns:
+            SyncResult: objects transferred and skipped, bytes, duration and per file errors
+        """
+        try:
+            start = time.perf_counter()
+            files = {}
+            for root, _, filenames in os.walk(folder):
+                for filename in filenames:
+                    path = os.path.join(root, filename)
+                    files[Path(os.path.relpath(path, folder)).as_posix()] = {
+                        'sha256': get_file_hash(path), 'size': os.path.getsize(path), 'path': path}
+
+            # a content shared by several files is uploaded once
+            objects = {file['sha256']: file for file in files.values()}
+            with ThreadPoolExecutor(max_workers= self.s3_sync.config.max_workers) as executor:
+                is_stored = dict(zip(objects, executor.map(lambda sha256: self.is_object_stored(bucket, sha256), objects)))
+
+            transfers = [(file['path'], file['size'],
+                          lambda file=file, sha256=sha256: self.client.upload_file(
+                              file['path'], bucket, self.get_object_key(sha256), Config= self.s3_sync.transfer_config))
+                         for sha256, file in objects.items() if not is_stored[sha256]]
+            result = self.s3_sync.run_transfers(transfers)
+            result.files_skipped = len(objects) - len(transfers)
+
+            if len(result.errors) == 0:
+                manifest = {
+                    'run_id': run_id,
+                    'created_at': datetime.datetime.now().isoformat(),
+                    'files': {name: {'sha256': file['sha256'], 'size': file['size']} for name, file in sorted(files.items())}
+                }
+                self.client.put_object(Bucket= bucket, Key= self.get_manifest_key(run_id),
+                                       Body= yaml.safe_dump(manifest).encode())
+            result.duration_seconds = round(time.perf_counter() - start, 3)
+            logging.info(f'Artifacts of run {run_id} are stored in s3://{bucket}: {result}')
+            return result
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def get_manifest(self, bucket: str, run_id: str) -> dict:
+        try:
+            response = self.client.get_object(Bucket= bucket, Key= self.get_manifest_key(run_id))
+            return yaml.safe_load(response['Body'].read())
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def download_run(self, folder: Path, bucket: str, run_id: str) -> SyncResult:
+        """
+        restores the artifacts of a run into `folder`, files with the right content are kept
+        Returns:
+            SyncResult: files transferred and skipped, bytes, duration and per file errors
+        """
+        try:
+            start = time.perf_counter()
+            transfers = []
+            files_skipped = 0
+            for name, file in self.get_manifest(bucket, run_id)['files'].items():
+                path = os.path.join(folder, *name.split('/'))
+                if os.path.isfile(path) and os.path.getsize(path) == file['size'] and get_file_hash(path) == file['sha256']:
+                    files_skipped += 1
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                transfers.append((name, file['size'],
+                                  lambda path=path, file=file: self.client.download_file(
+                                      bucket, self.get_object_key(file['sha256']), path, Config= self.s3_sync.transfer_config)))
+
+            result = self.s3_sync.run_transfers(transfers)
+            result.files_skipped = files_skipped
+            result.duration_seconds = round(time.perf_counter() - start, 3)
+            logging.info(f'Artifacts of run {run_id} are restored to {folder}: {result}')
+            return result
+
+        except Exception as e:
+            raise CustomException(e, sys)
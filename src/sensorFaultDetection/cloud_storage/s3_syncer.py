@@ -1,12 +1,170 @@
 import os
+import sys
+import time
+import hashlib
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.entity.config_entity import S3SyncConfig
+
+
+# s3 allows at most 10000 parts per multipart upload, boto3 doubles the part size until the file fits
+MAX_PARTS = 10000
+
+
+@dataclass
+class SyncResult:
+    files_transferred: int = 0
+    files_skipped: int = 0
+    bytes_transferred: int = 0
+    duration_seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
 
 class S3Sync:
-    # upload folder directly to aws s3
-    def sync_folder_to_s3( folder, aws_bucket_url):
-        command = f"aws s3 sync {folder} {aws_bucket_url}"
-        os.system(command)
-
-    # download folder directly from aws s3
-    def sync_folder_from_s3(folder, aws_bucket_url):
-        command = f"aws s3 sync {aws_bucket_url} {folder}"
-        os.system(command)
+    """
+    syncs a local folder with an s3 prefix in process, without the aws cli
+
+    Files are transferred by a pool of `max_workers` threads, files above `multipart_threshold`
+    in parts of `multipart_chunksize` with `multipart_concurrency` threads each. A file is
+    skipped when the destination has the same size and the same ETag, which s3 computes as the
+    md5 of a file uploaded in one part and as the md5 of the part md5s for a multipart upload,
+    so the local ETag is computed with the same part size. Like `aws s3 sync`, files missing in
+    the source are not deleted at the destination.
+    """
+    def __init__(self, config: S3SyncConfig, client=None):
+        self.config = config
+        self.client = client or boto3.client(
+            's3', config= Config(max_pool_connections= config.max_workers * config.multipart_concurrency))
+        self.transfer_config = TransferConfig(multipart_threshold= config.multipart_threshold,
+                                              multipart_chunksize= config.multipart_chunksize,
+                                              max_concurrency= config.multipart_concurrency)
+
+    @staticmethod
+    def parse_bucket_url(aws_bucket_url: str) -> tuple:
+        # s3://bucket/prefix -> (bucket, prefix)
+        if not aws_bucket_url.startswith('s3://'):
+            raise ValueError(f'{aws_bucket_url} is not an s3 url!')
+        bucket, _, prefix = aws_bucket_url[len('s3://'):].partition('/')
+        return bucket, prefix.strip('/')
+
+    def get_etag(self, path: Path, size: int) -> str:
+        if size < self.config.multipart_threshold:
+            md5 = hashlib.md5()
+            with open(path, 'rb') as file_obj:
+                for block in iter(lambda: file_obj.read(1024 * 1024), b''):
+                    md5.update(block)
+            return md5.hexdigest()
+
+        chunksize = self.config.multipart_chunksize
+        while -(-size // chunksize) > MAX_PARTS:
+            chunksize *= 2
+        part_digests = []
+        with open(path, 'rb') as file_obj:
+            for part in iter(lambda: file_obj.read(chunksize), b''):
+                part_digests.append(hashlib.md5(part).digest())
+        return f'{hashlib.md5(b"".join(part_digests)).hexdigest()}-{len(part_digests)}'
+
+    def list_objects(self, bucket: str, prefix: str) -> dict:
+        # {key: (size, etag)} of every object below the prefix
+        objects = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket= bucket, Prefix= f'{prefix}/' if prefix else ''):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = (obj['Size'], obj['ETag'].strip('"'))
+        return objects
+
+    def is_unchanged(self, path: Path, remote: tuple) -> bool:
+        if remote is None or not os.path.isfile(path):
+            return False
+        size = os.path.getsize(path)
+        return size == remote[0] and self.get_etag(path, size) == remote[1]
+
+    def run_transfers(self, transfers: list) -> SyncResult:
+        # transfers: (description, size, callable) of the files that are not up to date
+        result = SyncResult()
+        def transfer(item):
+            description, size, function = item
+            try:
+                function()
+                return size, None
+            except Exception as e:
+                return 0, f'{description}: {e}'
+
+        with ThreadPoolExecutor(max_workers= self.config.max_workers) as executor:
+            for size, error in executor.map(transfer, transfers):
+                if error is None:
+                    result.files_transferred += 1
+                    result.bytes_transferred += size
+                else:
+                    result.errors.append(error)
+        return result
+
+    def sync_folder_to_s3(self, folder: Path, aws_bucket_url: str) -> SyncResult:
+        """
+        uploads the files of `folder` that differ from the objects below `aws_bucket_url`
+        Returns:
+            SyncResult: transferred and skipped files, bytes, duration and per file errors
+        """
+        try:
+            start = time.perf_counter()
+            bucket, prefix = self.parse_bucket_url(aws_bucket_url)
+            remote_objects = self.list_objects(bucket, prefix)
+
+            transfers = []
+            files_skipped = 0
+            for root, _, filenames in os.walk(folder):
+                for filename in filenames:
+                    path = os.path.join(root, filename)
+                    key = '/'.join(filter(None, [prefix, Path(os.path.relpath(path, folder)).as_posix()]))
+                    if self.is_unchanged(path, remote_objects.get(key)):
+                        files_skipped += 1
+                        continue
+                    transfers.append((path, os.path.getsize(path),
+                                      lambda path=path, key=key: self.client.upload_file(path, bucket, key, Config= self.transfer_config)))
+
+            result = self.run_transfers(transfers)
+            result.files_skipped = files_skipped
+            result.duration_seconds = round(time.perf_counter() - start, 3)
+            logging.info(f'{folder} is synced to {aws_bucket_url}: {result}')
+            return result
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def sync_folder_from_s3(self, folder: Path, aws_bucket_url: str) -> SyncResult:
+        """
+        downloads the objects below `aws_bucket_url` that differ from the files of `folder`
+        Returns:
+            SyncResult: transferred and skipped files, bytes, duration and per file errors
+        """
+        try:
+            start = time.perf_counter()
+            bucket, prefix = self.parse_bucket_url(aws_bucket_url)
+
+            transfers = []
+            files_skipped = 0
+            for key, remote in self.list_objects(bucket, prefix).items():
+                if key.endswith('/'):
+                    continue
+                path = os.path.join(folder, *key[len(prefix):].lstrip('/').split('/'))
+                if self.is_unchanged(path, remote):
+                    files_skipped += 1
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                transfers.append((key, remote[0],
+                                  lambda path=path, key=key: self.client.download_file(bucket, key, path, Config= self.transfer_config)))
+
+            result = self.run_transfers(transfers)
+            result.files_skipped = files_skipped
+            result.duration_seconds = round(time.perf_counter() - start, 3)
+            logging.info(f'{aws_bucket_url} is synced to {folder}: {result}')
+            return result
+
+        except Exception as e:
+            raise CustomException(e, sys)
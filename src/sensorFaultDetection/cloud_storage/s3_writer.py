@@ -0,0 +1,97 @@
+import sys
+import boto3
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+
+
+# s3 rejects parts below 5 MiB except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3MultipartWriter:
+    """
+    binary file object that streams what is written to it into an s3 object
+
+    Written bytes are buffered until a part of `part_size` is full and uploaded as one part of a
+    multipart upload, so memory stays at one part whatever the size of the object. The object is
+    only created when the writer is closed without error, an upload that fails or is left is aborted.
+    Content smaller than one part is uploaded with a single put_object.
+    Args:
+        bucket (str): destination bucket
+        key (str): destination key
+        part_size (int): bytes per uploaded part, at least 5 MiB
+        client: optional, boto3 s3 client
+    """
+    def __init__(self, bucket: str, key: str, part_size: int, client=None):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.client = client or boto3.client('s3')
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+        self.closed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def flush(self) -> None:
+        pass
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError(f's3://{self.bucket}/{self.key} is already closed!')
+        self.buffer += data
+        self.bytes_written += len(data)
+        while len(self.buffer) >= self.part_size:
+            self.upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def upload_part(self, body: bytes) -> None:
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket= self.bucket, Key= self.key)['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket= self.bucket, Key= self.key, UploadId= self.upload_id,
+                                           PartNumber= part_number, Body= body)
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def close(self) -> None:
+        # completes the object with the buffered rest
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket= self.bucket, Key= self.key, Body= bytes(self.buffer))
+            else:
+                if len(self.buffer) > 0:
+                    self.upload_part(bytes(self.buffer))
+                self.client.complete_multipart_upload(Bucket= self.bucket, Key= self.key, UploadId= self.upload_id,
+                                                      MultipartUpload= {'Parts': self.parts})
+            self.buffer = bytearray()
+            self.closed = True
+            logging.info(f'{self.bytes_written} bytes are written to s3://{self.bucket}/{self.key} in {max(len(self.parts), 1)} parts!')
+        except Exception as e:
+            self.abort()
+            raise CustomException(e, sys)
+
+    def abort(self) -> None:
+        # the uploaded parts are deleted, no object is created
+        self.closed = True
+        self.buffer = bytearray()
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket= self.bucket, Key= self.key, UploadId= self.upload_id)
+            self.upload_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,403 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import datetime
+import threading
+import yaml
+import numpy as np
+import pandas as pd
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.instrumentation import measure
+from sensorFaultDetection.utils import load_pickle, get_file_hash
+
+
+# a model bundle is a directory of the manifest, the native booster and one .npy file per array
+MODEL_BUNDLE_DIR_NAME = 'model_bundle'
+BUNDLE_MANIFEST_FILE_NAME = 'manifest.yaml'
+BOOSTER_FILE_NAME = 'booster.ubj'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_ARRAYS = ['fill_values', 'center', 'scale', 'left', 'right', 'split_index', 'split_condition',
+                 'default_left', 'roots']
+# models that cannot be bundled are pickled, as before the bundle format
+PICKLE_FILE_NAME = 'model.pkl'
+
+
+class CompiledSensorModel:
+    """
+    SensorModel exported to flat numpy arrays, for scoring without sklearn, pandas or a DMatrix
+
+    The preprocessor is folded into three vectors: the imputer fill values and the RobustScaler
+    center and scale, applied in the order and precision of the fitted pipeline. The trees used
+    by the booster's predictions (up to its best iteration) are concatenated into one node table,
+    where a leaf points to itself and keeps its value in `split_condition`, so all trees are walked
+    at once in `max_depth` vectorized steps. Batches up to `numpy_max_rows` rows are scored by this
+    walk, larger ones by xgboost's inplace_predict on the serialized booster, loaded on first use.
+
+    The model is saved as a bundle directory instead of a pickle: every array in its own .npy file,
+    memory-mapped on load, the booster in xgboost's native UBJSON format and a manifest with the
+    format version, the library versions it was written with and the hash and size of every file.
+    Loading runs no pickled code and imports neither sklearn nor xgboost.
+    """
+    def __init__(self, columns: list, fill_values: np.ndarray, center: np.ndarray, scale: np.ndarray,
+                 left: np.ndarray, right: np.ndarray, split_index: np.ndarray, split_condition: np.ndarray,
+                 default_left: np.ndarray, roots: np.ndarray, max_depth: int, base_margin: float,
+                 numpy_max_rows: int=64, booster_raw: bytes=None, booster_file: str=None):
+        self.columns = columns
+        self.fill_values = fill_values
+        self.center = center
+        self.scale = scale
+        self.left = left
+        self.right = right
+        self.split_index = split_index
+        self.split_condition = split_condition
+        self.default_left = default_left
+        self.roots = roots
+        self.max_depth = max_depth
+        self.base_margin = base_margin
+        self.numpy_max_rows = numpy_max_rows
+        # the serialized booster, in memory after compiling, a file of the bundle after loading
+        self.booster_raw = booster_raw
+        self.booster_file = booster_file
+        self.booster = None
+        self.lock = threading.Lock()
+        self.preprocessor_hash = self.get_preprocessor_fingerprint()
+
+    @staticmethod
+    def get_preprocessor_arrays(preprocessing_object) -> tuple:
+        # (columns, fill_values, center, scale) of a fitted Pipeline of a SimpleImputer and a RobustScaler
+        steps = [step for _, step in preprocessing_object.steps]
+        names = [type(step).__name__ for step in steps]
+        if names != ['SimpleImputer', 'RobustScaler']:
+            raise ValueError(f'preprocessor steps {names} cannot be compiled!')
+        imputer, scaler = steps
+        if imputer.add_indicator or not (isinstance(imputer.missing_values, float) and np.isnan(imputer.missing_values)):
+            raise ValueError('only an imputer of nan values without indicator columns can be compiled!')
+
+        columns = list(preprocessing_object.feature_names_in_)
+        fill_values = np.asarray(imputer.statistics_, dtype=np.float64)
+        if imputer.strategy != 'constant':
+            # columns without any value are dropped by the imputer
+            valid = ~np.isnan(fill_values)
+            columns = [column for column, is_valid in zip(columns, valid) if is_valid]
+            fill_values = fill_values[valid]
+        center = scaler.center_ if scaler.with_centering else np.zeros(len(columns))
+        scale = scaler.scale_ if scaler.with_scaling else np.ones(len(columns))
+        return columns, fill_values, np.asarray(center, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+
+    @staticmethod
+    def get_booster(trained_model_object) -> tuple:
+        # (booster, best_iteration) of an XGBClassifier or a BoosterClassifier
+        if hasattr(trained_model_object, 'get_booster'):
+            booster = trained_model_object.get_booster()
+            best_iteration = getattr(trained_model_object, 'best_iteration', None)
+        else:
+            booster = trained_model_object.booster
+            best_iteration = trained_model_object.best_iteration
+        if best_iteration is None:
+            best_iteration = booster.num_boosted_rounds() - 1
+        return booster, int(best_iteration)
+
+    @classmethod
+    def from_sensor_model(cls, sensor_model, numpy_max_rows: int=64) -> 'CompiledSensorModel':
+        """
+        Args:
+            sensor_model (SensorModel): preprocessor and binary:logistic xgboost model
+            numpy_max_rows (int): largest batch scored by the numpy tree walk
+        Returns:
+            CompiledSensorModel: predicts like sensor_model.predict
+        """
+        try:
+            columns, fill_values, center, scale = cls.get_preprocessor_arrays(sensor_model.preprocessing_object)
+            booster, best_iteration = cls.get_booster(sensor_model.trained_model_object)
+            # the trees predictions use, the trees past the best iteration are dropped
+            booster = booster[:best_iteration + 1]
+
+            model = json.loads(booster.save_raw('json'))
+            learner = model['learner']
+            if learner['objective']['name'] != 'binary:logistic':
+                raise ValueError(f"objective {learner['objective']['name']} cannot be compiled!")
+            # base_score is a probability, '5E-1' or '[5E-1]' depending on the xgboost version
+            base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+            base_margin = float(np.log(base_score / (1 - base_score)))
+
+            left, right, split_index, split_condition, default_left, roots = [], [], [], [], [], []
+            max_depth = 0
+            offset = 0
+            for tree in learner['gradient_booster']['model']['trees']:
+                if any(split_type != 0 for split_type in tree.get('split_type', [])):
+                    raise ValueError('trees with categorical splits cannot be compiled!')
+                tree_left = np.asarray(tree['left_children'], dtype=np.int64)
+                tree_right = np.asarray(tree['right_children'], dtype=np.int64)
+                is_leaf = tree_left == -1
+                node_ids = np.arange(len(tree_left))
+                left.append(np.where(is_leaf, node_ids, tree_left) + offset)
+                right.append(np.where(is_leaf, node_ids, tree_right) + offset)
+                split_index.append(np.where(is_leaf, 0, tree['split_indices']))
+                split_condition.append(np.asarray(tree['split_conditions'], dtype=np.float32))
+                default_left.append(np.asarray(tree['default_left'], dtype=bool))
+                roots.append(offset)
+                max_depth = max(max_depth, cls.get_tree_depth(tree_left, tree_right))
+                offset += len(tree_left)
+
+            logging.info(f'Model is compiled to {len(roots)} trees of {offset} nodes and depth {max_depth}!')
+            return cls(columns, fill_values, center, scale,
+                       left= np.concatenate(left).astype(np.int32), right= np.concatenate(right).astype(np.int32),
+                       split_index= np.concatenate(split_index).astype(np.int32),
+                       split_condition= np.concatenate(split_condition), default_left= np.concatenate(default_left),
+                       roots= np.asarray(roots, dtype=np.int32), max_depth= max_depth, base_margin= base_margin,
+                       numpy_max_rows= numpy_max_rows, booster_raw= bytes(booster.save_raw('ubj')))
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def get_tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+        depth = 0
+        nodes = np.array([0])
+        while True:
+            nodes = nodes[left[nodes] != -1]
+            if len(nodes) == 0:
+                return depth
+            nodes = np.concatenate([left[nodes], right[nodes]])
+            depth += 1
+
+    def get_preprocessor_fingerprint(self) -> str:
+        # models with the same fingerprint transform the data the same way
+        preprocessor_hash = hashlib.sha256(json.dumps(self.columns).encode())
+        for array in (self.fill_values, self.center, self.scale):
+            preprocessor_hash.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        return preprocessor_hash.hexdigest()
+
+    def transform(self, dataframe) -> np.ndarray:
+        # the imputer and scaler of the pipeline, in float64 like sklearn
+        if isinstance(dataframe, pd.DataFrame):
+            # the column selection copies the frame, it is skipped when the columns are already in order
+            if dataframe.columns.tolist() != self.columns:
+                dataframe = dataframe[self.columns]
+            X = dataframe.to_numpy(dtype=np.float64)
+        else:
+            X = np.array(dataframe, dtype=np.float64)
+        X = np.where(np.isnan(X), self.fill_values, X)
+        X -= self.center
+        X /= self.scale
+        return X
+
+    def get_margin(self, X: np.ndarray) -> np.ndarray:
+        # walks every tree of every row at once, the features are compared in float32 like xgboost
+        X = np.asarray(X, dtype=np.float32)
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.max_depth):
+            values = X[rows, self.split_index[nodes]]
+            go_left = np.where(np.isnan(values), self.default_left[nodes], values < self.split_condition[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.split_condition[nodes].sum(axis=1, dtype=np.float32) + np.float32(self.base_margin)
+
+    def get_booster_predictor(self):
+        with self.lock:
+            if self.booster is None:
+                import xgboost
+                self.booster = xgboost.Booster(model_file=self.booster_file if self.booster_raw is None
+                                               else bytearray(self.booster_raw))
+            return self.booster
+
+    def predict_proba_transformed(self, X: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            X (np.ndarray): features transformed by the preprocessor
+        Returns:
+            np.ndarray: float32 probabilities of the positive class
+        """
+        if len(X) <= self.numpy_max_rows:
+            return 1 / (1 + np.exp(-self.get_margin(X)))
+        return self.get_booster_predictor().inplace_predict(X)
+
+    def predict_transformed(self, X: np.ndarray) -> np.ndarray:
+        return (self.predict_proba_transformed(X) > 0.5).astype(int)
+
+    def predict(self, dataframe) -> np.ndarray:
+        try:
+            with measure('compiled_model.predict', rows= len(dataframe), columns= len(self.columns)):
+                return self.predict_transformed(self.transform(dataframe))
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save(self, path, model_id: str=None) -> None:
+        """
+        writes the model bundle to the directory `path`, which must not exist yet
+        Args:
+            model_id (str): optional, id of the model in the registry, e.g. the timestamp of its training run
+        """
+        try:
+            # written next to the target and renamed, readers never load a partial bundle
+            temp_path = f'{path}.tmp'
+            remove_path(temp_path)
+            os.makedirs(temp_path)
+            for name in BUNDLE_ARRAYS:
+                np.save(os.path.join(temp_path, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+            booster_raw = self.booster_raw
+            if booster_raw is None:
+                with open(self.booster_file, 'rb') as file_obj:
+                    booster_raw = file_obj.read()
+            with open(os.path.join(temp_path, BOOSTER_FILE_NAME), 'wb') as file_obj:
+                file_obj.write(booster_raw)
+
+            import sklearn
+            import xgboost
+            manifest = {
+                'format_version': BUNDLE_FORMAT_VERSION,
+                'model_id': model_id,
+                'created_at': datetime.datetime.now().isoformat(),
+                'library_versions': {'numpy': np.__version__, 'xgboost': xgboost.__version__, 'sklearn': sklearn.__version__},
+                'objective': 'binary:logistic',
+                'trees': int(len(self.roots)),
+                'max_depth': int(self.max_depth),
+                'base_margin': float(self.base_margin),
+                'numpy_max_rows': int(self.numpy_max_rows),
+                'preprocessor_hash': self.preprocessor_hash,
+                'columns': list(self.columns),
+                'files': {name: {'sha256': get_file_hash(os.path.join(temp_path, name)),
+                                 'size': os.path.getsize(os.path.join(temp_path, name))}
+                          for name in sorted(os.listdir(temp_path))}
+            }
+            with open(os.path.join(temp_path, BUNDLE_MANIFEST_FILE_NAME), 'w') as yaml_file:
+                yaml.safe_dump(manifest, yaml_file, sort_keys=False)
+            os.replace(temp_path, path)
+            logging.info(f'Model bundle is saved to {path}!')
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    def read_manifest(path) -> dict:
+        # libyaml parses the manifest several times faster than the pure python loader where it is installed
+        with open(os.path.join(path, BUNDLE_MANIFEST_FILE_NAME)) as yaml_file:
+            return yaml.load(yaml_file, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+    @classmethod
+    def load(cls, path, mmap_mode: str='r') -> 'CompiledSensorModel':
+        """
+        Args:
+            path: model bundle directory
+            mmap_mode (str): 'r' maps the arrays read-only instead of reading them, None reads them
+        """
+        try:
+            manifest = cls.read_manifest(path)
+            if manifest['format_version'] > BUNDLE_FORMAT_VERSION:
+                raise ValueError(f"model bundle format {manifest['format_version']} of {path} is newer "
+                                 f"than the supported format {BUNDLE_FORMAT_VERSION}!")
+            for name, file in manifest['files'].items():
+                file_path = os.path.join(path, name)
+                if not os.path.isfile(file_path) or os.path.getsize(file_path) != file['size']:
+                    raise ValueError(f'{file_path} is missing or incomplete!')
+
+            # plain ndarray views of the memory maps, numpy operations on np.memmap objects are slower
+            arrays = {name: np.asarray(np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)) for name in BUNDLE_ARRAYS}
+            return cls(manifest['columns'], max_depth= manifest['max_depth'], base_margin= manifest['base_margin'],
+                       numpy_max_rows= manifest['numpy_max_rows'], booster_file= os.path.join(path, BOOSTER_FILE_NAME),
+                       **arrays)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def check_parity(self, sensor_model, dataframe: pd.DataFrame, tolerance: float=1e-5) -> dict:
+        """
+        compares both scoring paths of the compiled model with sensor_model.predict
+        Returns:
+            dict: rows, mismatched predictions of the numpy walk and of inplace_predict,
+                largest probability difference of the numpy walk to the booster
+        """
+        try:
+            expected = np.asarray(sensor_model.predict(dataframe))
+            X = self.transform(dataframe)
+            numpy_proba = np.concatenate([1 / (1 + np.exp(-self.get_margin(X[start: start + 4096])))
+                                          for start in range(0, len(X), 4096)]) if len(X) else np.array([])
+            booster_proba = self.get_booster_predictor().inplace_predict(X) if len(X) else np.array([])
+            report = {
+                'rows': int(len(X)),
+                'numpy_mismatches': int(np.count_nonzero((numpy_proba > 0.5).astype(int) != expected)),
+                'booster_mismatches': int(np.count_nonzero((booster_proba > 0.5).astype(int) != expected)),
+                'max_probability_difference': float(np.max(np.abs(numpy_proba - booster_proba), initial=0.0))
+            }
+            report['passed'] = (report['numpy_mismatches'] == 0 and report['booster_mismatches'] == 0
+                                and report['max_probability_difference'] <= tolerance)
+            return report
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def __repr__(self):
+        return f'CompiledSensorModel(trees={len(self.roots)}, max_depth={self.max_depth})'
+
+
+def remove_path(path) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def get_model_path(model_dir) -> str:
+    # the bundle of a model directory, the pickle of a model saved before the bundle format
+    bundle_path = os.path.join(model_dir, MODEL_BUNDLE_DIR_NAME)
+    return bundle_path if os.path.isdir(bundle_path) else os.path.join(model_dir, PICKLE_FILE_NAME)
+
+
+def get_model_files(model_path) -> list:
+    """
+    Returns:
+        list: the files of a model bundle, manifest first, or the pickle file, e.g. for stage fingerprints
+    """
+    if model_path is None:
+        return []
+    if not os.path.isdir(model_path):
+        return [model_path]
+    names = sorted(name for name in os.listdir(model_path) if name != BUNDLE_MANIFEST_FILE_NAME)
+    return [os.path.join(model_path, name) for name in [BUNDLE_MANIFEST_FILE_NAME] + names]
+
+
+def load_sensor_model(model_path, mmap_mode: str='r'):
+    """
+    Returns:
+        CompiledSensorModel of a model bundle, SensorModel of a pickle
+    """
+    try:
+        if os.path.isdir(model_path):
+            return CompiledSensorModel.load(model_path, mmap_mode= mmap_mode)
+        return load_pickle(model_path)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def export_model(model_path, destination_dir) -> str:
+    """
+    replaces the model of `destination_dir` with a copy of the bundle or pickle at `model_path`
+    Returns:
+        str: path of the copy
+    """
+    try:
+        os.makedirs(destination_dir, exist_ok=True)
+        destination_path = os.path.join(destination_dir, os.path.basename(model_path))
+        temp_path = f'{destination_path}.tmp'
+        old_path = f'{destination_path}.old'
+        remove_path(temp_path)
+        remove_path(old_path)
+        if os.path.isdir(model_path):
+            shutil.copytree(model_path, temp_path)
+        else:
+            shutil.copy(model_path, temp_path)
+        # the previous model is only moved away once the copy is complete
+        if os.path.exists(destination_path):
+            os.replace(destination_path, old_path)
+        os.replace(temp_path, destination_path)
+        remove_path(old_path)
+        for name in (MODEL_BUNDLE_DIR_NAME, PICKLE_FILE_NAME):
+            if name != os.path.basename(model_path):
+                remove_path(os.path.join(destination_dir, name))
+        logging.info(f'Model {model_path} is exported to {destination_path}!')
+        return destination_path
+
+    except Exception as e:
+        raise CustomException(e, sys)
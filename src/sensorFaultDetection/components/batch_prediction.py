@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.components.prediction import Prediction
+from sensorFaultDetection.instrumentation import measure
+from sensorFaultDetection.utils import write_yaml_file, get_n_jobs
+from sensorFaultDetection.entity.config_entity import BatchPredictionConfig, PredictionConfig
+
+
+DATA_FILE_FORMATS = ('.csv', '.parquet', '.feather')
+
+# prediction config, download directory and s3 client of a worker process, set by `_init_worker`
+_worker = {}
+
+
+def set_model_threads(model, threads: int) -> None:
+    # the workers already use every core between them, xgboost would start a thread per core in each
+    if hasattr(model, 'get_booster_predictor'):
+        model.get_booster_predictor().set_param({'nthread': threads})
+    elif hasattr(getattr(model, 'trained_model_object', None), 'set_params'):
+        model.trained_model_object.set_params(n_jobs= threads)
+
+
+def _init_worker(config: PredictionConfig, download_dir: str, threads: int=None) -> None:
+    """
+    loads the best model and the drift baseline once per worker, every file it scores then uses them
+    Args:
+        threads (int): optional, xgboost threads of the worker, not limited when scoring in process
+    """
+    if threads is not None:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+    _worker['config'] = config
+    _worker['download_dir'] = download_dir
+    _worker['client'] = None
+    prediction = Prediction(filename= None, config= config)
+    model = prediction.get_model()
+    prediction.get_drift_baseline()
+    if threads is not None:
+        set_model_threads(model, threads)
+
+
+def _get_s3_client():
+    # boto3 clients are not shared with forked processes, every worker creates its own
+    if _worker['client'] is None:
+        import boto3
+
+        _worker['client'] = boto3.client('s3')
+    return _worker['client']
+
+
+def _score_file(input_path: str, output_path: str, drift_report_file: str) -> dict:
+    # a failed file is reported instead of raised, so the other files of the job are still scored
+    start = time.perf_counter()
+    local_path = input_path
+    summary = {'input_path': input_path, 'output_path': output_path, 'drift_report_file': drift_report_file}
+    try:
+        if input_path.startswith('s3://'):
+            from sensorFaultDetection.cloud_storage.s3_syncer import S3Sync
+
+            bucket, key = S3Sync.parse_bucket_url(input_path)
+            os.makedirs(_worker['download_dir'], exist_ok=True)
+            local_path = os.path.join(_worker['download_dir'], f'{os.getpid()}-{os.path.basename(key)}')
+            _get_s3_client().download_file(bucket, key, local_path)
+        summary['bytes_read'] = os.path.getsize(local_path)
+        prediction = Prediction(filename= local_path, config= _worker['config'])
+        summary.update(prediction.initiate_batch_prediction(output_path, drift_report_file))
+        summary.update(input_path= input_path, status= 'completed')
+    except Exception as e:
+        summary.update(status= 'failed', error= str(e))
+    finally:
+        if local_path != input_path and os.path.exists(local_path):
+            os.remove(local_path)
+    summary['seconds'] = round(time.perf_counter() - start, 6)
+    summary['rows_per_second'] = round(summary.get('rows', 0) / max(summary['seconds'], 1e-9), 1)
+    summary['worker'] = os.getpid()
+    return summary
+
+
+class BatchPrediction:
+    """
+    scores every csv, parquet and feather file of a directory or s3 prefix across a pool of processes
+
+    Every worker loads the model once and streams its files through `Prediction.initiate_batch_prediction`,
+    so the outputs are written in parallel, each worker holding one chunk of one file at a time. The files
+    are handed out largest first, which keeps the workers busy until the end of the job. The drift and
+    throughput of every file are collected into one report.
+    Args:
+        input_path (str): local directory or s3://bucket/prefix, subdirectories included
+        config (BatchPredictionConfig): batch prediction config
+    """
+    def __init__(self, input_path: str, config: BatchPredictionConfig):
+        self.input_path = str(input_path)
+        self.config = config
+
+    def list_input_files(self) -> list:
+        """
+        Returns:
+            list: (path or s3 url, path relative to the input, size in bytes) of every data file, largest first
+        """
+        try:
+            files = []
+            if self.input_path.startswith('s3://'):
+                from sensorFaultDetection.cloud_storage.s3_syncer import S3Sync
+
+                s3_sync = S3Sync(self.config.prediction.s3_sync)
+                bucket, prefix = s3_sync.parse_bucket_url(self.input_path)
+                for key, (size, _) in s3_sync.list_objects(bucket, prefix).items():
+                    if key.lower().endswith(DATA_FILE_FORMATS):
+                        files.append((f's3://{bucket}/{key}', key[len(prefix):].lstrip('/'), size))
+            else:
+                if not os.path.isdir(self.input_path):
+                    raise Exception(f'{self.input_path} is not a directory!')
+                for root, _, file_names in os.walk(self.input_path):
+                    for file_name in file_names:
+                        if file_name.lower().endswith(DATA_FILE_FORMATS):
+                            path = os.path.join(root, file_name)
+                            files.append((path, os.path.relpath(path, self.input_path), os.path.getsize(path)))
+
+            if len(files) == 0:
+                raise Exception(f'WARNING: there is no csv, parquet or feather file in {self.input_path}!')
+            return sorted(files, key= lambda item: (-item[2], item[1]))
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def get_output_path(self, output_dir: str, relative_path: str) -> str:
+        if self.config.output_format:
+            relative_path = f'{os.path.splitext(relative_path)[0]}.{self.config.output_format}'
+        if output_dir.startswith('s3://'):
+            return f'{output_dir.rstrip("/")}/{relative_path.replace(os.sep, "/")}'
+        return os.path.join(output_dir, relative_path)
+
+    def initiate_batch_prediction(self, output_dir: str=None) -> dict:
+        """
+        Args:
+            output_dir (str): optional, local directory or s3://bucket/prefix, `output_dir` of the config by default,
+                the predictions of a file keep its path relative to the input
+        Returns:
+            dict: report of the job, also written to `report_file`
+        """
+        try:
+            with measure('batch_prediction.initiate_batch_prediction') as metrics:
+                report = self.run_batch_prediction(str(output_dir or self.config.output_dir))
+                metrics.rows = report['rows']
+                metrics.bytes_read = report['bytes_read']
+            if report['failed_files'] > 0:
+                raise Exception(f'{report["failed_files"]} of {report["files"]} files could not be predicted, '
+                                f'check {self.config.report_file}')
+            return report
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def run_batch_prediction(self, output_dir: str) -> dict:
+        try:
+            files = self.list_input_files()
+            output_paths = [self.get_output_path(output_dir, relative_path) for _, relative_path, _ in files]
+            if len(set(output_paths)) < len(output_paths):
+                raise Exception('WARNING: input files with the same name and another format have the same output!')
+            # the extension is kept, so a.csv and a.parquet do not share one drift report
+            drift_report_files = [os.path.join(self.config.drift_report_dir, f'{relative_path}.yaml')
+                                  for _, relative_path, _ in files]
+            input_paths = [path for path, _, _ in files]
+
+            n_jobs = min(get_n_jobs(self.config.n_jobs), len(files))
+            logging.info(f'{len(files)} files of {self.input_path} are predicted by {n_jobs} processes!')
+            start = time.perf_counter()
+            if n_jobs == 1:
+                _init_worker(self.config.prediction, self.config.download_dir)
+                file_reports = list(map(_score_file, input_paths, output_paths, drift_report_files))
+            else:
+                with ProcessPoolExecutor(max_workers= n_jobs, initializer= _init_worker,
+                                         initargs= (self.config.prediction, self.config.download_dir,
+                                                    self.config.threads_per_worker)) as executor:
+                    file_reports = list(executor.map(_score_file, input_paths, output_paths, drift_report_files))
+            wall_seconds = time.perf_counter() - start
+
+            for file_report in file_reports:
+                if file_report['status'] == 'failed':
+                    logging.info(f'WARNING: {file_report["input_path"]} could not be predicted: {file_report["error"]}')
+            completed = [file_report for file_report in file_reports if file_report['status'] == 'completed']
+            rows = sum(file_report['rows'] for file_report in completed)
+            # number of files every drifted column drifted in, most frequent first
+            drifted_columns = Counter(column for file_report in completed for column in file_report['drifted_columns'])
+            report = {
+                'input_path': self.input_path,
+                'output_dir': output_dir,
+                'n_jobs': n_jobs,
+                'files': len(files),
+                'failed_files': len(files) - len(completed),
+                'rows': rows,
+                'bytes_read': sum(file_report.get('bytes_read', 0) for file_report in file_reports),
+                'wall_seconds': round(wall_seconds, 6),
+                'rows_per_second': round(rows / max(wall_seconds, 1e-9), 1),
+                'files_with_drift': sum(not file_report['drift_status'] for file_report in completed),
+                'drifted_columns': dict(drifted_columns.most_common()),
+                'file_reports': file_reports
+            }
+            write_yaml_file(path= self.config.report_file, content= report, replace= True)
+            logging.info(f'{rows} rows of {len(completed)} files are predicted in {wall_seconds:.1f}s, '
+                         f'{report["files_with_drift"]} files with data drift, check {self.config.report_file}!')
+            return report
+
+        except Exception as e:
+            raise CustomException(e, sys)
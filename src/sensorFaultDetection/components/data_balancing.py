@@ -0,0 +1,69 @@
+import sys
+import time
+import numpy as np
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.utils import get_n_jobs
+from sensorFaultDetection.entity.config_entity import DataBalancingConfig
+
+
+class DataBalancer:
+    """
+    handles the class imbalance of the train set with the strategy in params.yaml
+
+    scale_pos_weight: no resampling, the trainer weights the positive class by #negative / #positive
+    smote: minority oversampling, the neighbours are searched in parallel with n_jobs
+    smote_tomek: smote followed by removing Tomek links, the slowest as it searches neighbours over all rows
+    none: the train set is used as it is
+    """
+    STRATEGIES = ('scale_pos_weight', 'smote', 'smote_tomek', 'none')
+
+    def __init__(self, config: DataBalancingConfig):
+        if config.strategy not in self.STRATEGIES:
+            raise ValueError(f'Unknown data balancing strategy {config.strategy}, expected one of {self.STRATEGIES}')
+        self.config = config
+
+    @staticmethod
+    def count_classes(y: np.ndarray) -> dict:
+        classes, counts = np.unique(np.asarray(y), return_counts=True)
+        return {int(label): int(count) for label, count in zip(classes, counts)}
+
+    def get_smote(self) -> 'SMOTE':
+        # imblearn is only imported by the resampling strategies
+        from imblearn.over_sampling import SMOTE
+        from sklearn.neighbors import NearestNeighbors
+
+        # k + 1 neighbours as every sample is its own nearest neighbour
+        nearest_neighbors = NearestNeighbors(n_neighbors= self.config.k_neighbors + 1, n_jobs= get_n_jobs(self.config.n_jobs))
+        return SMOTE(sampling_strategy='minority', k_neighbors= nearest_neighbors, random_state= self.config.random_state)
+
+    def balance(self, X: np.ndarray, y: np.ndarray) -> tuple:
+        """
+        applies the strategy to the train set, the test set must not be resampled
+        Returns:
+            tuple: (features, labels, report with the runtime and class counts before and after)
+        """
+        try:
+            start = time.perf_counter()
+            if self.config.strategy == 'smote':
+                X_balanced, y_balanced = self.get_smote().fit_resample(X, y)
+            elif self.config.strategy == 'smote_tomek':
+                from imblearn.combine import SMOTETomek
+                from imblearn.under_sampling import TomekLinks
+                smote_tomek = SMOTETomek(smote= self.get_smote(), tomek= TomekLinks(n_jobs= get_n_jobs(self.config.n_jobs)),
+                                         random_state= self.config.random_state)
+                X_balanced, y_balanced = smote_tomek.fit_resample(X, y)
+            else:
+                X_balanced, y_balanced = X, y
+
+            balancing_report = {
+                'strategy': self.config.strategy,
+                'runtime_seconds': round(time.perf_counter() - start, 3),
+                'class_counts_before': self.count_classes(y),
+                'class_counts_after': self.count_classes(y_balanced)
+            }
+            logging.info(f'Data balancing with {self.config.strategy} is completed: {balancing_report}')
+            return X_balanced, y_balanced, balancing_report
+
+        except Exception as e:
+            raise CustomException(e, sys)
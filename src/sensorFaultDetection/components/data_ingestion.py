@@ -2,11 +2,9 @@ import os
 import numpy as np
 from pathlib import Path
 import pandas as pd
-from io import StringIO
 import boto3
-from sensorFaultDetection.utils import get_size
+from sensorFaultDetection.utils import get_size, read_dataframe, write_dataframe, iter_dataframe, DataFrameWriter
 from sensorFaultDetection.logger import logging
-from sklearn.model_selection import train_test_split
 from sensorFaultDetection.entity.config_entity import DataIngestionConfig
 
 class DataIngestion:
@@ -18,31 +16,76 @@ class DataIngestion:
                       )
 
 
+    def get_source_etag(self) -> str:
+        # the ETag changes whenever the S3 object is replaced, it is read without downloading the object
+        response = self.client.head_object(Bucket=self.config.s3_bucket, Key=self.config.object_key)
+        return response['ETag']
+
+    def get_etag_file(self) -> Path:
+        return f'{self.config.local_data_file}.etag'
+
+    def is_local_data_file_current(self) -> bool:
+        if not os.path.exists(self.config.local_data_file) or not os.path.exists(self.get_etag_file()):
+            return False
+        with open(self.get_etag_file(), 'r') as etag_file:
+            return etag_file.read().strip() == self.get_source_etag()
+
     def dowload_file(self):
-        if not os.path.exists(self.config.local_data_file):
+        if not self.is_local_data_file_current():
             csv_obj = self.client.get_object(Bucket=self.config.s3_bucket, Key=self.config.object_key)
             body = csv_obj['Body']
-            csv_string = body.read().decode('utf-8')
-            df = pd.read_csv(StringIO(csv_string))
-            
-            if "_id" in list(df):
-                df = df.drop('_id', axis=1)
-            df.replace({'na': np.nan}, inplace=True)
-            df.drop(columns= self.config.drop_columns, axis=1, inplace=True)
-
-            df.to_csv(self.config.local_data_file, index=False, header=True)
-            logging.info(f'{self.config.local_data_file} is downloaded!') 
-            self.df = df             
+            # parse the streaming body in bounded chunks instead of decoding the whole object,
+            # so memory does not grow with the size of the S3 object
+            chunks = pd.read_csv(body, chunksize=self.config.chunk_size, na_values=['na'], encoding='utf-8')
+
+            # write to a temporary file first so an interrupted download is not mistaken for a complete one
+            local_data_file = Path(self.config.local_data_file)
+            partial_file = local_data_file.with_suffix(f'.part{local_data_file.suffix}')
+            number_of_rows = 0
+            with DataFrameWriter(partial_file, self.config.schema_columns) as writer:
+                for df in chunks:
+                    if "_id" in list(df):
+                        df = df.drop(columns='_id')
+                    df.drop(columns= self.config.drop_columns, inplace=True)
+
+                    writer.write(df)
+                    number_of_rows += len(df)
+
+            body.close()
+            os.replace(partial_file, self.config.local_data_file)
+            with open(self.get_etag_file(), 'w') as etag_file:
+                # the ETag of the response belongs to exactly the content that was downloaded
+                etag_file.write(csv_obj['ETag'])
+            logging.info(f'{self.config.local_data_file} is downloaded with {number_of_rows} rows!')
 
         else:
             logging.info(f"File already exists of size : {get_size(Path(self.config.local_data_file))}")
 
+    def train_test_creation_in_chunks(self):
+        # every row goes to the test set with probability train_test_ratio, one chunk in memory at a time
+        target_feature  = 'class'
+        random_generator = np.random.default_rng()
+        with DataFrameWriter(self.config.train_data_file, self.config.schema_columns) as train_writer, \
+             DataFrameWriter(self.config.test_data_file, self.config.schema_columns) as test_writer:
+            for df in iter_dataframe(self.config.local_data_file, chunk_size=self.config.out_of_core.chunk_size):
+                df = df[[target_feature] + [column for column in df.columns if column != target_feature]]
+                is_test = random_generator.random(len(df)) < self.config.train_test_ratio
+                train_writer.write(df[~is_test])
+                test_writer.write(df[is_test])
+
+        logging.info(f'Train data is created and saved at {self.config.train_data_file}!')   
+        logging.info(f'Test data is created and saved at {self.config.test_data_file}!')
+
     def train_test_creation(self):
-        df = pd.read_csv(self.config.local_data_file)
+        if self.config.out_of_core.enabled:
+            return self.train_test_creation_in_chunks()
+
+        df = read_dataframe(self.config.local_data_file)
         target_feature  = 'class'
         y = df[target_feature]
         X = df.drop(target_feature, axis=1)
         
+        from sklearn.model_selection import train_test_split
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=self.config.train_test_ratio, shuffle=True)
         X_train[target_feature] = y_train
         X_test[target_feature] = y_test
@@ -54,7 +97,7 @@ class DataIngestion:
         X_train.insert(0, target_feature, first_column_train)
         X_test.insert(0, target_feature, first_column_test)
 
-        X_train.to_csv(self.config.train_data_file, index=False, header=True)
+        write_dataframe(X_train, self.config.train_data_file, self.config.schema_columns)
         logging.info(f'Train data is created and saved at {self.config.train_data_file}!')   
-        X_test.to_csv(self.config.test_data_file, index=False, header=True)
+        write_dataframe(X_test, self.config.test_data_file, self.config.schema_columns)
         logging.info(f'Test data is created and saved at {self.config.test_data_file}!')   
\ No newline at end of file
@@ -1,13 +1,17 @@
 import sys
 import pandas as pd
 import numpy as np
-from sensorFaultDetection.utils import save_pickle, save_numpy_array
+from pathlib import Path
+from sensorFaultDetection.utils import (save_pickle, save_numpy_array, read_dataframe, iter_dataframe,
+                                       get_columns, get_number_of_rows, write_yaml_file)
 from sensorFaultDetection.logger import logging
 from sklearn.preprocessing import RobustScaler
-from imblearn.combine import SMOTETomek
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.constants import FEATURE_DTYPE, LABEL_DTYPE
+from sensorFaultDetection.components.data_balancing import DataBalancer
+from sensorFaultDetection.instrumentation import measure
 from sensorFaultDetection.entity.config_entity import DataTransformationConfig
 
 
@@ -30,9 +34,9 @@ class DataTransformation:
         self.config = config       
 
     @staticmethod
-    def read_data(file_path) -> pd.DataFrame:
+    def read_data(file_path, columns: list=None) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe(file_path, columns=columns)
         except Exception as e:
             raise CustomException(e, sys)
     
@@ -51,7 +55,68 @@ class DataTransformation:
         except Exception as e:
             raise CustomException(e, sys)
     
+    def get_row_sample(self, file_path: Path) -> pd.DataFrame:
+        # uniform sample without replacement: the `sample_size` rows with the smallest random keys
+        random_generator = np.random.default_rng()
+        sample_size = self.config.out_of_core.sample_size
+        sample, keys = None, None
+        for df in iter_dataframe(file_path, chunk_size=self.config.out_of_core.chunk_size):
+            chunk_keys = random_generator.random(len(df))
+            sample = df if sample is None else pd.concat([sample, df], ignore_index=True)
+            keys = chunk_keys if keys is None else np.concatenate([keys, chunk_keys])
+            if len(sample) > sample_size:
+                keep = np.argpartition(keys, sample_size)[:sample_size]
+                sample, keys = sample.iloc[keep].reset_index(drop=True), keys[keep]
+        return sample
+
+    def transform_in_chunks(self, preprocessor_obj: Pipeline, file_path: Path, features_file: Path, labels_file: Path) -> None:
+        # the arrays are written through memory maps, so only one chunk is held in memory
+        number_of_rows = get_number_of_rows(file_path)
+        number_of_features = len(get_columns(file_path)) - 1
+        features = np.lib.format.open_memmap(features_file, mode='w+', dtype=FEATURE_DTYPE, shape=(number_of_rows, number_of_features))
+        labels = np.lib.format.open_memmap(labels_file, mode='w+', dtype=LABEL_DTYPE, shape=(number_of_rows,))
+
+        offset = 0
+        for df in iter_dataframe(file_path, chunk_size=self.config.out_of_core.chunk_size):
+            features[offset:offset + len(df)] = preprocessor_obj.transform(df.drop(columns=self.config.target_column))
+            labels[offset:offset + len(df)] = df[self.config.target_column].map(TargetValueMapping().to_dict()).to_numpy()
+            offset += len(df)
+
+        features.flush()
+        labels.flush()
+        del features, labels
+        logging.info(f'{number_of_rows} rows of {file_path} are transformed and saved at {features_file}!')
+
+    def initiate_data_transformation_in_chunks(self):
+        try:
+            # robust scaler quantiles are fitted on a uniform sample of the train set, which approximates them
+            # within O(1/sqrt(sample_size)) in rank. Resampling needs the whole train set in memory and is left out,
+            # the trainer weights the positive class instead unless the balancing strategy is none
+            sample = self.get_row_sample(self.config.train_data_file)
+            logging.info(f'Preprocessor is fitted on a sample of {len(sample)} rows of {self.config.train_data_file}!')
+            preprocessor_obj = self.get_data_transformer_object()
+            preprocessor_obj.fit(sample.drop(columns=self.config.target_column))
+            del sample
+
+            self.transform_in_chunks(preprocessor_obj, self.config.train_data_file,
+                                     self.config.train_features_file, self.config.train_labels_file)
+            self.transform_in_chunks(preprocessor_obj, self.config.test_data_file,
+                                     self.config.test_features_file, self.config.test_labels_file)
+            save_pickle(path= self.config.preprocessor_file, obj= preprocessor_obj)
+
+            labels = np.load(self.config.train_labels_file, mmap_mode='r')
+            class_counts = DataBalancer.count_classes(labels)
+            balancing_report = {'strategy': 'scale_pos_weight' if self.config.data_balancing.strategy != 'none' else 'none',
+                                'runtime_seconds': 0.0, 'class_counts_before': class_counts, 'class_counts_after': class_counts}
+            write_yaml_file(path= self.config.balancing_report_file, content= balancing_report, replace= True)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
     def initiate_data_transformation(self):
+        if self.config.out_of_core.enabled:
+            return self.initiate_data_transformation_in_chunks()
+
         try:
             train_df = self.read_data(self.config.train_data_file)
             logging.info(f"Train data is read from {self.config.train_data_file}!")
@@ -71,20 +136,25 @@ class DataTransformation:
             logging.info(f"Applying preprocessing object on both train and test dataframes")
             preprocessor_obj = self.get_data_transformer_object()
             
-            transformed_input_train_feature = preprocessor_obj.fit_transform(input_feature_train_df)       
-            transformed_input_test_feature = preprocessor_obj.transform(input_feature_test_df)                
-
-            smt = SMOTETomek(sampling_strategy='minority')  
-            logging.info(f"Applying data balancer object on both train and test data")         
-
-            input_feature_train_final, target_feature_train_final = smt.fit_resample(transformed_input_train_feature, target_feature_train_df)
-            input_feature_test_final, target_feature_test_final = smt.fit_resample(transformed_input_test_feature, target_feature_test_df)            
+            with measure('data_transformation.preprocess', rows= len(input_feature_train_df) + len(input_feature_test_df),
+                         columns= input_feature_train_df.shape[1]):
+                transformed_input_train_feature = preprocessor_obj.fit_transform(input_feature_train_df)       
+                transformed_input_test_feature = preprocessor_obj.transform(input_feature_test_df)                
 
-            train_arr = np.c_[input_feature_train_final, np.array(target_feature_train_final)]
-            test_arr = np.c_[input_feature_test_final, np.array(target_feature_test_final)]
+            # only the train set is balanced, the test set keeps the real class distribution for evaluation
+            data_balancer = DataBalancer(config= self.config.data_balancing)
+            with measure('data_transformation.balance', rows= len(transformed_input_train_feature),
+                         columns= transformed_input_train_feature.shape[1]):
+                input_feature_train_final, target_feature_train_final, balancing_report = data_balancer.balance(
+                    transformed_input_train_feature, target_feature_train_df.to_numpy())
+            write_yaml_file(path= self.config.balancing_report_file, content= balancing_report, replace= True)
+            input_feature_test_final, target_feature_test_final = transformed_input_test_feature, target_feature_test_df
 
-            save_numpy_array(path=self.config.train_npy_file, array=train_arr )
-            save_numpy_array(path=self.config.test_npy_file, array=test_arr)                            
+            # features and labels are saved separately with fixed dtypes, so training can map them without copies
+            save_numpy_array(path=self.config.train_features_file, array=np.asarray(input_feature_train_final, dtype=FEATURE_DTYPE))
+            save_numpy_array(path=self.config.train_labels_file, array=np.asarray(target_feature_train_final, dtype=LABEL_DTYPE))
+            save_numpy_array(path=self.config.test_features_file, array=np.asarray(input_feature_test_final, dtype=FEATURE_DTYPE))
+            save_numpy_array(path=self.config.test_labels_file, array=np.asarray(target_feature_test_final, dtype=LABEL_DTYPE))
             save_pickle(path= self.config.preprocessor_file, obj= preprocessor_obj)
         
         except Exception as e:
@@ -1,9 +1,12 @@
 import sys
+import shutil
 import pandas as pd
-from sensorFaultDetection.utils import write_yaml_file
-from scipy.stats import ks_2samp
+from pathlib import Path
+from sensorFaultDetection.utils import write_yaml_file, read_dataframe, write_dataframe, get_columns
 from sensorFaultDetection.exception import CustomException
 from sensorFaultDetection.logger import logging
+from sensorFaultDetection.drift import detect_dataset_drift, BaselineSketch
+from sensorFaultDetection.instrumentation import measure
 from sensorFaultDetection.entity.config_entity import DataValidationConfig
 
 class DataValidation:
@@ -43,43 +46,73 @@ class DataValidation:
         pass  
 
     @staticmethod
-    def detect_dataset_drift(base_dataframe: pd.DataFrame, current_datafrme: pd.DataFrame, threshold: float):
+    def detect_dataset_drift(base_dataframe: pd.DataFrame, current_datafrme: pd.DataFrame, threshold: float, n_jobs: int=1):
         try:
-            status = True
-            report ={}
-            for column in base_dataframe.columns:
-                df1 = base_dataframe[column]
-                df2 = current_datafrme[column]
-                is_same_dist = ks_2samp(df1, df2)
-                if is_same_dist.pvalue >= threshold:
-                    is_found = False
-                else:
-                    is_found = True
-                    status = False
-                
-                report.update({column:{
-                    'p_value': float(is_same_dist.pvalue),
-                    'drift_status': is_found
-                            }})
-            return status, report
+            # all columns are tested in one pass by the shared drift engine, split across n_jobs processes
+            return detect_dataset_drift(base_dataframe, current_datafrme, threshold, n_jobs=n_jobs)
         except Exception as e:
             raise CustomException(e, sys)
     
     @staticmethod
-    def read_data(file_path) -> pd.DataFrame:
+    def read_data(file_path, columns: list=None) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe(file_path, columns=columns)
         except Exception as e:
             raise CustomException(e, sys)
 
     
+    def detect_dataset_drift_by_column_blocks(self) -> tuple:
+        """
+        drift check and drift baseline with only `column_block_size` columns of both sets in memory
+        Returns:
+            tuple: (True if no column drifted, drift report, baseline sketch of the numerical columns)
+        """
+        try:
+            block_size = self.config.out_of_core.column_block_size
+            columns = get_columns(self.config.train_data_file)
+            numerical_columns = set(self.config.schema_numerical_columns)
+
+            drift_report = {}
+            sketches = []
+            for start in range(0, len(columns), block_size):
+                block = columns[start:start + block_size]
+                train_block = self.read_data(self.config.train_data_file, columns=block)
+                test_block = self.read_data(self.config.test_data_file, columns=block)
+                _, block_report = self.detect_dataset_drift(train_block, test_block, self.config.pvalue_threshold,
+                                                            n_jobs= self.config.drift_n_jobs)
+                drift_report.update(block_report)
+
+                numerical_block = [column for column in block if column in numerical_columns]
+                if len(numerical_block) > 0:
+                    sketches.append(BaselineSketch.from_dataframe(train_block[numerical_block],
+                                                                  number_of_quantiles= self.config.drift_baseline_quantiles))
+                logging.info(f'Drift of columns {start} to {start + len(block)} of {len(columns)} is checked!')
+
+            status = not any(column_report['drift_status'] for column_report in drift_report.values())
+            return status, drift_report, BaselineSketch.concat(sketches)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save_data(self, dataframe: pd.DataFrame, source_file: Path, path: Path) -> None:
+        # out of core the checked file is copied as it is instead of being written from memory
+        if self.config.out_of_core.enabled:
+            shutil.copyfile(source_file, path)
+        else:
+            write_dataframe(dataframe, path, self.config.schema_columns)
+
     def initiate_data_validation(self):
         error_message = ""
 
-        train_dataframe = self.read_data(self.config.train_data_file)
-        logging.info(f"Train data is read from {self.config.train_data_file}!") 
-        test_dataframe = self.read_data(self.config.test_data_file)
-        logging.info(f"Test data is read from {self.config.test_data_file}!") 
+        if self.config.out_of_core.enabled:
+            # the column checks only need the header, rows are read in column blocks by the drift check
+            train_dataframe = pd.DataFrame(columns= get_columns(self.config.train_data_file))
+            test_dataframe = pd.DataFrame(columns= get_columns(self.config.test_data_file))
+        else:
+            train_dataframe = self.read_data(self.config.train_data_file)
+            logging.info(f"Train data is read from {self.config.train_data_file}!") 
+            test_dataframe = self.read_data(self.config.test_data_file)
+            logging.info(f"Test data is read from {self.config.test_data_file}!") 
 
         status= self.validate_number_of_columns(dataframe= train_dataframe)        
         if not status:
@@ -112,6 +145,7 @@ class DataValidation:
         # Data drift at prediction stage:
         # NOT possible to detect data drift immediately as it is NOT possible to summerize one record
         # Solution: Saving each request in database and then fetching all request by hour or day 
+        # (done by OnlineDriftMonitor of the app on windows of the requests against the drift baseline)
         # Base dataset: Train
         # To compare with: Collected data, batch data
         # If huge differnce, go for retraining
@@ -125,19 +159,32 @@ class DataValidation:
         # Solution: Retrain the model
         #############################################################################################
 
-        status, drift_report = self.detect_dataset_drift(train_dataframe, test_dataframe, self.config.pvalue_threshold)
+        with measure('data_validation.drift_check', columns= train_dataframe.shape[1]) as metrics:
+            if self.config.out_of_core.enabled:
+                status, drift_report, baseline = self.detect_dataset_drift_by_column_blocks()
+            else:
+                metrics.rows = len(train_dataframe) + len(test_dataframe)
+                status, drift_report = self.detect_dataset_drift(train_dataframe, test_dataframe, self.config.pvalue_threshold,
+                                                                 n_jobs= self.config.drift_n_jobs)
+            # compact baseline for prediction time drift checks, so the train set is not read again there
+            baseline = BaselineSketch.from_dataframe(train_dataframe[self.config.schema_numerical_columns],
+                                                     number_of_quantiles= self.config.drift_baseline_quantiles)
+
         if status:   
             logging.info('NO data drift issue!')         
-            train_dataframe.to_csv(self.config.valid_train_file, index=False, header=True)
-            test_dataframe.to_csv(self.config.valid_test_file, index=False, header=True)
+            self.save_data(train_dataframe, self.config.train_data_file, self.config.valid_train_file)
+            self.save_data(test_dataframe, self.config.test_data_file, self.config.valid_test_file)
             logging.info(f'Train set is saved at {self.config.valid_train_file}!') 
             logging.info(f'Test set is saved at {self.config.valid_test_file}!')   
         else:
             logging.info('WARNING: We faced data drift issue, check report.yaml!')
-            train_dataframe.to_csv(self.config.invalid_train_file, index=False, header=True)
-            test_dataframe.to_csv(self.config.invalid_test_file, index=False, header=True)
+            self.save_data(train_dataframe, self.config.train_data_file, self.config.invalid_train_file)
+            self.save_data(test_dataframe, self.config.test_data_file, self.config.invalid_test_file)
             logging.info(f'Train set is saved at {self.config.invalid_train_file}!') 
             logging.info(f'Test set is saved at {self.config.invalid_test_file}!') 
 
 
-        write_yaml_file(path= self.config.drift_report_file, content= drift_report, replace= True)
\ No newline at end of file
+        write_yaml_file(path= self.config.drift_report_file, content= drift_report, replace= True)
+
+        baseline.save(self.config.drift_baseline_file)
+        logging.info(f'Drift baseline is saved at {self.config.drift_baseline_file}!')
\ No newline at end of file
@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from xgboost import XGBClassifier
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.utils import get_n_jobs
+from sensorFaultDetection.entity.config_entity import HyperParameterTuningConfig
+
+
+class HyperParameterTuner:
+    """
+    successive halving search over xgboost parameters within a cpu time budget
+
+    `number_of_trials` candidates are sampled from `search_space` and trained with
+    `min_estimators` boosting rounds. The best 1/`reduction_factor` of them are promoted
+    to the next rung with `reduction_factor` times more rounds, until one candidate is left
+    or `max_estimators` is reached. Every trial stops early on a validation split of the
+    train set and is scored by its weighted f1-score there. Trials run in threads, xgboost
+    releases the GIL while boosting, each trial with `threads_per_trial` of the `n_jobs` cores.
+    The cpu time of a trial is counted as wall time x threads; once the trials used
+    `cpu_hours_budget`, no new trial is started and the best trial so far is returned.
+    """
+    def __init__(self, config: HyperParameterTuningConfig):
+        self.config = config
+        self.random_state = np.random.RandomState(config.random_state)
+        self.cpu_seconds_used = 0.0
+        self.lock = threading.Lock()
+        self.trials = []
+        self.threads_per_trial = min(config.threads_per_trial, get_n_jobs(config.n_jobs))
+
+    def get_number_of_workers(self) -> int:
+        return max(get_n_jobs(self.config.n_jobs) // self.threads_per_trial, 1)
+
+    def is_budget_exhausted(self) -> bool:
+        return self.cpu_seconds_used >= self.config.cpu_hours_budget * 3600
+
+    def sample_parameters(self) -> dict:
+        parameters = {}
+        for name, (low, high) in self.config.search_space.items():
+            if name in self.config.log_scale:
+                value = float(np.exp(self.random_state.uniform(np.log(low), np.log(high))))
+            elif isinstance(low, int) and isinstance(high, int):
+                value = int(self.random_state.randint(low, high + 1))
+            else:
+                value = float(self.random_state.uniform(low, high))
+            parameters[name] = value
+        return parameters
+
+    def run_trial(self, trial_id: int, rung: int, n_estimators: int, parameters: dict, fixed_parameters: dict,
+                  X_train: np.ndarray, y_train: np.ndarray, X_valid: np.ndarray, y_valid: np.ndarray) -> dict:
+        trial = {'trial_id': trial_id, 'rung': rung, 'n_estimators': n_estimators, **parameters,
+                 'best_iteration': None, 'f1_score': None, 'logloss': None,
+                 'wall_seconds': None, 'cpu_seconds': None, 'status': 'skipped'}
+        if self.is_budget_exhausted():
+            return trial
+
+        start = time.perf_counter()
+        try:
+            model = XGBClassifier(n_estimators= n_estimators, n_jobs= self.threads_per_trial,
+                                  eval_metric= 'logloss', early_stopping_rounds= self.config.early_stopping_rounds,
+                                  random_state= self.config.random_state, **fixed_parameters, **parameters)
+            model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+            trial.update(best_iteration= int(model.best_iteration),
+                         f1_score= float(f1_score(y_valid, model.predict(X_valid), average='weighted')),
+                         logloss= float(model.best_score), status= 'completed')
+        except Exception as e:
+            trial.update(status= f'failed: {e}')
+
+        wall_seconds = time.perf_counter() - start
+        trial.update(wall_seconds= round(wall_seconds, 3), cpu_seconds= round(wall_seconds * self.threads_per_trial, 3))
+        with self.lock:
+            self.cpu_seconds_used += trial['cpu_seconds']
+        return trial
+
+    def write_trial_log(self, path: Path) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pd.DataFrame(self.trials).to_csv(path, index=False)
+
+    def search(self, X: np.ndarray, y: np.ndarray, trial_log_file: Path=None, fixed_parameters: dict=None) -> dict:
+        """
+        runs successive halving on the train set
+        Args:
+            X (np.ndarray): train features
+            y (np.ndarray): train labels
+            trial_log_file (Path): optional, csv with parameters, timing and score of every trial
+            fixed_parameters (dict): optional, xgboost parameters shared by all trials e.g. tree_method
+        Returns:
+            dict: xgboost parameters of the best trial, n_estimators is its best iteration + 1
+        """
+        try:
+            X_train, X_valid, y_train, y_valid = train_test_split(
+                X, y, test_size= self.config.validation_ratio, stratify= y, random_state= self.config.random_state)
+
+            candidates = [(trial_id, self.sample_parameters()) for trial_id in range(self.config.number_of_trials)]
+            n_estimators = self.config.min_estimators
+            rung = 0
+            best_trial = None
+            logging.info(f'Hyper parameter tuning started with {len(candidates)} trials on {self.get_number_of_workers()} workers!')
+
+            with ThreadPoolExecutor(max_workers= self.get_number_of_workers()) as executor:
+                while len(candidates) > 0 and not self.is_budget_exhausted():
+                    rung_trials = list(executor.map(
+                        lambda candidate: self.run_trial(candidate[0], rung, n_estimators, candidate[1], fixed_parameters or {},
+                                                         X_train, y_train, X_valid, y_valid),
+                        candidates))
+                    self.trials.extend(rung_trials)
+
+                    completed = [trial for trial in rung_trials if trial['status'] == 'completed']
+                    completed.sort(key= lambda trial: (-trial['f1_score'], trial['logloss']))
+                    if len(completed) > 0:
+                        # trials of a later rung are trained longer and replace the best of earlier rungs
+                        best_trial = completed[0]
+                    logging.info(f'Rung {rung} with {n_estimators} rounds: {len(completed)} of {len(rung_trials)} trials completed, '
+                                 f'{self.cpu_seconds_used / 3600:.3f} cpu hours used!')
+
+                    if len(completed) <= 1 or n_estimators >= self.config.max_estimators:
+                        break
+                    number_of_promoted = max(len(completed) // self.config.reduction_factor, 1)
+                    parameters = dict(candidates)
+                    candidates = [(trial['trial_id'], parameters[trial['trial_id']]) for trial in completed[:number_of_promoted]]
+                    n_estimators = min(n_estimators * self.config.reduction_factor, self.config.max_estimators)
+                    rung += 1
+
+            if trial_log_file is not None:
+                self.write_trial_log(trial_log_file)
+                logging.info(f'Hyper parameter tuning trials are saved at {trial_log_file}!')
+
+            if best_trial is None:
+                raise Exception('No hyper parameter tuning trial completed within the cpu budget!')
+
+            best_parameters = {name: best_trial[name] for name in self.config.search_space}
+            best_parameters['n_estimators'] = best_trial['best_iteration'] + 1
+            logging.info(f'Best trial {best_trial["trial_id"]} with f1-score {best_trial["f1_score"]:.4f}: {best_parameters}')
+            return best_parameters
+
+        except Exception as e:
+            raise CustomException(e, sys)
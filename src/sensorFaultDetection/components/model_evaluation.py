@@ -4,10 +4,12 @@ import datetime
 import sys
 import numpy as np
 import pandas as pd
-import shutil
 from sensorFaultDetection. logger import logging
 from sensorFaultDetection.exception import CustomException
-from sensorFaultDetection.utils import load_pickle, save_pickle, classifier_performance_report, write_yaml_file
+from sensorFaultDetection.utils import classifier_performance_report, write_yaml_file, read_dataframe, iter_dataframe
+from sensorFaultDetection.model_registry import ModelRegistry
+from sensorFaultDetection.compiled_model import get_model_path, load_sensor_model, export_model
+from sensorFaultDetection.instrumentation import measure
 from sensorFaultDetection.entity.config_entity import ModelEvaluationConfig
 
 
@@ -26,9 +28,10 @@ class TargetValueMapping:
 
 
 class ModelResolver:
-    def __init__(self, trained_model_dir, best_model_dir):
+    def __init__(self, trained_model_dir, best_model_dir, model_registry: ModelRegistry=None):
         self.trained_model_dir = trained_model_dir
         self.best_model_dir = best_model_dir
+        self.model_registry = model_registry
 
     @staticmethod
     def is_dir_empty(path):       
@@ -64,33 +67,45 @@ class ModelResolver:
 
 
     def get_latest_model_path(self, model_dir) -> str:
-        try:            
+        """
+        the latest trained model for the trained model dir, the best model for the best model dir
+        Returns:
+            str: path to the model bundle or model.pkl, None if there is no model
+        """
+        try:
+            if self.model_registry is not None:
+                pointer_name = ModelRegistry.LATEST if model_dir == self.trained_model_dir else ModelRegistry.BEST
+                pointer = self.model_registry.get_pointer(pointer_name)
+                if pointer is not None:
+                    return pointer['model_path']
+
+            # models saved before the registry existed are found by their timestamp directories
+            if not os.path.isdir(model_dir):
+                return None
             timestamps = self.only_directory_names(model_dir)            
+            if len(timestamps) == 0:
+                return None
             sorted_timestamps = self.sort_dates(timestamps)                             
             latest_timestamps = sorted_timestamps[-1]
-            latest_model_path = os.path.join(model_dir, latest_timestamps, 'model.pkl')            
-            return latest_model_path
+            return get_model_path(os.path.join(model_dir, latest_timestamps))
         except Exception as e:
             raise CustomException(e, sys)
         
     def is_model_exists(self) -> bool:
         try:
-            if self.is_dir_empty(self.trained_model_dir) is False:                              
-                return False
-            
             latest_model_path = self.get_latest_model_path(self.trained_model_dir)           
-            if not os.path.exists(latest_model_path):                
+            if latest_model_path is None or not os.path.exists(latest_model_path):                
                 return False
             
-            if self.is_dir_empty(self.best_model_dir) is False:                
-                timestamps = os.listdir(self.trained_model_dir)
-                sorted_timestamps = self.sort_dates(timestamps)            
-                latest_timestamps = sorted_timestamps[-1]
-                source_file = os.path.join(self.trained_model_dir, latest_timestamps, 'model.pkl')
-                destination_file = os.path.join(self.best_model_dir, latest_timestamps)
-                os.makedirs(destination_file, exist_ok= True)
-                shutil.copy (source_file, destination_file) 
-                logging.info(f'There was no best model. Hence, a new best model saved to {destination_file}!')           
+            if self.get_latest_model_path(self.best_model_dir) is None:                
+                model_id = os.path.basename(os.path.dirname(latest_model_path))
+                if self.model_registry is not None:
+                    # the best pointer references the trained model, it is not copied
+                    self.model_registry.set_pointer(ModelRegistry.BEST, model_id, latest_model_path)
+                    logging.info(f'There was no best model. Hence, the latest model {model_id} is the best model!')
+                else:
+                    destination_file = export_model(latest_model_path, os.path.join(self.best_model_dir, model_id))
+                    logging.info(f'There was no best model. Hence, a new best model saved to {destination_file}!')           
             
             best_model_path = self.get_latest_model_path(self.best_model_dir)            
             if not os.path.exists(best_model_path):                              
@@ -99,7 +114,46 @@ class ModelResolver:
             return True
         
         except Exception as e:
-            CustomException(e, sys)
+            raise CustomException(e, sys)
+
+
+class ModelComparison:
+    """
+    predicts several SensorModels on the same data in one pass
+
+    Models are grouped by the fingerprint of their preprocessor, the sha256 of the pickled
+    fitted object or of the arrays of a model bundle, so every batch of rows is transformed once per distinct preprocessor and
+    then predicted by each model of the group. Comparing N models trained on the same data
+    transformation costs one preprocessing pass plus N inference passes.
+    """
+    def __init__(self, models: list, batch_size: int):
+        self.models = models
+        self.batch_size = batch_size
+        self.groups = dict()
+        for index, model in enumerate(models):
+            self.groups.setdefault(model.get_preprocessor_fingerprint(), []).append(index)
+        logging.info(f'{len(models)} models share {len(self.groups)} distinct preprocessors!')
+
+    def predict(self, input_feature_df: pd.DataFrame) -> list:
+        """
+        Args:
+            input_feature_df (pd.DataFrame): input features, predicted in batches of batch_size rows
+        Returns:
+            list: predictions of every model, in the order of the models
+        """
+        try:
+            y_preds = [[] for _ in self.models]
+            for start in range(0, len(input_feature_df), self.batch_size):
+                batch = input_feature_df.iloc[start: start + self.batch_size]
+                for indices in self.groups.values():
+                    with measure('model_evaluation.transform', rows= len(batch), columns= batch.shape[1]):
+                        transformed_feature = self.models[indices[0]].transform(batch)
+                    for index in indices:
+                        with measure('model_evaluation.predict', rows= len(batch), columns= batch.shape[1]):
+                            y_preds[index].append(self.models[index].predict_transformed(transformed_feature))
+            return [np.concatenate(y_pred) if len(y_pred) > 0 else np.array([], dtype=int) for y_pred in y_preds]
+        except Exception as e:
+            raise CustomException(e, sys)
 
             
 class ModelEvaluation:
@@ -109,40 +163,58 @@ class ModelEvaluation:
         self.config = config
 
     @staticmethod
-    def read_data(file_path) -> pd.DataFrame:
+    def read_data(file_path, columns: list=None) -> pd.DataFrame:
         try:
-            return pd.read_csv(file_path)
+            return read_dataframe(file_path, columns=columns)
         except Exception as e:
             raise CustomException(e, sys)
     
+    def predict_in_chunks(self, model_comparison: ModelComparison) -> tuple:
+        # out of core the valid train and test sets are read and predicted chunk by chunk
+        y_true = []
+        y_preds = [[] for _ in model_comparison.models]
+        for file_path in (self.config.valid_train_file, self.config.valid_test_file):
+            for df in iter_dataframe(file_path, chunk_size=self.config.out_of_core.chunk_size):
+                y_true.append(df[self.config.target_column].map(TargetValueMapping().to_dict()).to_numpy())
+                input_feature_df = df.drop(columns=self.config.target_column)
+                for y_pred, chunk_pred in zip(y_preds, model_comparison.predict(input_feature_df)):
+                    y_pred.append(chunk_pred)
+            logging.info(f"Data of {file_path} is predicted in chunks!")
+        return np.concatenate(y_true), [np.concatenate(y_pred) for y_pred in y_preds]
+
     def initiate_model_evaluation(self) -> None:
         try:
-            # valid train and test file dataframes
-            train_dataframe = self.read_data(self.config.valid_train_file)
-            logging.info(f"Train data is read from {self.config.valid_train_file}!")
-            test_dataframe = self.read_data(self.config.valid_test_file)
-            logging.info(f"Test data is read from {self.config.valid_test_file}!")
-
-            # calculate model performance on whole dataframe
-            df = pd.concat([train_dataframe, test_dataframe])
-            input_feature_df = df.drop(columns=self.config.target_column, axis=1)
-            target_feature_df = df[self.config.target_column]
-            target_feature_df = target_feature_df.replace(TargetValueMapping().to_dict())
-
             # loading_trained model
-            model_resolver = ModelResolver(self.config.trained_model_path, self.config.root_dir)
+            model_registry = ModelRegistry(self.config.model_registry_file)
+            model_resolver = ModelResolver(self.config.trained_model_path, self.config.root_dir, model_registry)
             status = model_resolver.is_model_exists()
             if not status:
                 return logging.info("WARNING: There is no trained model path available!")                
           
             latest_model_path = model_resolver.get_latest_model_path(self.config.trained_model_path)            
-            latest_model = load_pickle(latest_model_path)           
+            latest_model = load_sensor_model(latest_model_path)
             best_model_path = model_resolver.get_latest_model_path(self.config.root_dir)            
-            best_model = load_pickle(best_model_path)
+            best_model = load_sensor_model(best_model_path)
+
+            # both models are predicted in one pass, the shared preprocessing runs once per batch
+            model_comparison = ModelComparison([best_model, latest_model], self.config.batch_size)
+            if self.config.out_of_core.enabled:
+                y_true, (y_best_pred, y_latest_pred) = self.predict_in_chunks(model_comparison)
+            else:
+                # valid train and test file dataframes
+                train_dataframe = self.read_data(self.config.valid_train_file)
+                logging.info(f"Train data is read from {self.config.valid_train_file}!")
+                test_dataframe = self.read_data(self.config.valid_test_file)
+                logging.info(f"Test data is read from {self.config.valid_test_file}!")
+
+                # calculate model performance on whole dataframe
+                df = pd.concat([train_dataframe, test_dataframe])
+                input_feature_df = df.drop(columns=self.config.target_column, axis=1)
+                target_feature_df = df[self.config.target_column]
+                target_feature_df = target_feature_df.replace(TargetValueMapping().to_dict())
 
-            y_true = np.array(target_feature_df)
-            y_best_pred = best_model.predict(input_feature_df)
-            y_latest_pred = latest_model.predict(input_feature_df)
+                y_true = np.array(target_feature_df)
+                y_best_pred, y_latest_pred = model_comparison.predict(input_feature_df)
             labels = ["Negative", "Positive"]
             
             best_metric_table= classifier_performance_report(
@@ -167,23 +239,20 @@ class ModelEvaluation:
             if improved_accuracy > self.config.model_evaluation_changed_threshold:  
                 ModelEvaluation.is_model_accepted = True              
                 logging.info(f"Latest model performs better than the old version!")                
-                best_metric_table= classifier_performance_report(
-                    y_true= y_true,
-                    y_pred= y_best_pred, 
-                    path= os.path.join(os.path.dirname(best_model_path, 'performance_metrics.csv')),
-                    classes=labels
-                )
-
-
-                new_best_model_path = os.path.join(os.path.dirname(best_model_path, 'model.pkl'))
-                # save the best model in both artifacts and save_model folders
-                save_pickle(path= new_best_model_path, obj= latest_model)
-                save_pickle(path= self.config.saved_model_path, obj= latest_model)
+                latest_model_id = os.path.basename(os.path.dirname(latest_model_path))
+                evaluation_dir = os.path.join(self.config.root_dir, latest_model_id)
+                os.makedirs(evaluation_dir, exist_ok=True)
+                latest_metric_table.to_csv(os.path.join(evaluation_dir, 'performance_metrics.csv'), index=True, header=True)
+                # the saved model folder is uploaded to s3, it gets the only copy of the model
+                export_model(latest_model_path, self.config.saved_model_dir)
+                # the best pointer references the trained model by its id, a running prediction server loads it on its next request
+                model_registry.set_pointer(ModelRegistry.BEST, latest_model_id, latest_model_path,
+                                           metrics= {'evaluation_f1_score': float(latest_metric_table['f1-score'].values[-1])})
                 logging.info(f"Best model is replaced by a new vesion!") 
 
             else:                
-                if not os.path.exists(self.config.saved_model_path):
-                    save_pickle(path= self.config.saved_model_path, obj= best_model)
+                if not os.path.exists(get_model_path(self.config.saved_model_dir)):
+                    export_model(best_model_path, self.config.saved_model_dir)
                 logging.info(f"Latest model does not perform better than the old version!")                
 
             evaluation_report = dict()
@@ -1,13 +1,24 @@
 import os
+import time
 import datetime
+import tempfile
+import pickle
+import hashlib
 import sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import xgboost
 from sensorFaultDetection. logger import logging
 from sensorFaultDetection.exception import CustomException
-from sensorFaultDetection.utils import load_numpy_array, confusion_matrix_display, classifier_performance_report, save_pickle, load_pickle
+from sensorFaultDetection.utils import (load_numpy_array, confusion_matrix_display, classifier_performance_report,
+                                       save_pickle, load_pickle, write_yaml_file, get_n_jobs, get_file_hash)
 from sklearn.pipeline import Pipeline
 from xgboost import XGBClassifier
+from sensorFaultDetection.components.hyper_parameter_tuning import HyperParameterTuner
+from sensorFaultDetection.model_registry import ModelRegistry
+from sensorFaultDetection.compiled_model import CompiledSensorModel, MODEL_BUNDLE_DIR_NAME, PICKLE_FILE_NAME
+from sensorFaultDetection.instrumentation import measure
 from sensorFaultDetection.entity.config_entity import ModelTrainerConfig
 
 
@@ -21,16 +32,28 @@ class SensorModel:
         logging.info("Entered predict method of SensorTruckModel class")
 
         try:
-            logging.info("Used preprocessor object to transform data!")
+            with measure('sensor_model.predict', rows= len(dataframe), columns= dataframe.shape[1]):
+                logging.info("Used preprocessor object to transform data!")
 
-            transformed_feature = self.preprocessing_object.transform(dataframe)
+                transformed_feature = self.preprocessing_object.transform(dataframe)
 
-            logging.info("Used the trained model to get predictions!")
+                logging.info("Used the trained model to get predictions!")
 
-            return self.trained_model_object.predict(transformed_feature)
+                return self.trained_model_object.predict(transformed_feature)
 
         except Exception as e:
-            raise CustomException(e, sys) 
+            raise CustomException(e, sys)
+
+    # transform and predict_transformed split predict like CompiledSensorModel does, for models sharing a preprocessor
+    def transform(self, dataframe: pd.DataFrame) -> np.ndarray:
+        return self.preprocessing_object.transform(dataframe)
+
+    def predict_transformed(self, X: np.ndarray) -> np.ndarray:
+        return self.trained_model_object.predict(X)
+
+    def get_preprocessor_fingerprint(self) -> str:
+        # sha256 of the pickled fitted preprocessor
+        return hashlib.sha256(pickle.dumps(self.preprocessing_object, protocol=4)).hexdigest()
 
     def __repr__(self):
         return f"{type(self.trained_model_object).__name__}()"
@@ -39,22 +62,206 @@ class SensorModel:
         return f"{type(self.trained_model_object).__name__}()"
 
 
+class ArrayChunkIterator(xgboost.DataIter):
+    """
+    passes row chunks of (memory-mapped) feature and label arrays to xgboost,
+    which builds its external memory cache from them at `cache_prefix`
+    """
+    def __init__(self, X: np.ndarray, y: np.ndarray, chunk_size: int, cache_prefix: str):
+        self.X = X
+        self.y = y
+        self.chunk_size = chunk_size
+        self.offset = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data) -> int:
+        if self.offset >= len(self.X):
+            return 0
+        stop = self.offset + self.chunk_size
+        input_data(data=np.asarray(self.X[self.offset:stop]), label=np.asarray(self.y[self.offset:stop]))
+        self.offset = stop
+        return 1
+
+    def reset(self) -> None:
+        self.offset = 0
+
+
+class BoosterClassifier:
+    """
+    binary classifier around a booster trained with the native xgboost api, predicts like XGBClassifier
+    """
+    def __init__(self, booster: xgboost.Booster, best_iteration: int):
+        self.booster = booster
+        self.best_iteration = best_iteration
+
+    def predict(self, X) -> np.ndarray:
+        probabilities = self.booster.inplace_predict(X, iteration_range=(0, self.best_iteration + 1))
+        return (probabilities > 0.5).astype(int)
+
+
 class ModelTrainer:
     def __init__(self, config: ModelTrainerConfig):
         self.config = config
 
-    def perform_hyper_parameter_tuning(self):
-        pass
+    def get_model_parameters(self) -> dict:
+        # xgboost parameters of the training profile in params.yaml
+        profile = self.config.training_profile
+        return {
+            'tree_method': profile.tree_method,
+            'n_jobs': get_n_jobs(profile.n_jobs),
+            'max_bin': profile.max_bin,
+            'n_estimators': profile.n_estimators,
+            'early_stopping_rounds': profile.early_stopping_rounds,
+            'eval_metric': profile.eval_metric
+        }
+
+    def is_positive_class_weighted(self) -> bool:
+        # out of core the train set is never resampled, so every strategy but none weights the positive class
+        strategy = self.config.data_balancing.strategy
+        return strategy == 'scale_pos_weight' or (self.config.out_of_core.enabled and strategy != 'none')
+
+    @staticmethod
+    def get_scale_pos_weight(y: np.ndarray) -> float:
+        # weights the positive class like resampling to equal class counts would
+        number_of_positives = int(np.count_nonzero(y))
+        return (len(y) - number_of_positives) / max(number_of_positives, 1)
+
+    def get_row_sample(self, X: np.ndarray, y: np.ndarray) -> tuple:
+        # uniform sample of `sample_size` rows, only the sampled rows of the memory-mapped arrays are read
+        if len(X) <= self.config.out_of_core.sample_size:
+            return X, y
+        random_generator = np.random.default_rng(self.config.hyper_parameter_tuning.random_state)
+        index = np.sort(random_generator.choice(len(X), size=self.config.out_of_core.sample_size, replace=False))
+        return X[index], y[index]
+
+    def predict(self, model, X: np.ndarray) -> np.ndarray:
+        # out of core the predictions are made chunk by chunk
+        if not self.config.out_of_core.enabled:
+            return model.predict(X)
+        chunk_size = self.config.out_of_core.chunk_size
+        return np.concatenate([model.predict(np.asarray(X[start:start + chunk_size])) for start in range(0, len(X), chunk_size)])
+
+    def perform_hyper_parameter_tuning(self, X_train, y_train, trial_log_file: Path=None) -> dict:
+        try:
+            if not self.config.hyper_parameter_tuning.enabled:
+                return {}
+            tuner = HyperParameterTuner(config= self.config.hyper_parameter_tuning)
+            # trials build their trees like the final model
+            fixed_parameters = {'tree_method': self.config.training_profile.tree_method,
+                                'max_bin': self.config.training_profile.max_bin}
+            if self.config.out_of_core.enabled:
+                # trials are trained on a sample of the train set
+                X_train, y_train = self.get_row_sample(X_train, y_train)
+            if self.is_positive_class_weighted():
+                fixed_parameters['scale_pos_weight'] = self.get_scale_pos_weight(y_train)
+            return tuner.search(X_train, y_train, trial_log_file= trial_log_file, fixed_parameters= fixed_parameters)
+
+        except Exception as e:
+            raise CustomException(e, sys)
     
-    def train_model(self, X_train, y_train):
+    def train_model(self, X_train, y_train, X_test, y_test, parameters: dict=None) -> tuple:
+        """
+        fits the training profile, with tuned parameters on top, and stops early on the test set
+        Returns:
+            tuple: (model, training report with the parameters, rounds used and fit time)
+        """
         try:
-            xgb_classifier = XGBClassifier()
-            xgb_classifier.fit(X_train, y_train)
-            return xgb_classifier
+            model_parameters = self.get_model_parameters()
+            model_parameters.update(parameters or {})
+            if self.is_positive_class_weighted():
+                model_parameters['scale_pos_weight'] = self.get_scale_pos_weight(y_train)
+            xgb_classifier = XGBClassifier(**model_parameters)
+
+            start = time.perf_counter()
+            xgb_classifier.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
+            fit_seconds = time.perf_counter() - start
+
+            training_report = {
+                'parameters': model_parameters,
+                'rounds_used': int(xgb_classifier.get_booster().num_boosted_rounds()),
+                'best_iteration': int(xgb_classifier.best_iteration),
+                'best_score': float(xgb_classifier.best_score),
+                'fit_seconds': round(fit_seconds, 3)
+            }
+            return xgb_classifier, training_report
 
         except Exception as e:
             raise CustomException(e, sys)
     
+    def train_model_out_of_core(self, X_train, y_train, X_test, y_test, cache_dir: Path, parameters: dict=None) -> tuple:
+        """
+        `train_model` from an external memory DMatrix, only one chunk of the arrays is in memory at a time
+        Returns:
+            tuple: (model, training report with the parameters, rounds used and fit time)
+        """
+        try:
+            model_parameters = self.get_model_parameters()
+            model_parameters.update(parameters or {})
+            # the train set is not resampled out of core, the positive class is weighted instead
+            if self.is_positive_class_weighted():
+                model_parameters['scale_pos_weight'] = self.get_scale_pos_weight(y_train)
+
+            # the native api takes the rounds, early stopping, threads and seed separately
+            booster_parameters = dict(model_parameters, objective='binary:logistic', nthread=model_parameters['n_jobs'])
+            for name in ('n_estimators', 'early_stopping_rounds', 'n_jobs', 'random_state'):
+                booster_parameters.pop(name, None)
+
+            chunk_size = self.config.out_of_core.chunk_size
+            with tempfile.TemporaryDirectory(dir=cache_dir) as cache:
+                dtrain = xgboost.DMatrix(ArrayChunkIterator(X_train, y_train, chunk_size, os.path.join(cache, 'train')))
+                dtest = xgboost.DMatrix(ArrayChunkIterator(X_test, y_test, chunk_size, os.path.join(cache, 'test')))
+
+                start = time.perf_counter()
+                booster = xgboost.train(booster_parameters, dtrain, num_boost_round=model_parameters['n_estimators'],
+                                        evals=[(dtest, 'test')], early_stopping_rounds=model_parameters['early_stopping_rounds'],
+                                        verbose_eval=False)
+                fit_seconds = time.perf_counter() - start
+                del dtrain, dtest
+
+            training_report = {
+                'parameters': model_parameters,
+                'rounds_used': int(booster.num_boosted_rounds()),
+                'best_iteration': int(booster.best_iteration),
+                'best_score': float(booster.best_score),
+                'fit_seconds': round(fit_seconds, 3),
+                'out_of_core': True
+            }
+            return BoosterClassifier(booster, booster.best_iteration), training_report
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def save_model_bundle(self, sensor_model: SensorModel, X_test: np.ndarray, bundle_path: Path, model_id: str) -> dict:
+        """
+        saves the model bundle once it predicts every parity row like sensor_model.predict
+        Args:
+            X_test (np.ndarray): transformed test features, scaled back to raw rows with some values
+                missing, so the parity rows go through the imputer and the scaler too
+        Returns:
+            dict: parity report, `saved` tells whether the bundle is written
+        """
+        try:
+            try:
+                compiled_model = CompiledSensorModel.from_sensor_model(sensor_model, self.config.model_bundle.numpy_max_rows)
+            except Exception as e:
+                logging.info(f'WARNING: model cannot be bundled: {e}')
+                return {'saved': False, 'error': str(e)}
+
+            random_generator = np.random.default_rng(self.config.hyper_parameter_tuning.random_state)
+            raw_rows = np.asarray(X_test[:self.config.model_bundle.parity_rows], dtype=np.float64) * compiled_model.scale + compiled_model.center
+            raw_rows[random_generator.random(raw_rows.shape) < 0.05] = np.nan
+            parity_report = compiled_model.check_parity(sensor_model, pd.DataFrame(raw_rows, columns=compiled_model.columns))
+
+            parity_report['saved'] = parity_report['passed']
+            if parity_report['passed']:
+                compiled_model.save(bundle_path, model_id= model_id)
+            else:
+                logging.info(f'WARNING: model bundle does not predict like the trained model and is not saved: {parity_report}')
+            return parity_report
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
     @staticmethod
     def create_path_to_artifact(root_path: Path, timestamp: str, file_name: str) -> Path:
         artifacts_dir = os.path.join(root_path, timestamp)
@@ -63,27 +270,37 @@ class ModelTrainer:
         return file_path
 
         
-    def initiate_model_trainer(self):
+    def initiate_model_trainer(self) -> Path:
         try:
-            # loading train and test arr
-            train_arr = load_numpy_array(self.config.train_npy_file)
-            test_arr = load_numpy_array(self.config.test_npy_file) 
-
-            X_train, y_train, X_test, y_test = (
-                train_arr[:, :-1],
-                train_arr[:, -1],
-                test_arr[:, :-1],
-                test_arr[:, -1]
-            )           
+            # train and test arrays are memory-mapped, pages are read on demand and never copied
+            X_train = load_numpy_array(self.config.train_features_file, mmap_mode='r')
+            y_train = load_numpy_array(self.config.train_labels_file, mmap_mode='r')
+            X_test = load_numpy_array(self.config.test_features_file, mmap_mode='r')
+            y_test = load_numpy_array(self.config.test_labels_file, mmap_mode='r')
+            timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')        
+
+            with measure('model_trainer.hyper_parameter_tuning', rows= len(X_train), columns= X_train.shape[1]):
+                parameters = self.perform_hyper_parameter_tuning(
+                    X_train, y_train,
+                    trial_log_file= self.create_path_to_artifact(self.config.root_dir, timestamp, 'hyper_parameter_tuning.csv')
+                    )
             
-            model = self.train_model(X_train, y_train)
-            logging.info("Training model is completed successfully!")
+            with measure('model_trainer.fit', rows= len(X_train), columns= X_train.shape[1]):
+                if self.config.out_of_core.enabled:
+                    model, training_report = self.train_model_out_of_core(X_train, y_train, X_test, y_test,
+                                                                          cache_dir= os.path.join(self.config.root_dir, timestamp),
+                                                                          parameters= parameters)
+                else:
+                    model, training_report = self.train_model(X_train, y_train, X_test, y_test, parameters)
+            write_yaml_file(path= self.create_path_to_artifact(self.config.root_dir, timestamp, 'training_report.yaml'),
+                            content= training_report)
+            logging.info(f"Training model is completed successfully in {training_report['fit_seconds']}s "
+                         f"with {training_report['rounds_used']} rounds!")
             
-            y_train_pred = model.predict(X_train)
-            y_test_pred = model.predict(X_test)
+            with measure('model_trainer.predict', rows= len(X_train) + len(X_test), columns= X_train.shape[1]):
+                y_train_pred = self.predict(model, X_train)
+                y_test_pred = self.predict(model, X_test)
             labels = ["Negative", "Positive"]  
-
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')        
             
             confusion_matrix_display(
                 y_true = y_train, 
@@ -126,8 +343,31 @@ class ModelTrainer:
             preprocessor = load_pickle(self.config.preprocessor_file)
             sensor_model = SensorModel(preprocessing_object= preprocessor, trained_model_object= model)   
 
-            trained_model_path = self.create_path_to_artifact(self.config.root_dir, timestamp, 'model.pkl')
-            save_pickle(path= trained_model_path, obj= sensor_model)
+            trained_model_path = None
+            if self.config.model_bundle.enabled:
+                with measure('model_trainer.save_model_bundle', rows= min(len(X_test), self.config.model_bundle.parity_rows)):
+                    bundle_path = self.create_path_to_artifact(self.config.root_dir, timestamp, MODEL_BUNDLE_DIR_NAME)
+                    parity_report = self.save_model_bundle(sensor_model, X_test, bundle_path= bundle_path, model_id= timestamp)
+                write_yaml_file(path= self.create_path_to_artifact(self.config.root_dir, timestamp, 'model_bundle_parity.yaml'),
+                                content= parity_report)
+                if parity_report['saved']:
+                    trained_model_path = bundle_path
+            if trained_model_path is None:
+                # a model the bundle format does not support is pickled
+                trained_model_path = self.create_path_to_artifact(self.config.root_dir, timestamp, PICKLE_FILE_NAME)
+                save_pickle(path= trained_model_path, obj= sensor_model)
+
+            # the latest pointer moves only once the model bundle or file is complete
+            model_registry = ModelRegistry(self.config.model_registry_file)
+            model_registry.register_model(
+                model_id= timestamp,
+                model_path= trained_model_path,
+                metrics= {'train_f1_score': float(train_metric_table['f1-score'].values[-1]),
+                          'test_f1_score': float(test_metric_table['f1-score'].values[-1])},
+                preprocessor_hash= get_file_hash(self.config.preprocessor_file)
+                )
+            logging.info(f"Trained model {timestamp} is registered in {self.config.model_registry_file}!")
+            return trained_model_path
 
         except Exception as e:
             raise CustomException(e, sys)
\ No newline at end of file
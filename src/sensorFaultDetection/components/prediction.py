@@ -1,11 +1,18 @@
 import sys
 import os
+import datetime
+import functools
+from contextlib import ExitStack
+import numpy as np
 import pandas as pd
-from scipy.stats import ks_2samp
 from pathlib import Path
 from sensorFaultDetection.logger import logging
+from sensorFaultDetection.drift import detect_dataset_drift, BaselineSketch
+from sensorFaultDetection.model_registry import ModelRegistry
+from sensorFaultDetection.compiled_model import get_model_path, load_sensor_model
+from sensorFaultDetection.instrumentation import measure, get_files_size
 from sensorFaultDetection.exception import CustomException
-from sensorFaultDetection.utils import load_pickle, write_yaml_file
+from sensorFaultDetection.utils import write_yaml_file, read_dataframe, iter_dataframe, get_columns, DataFrameWriter
 from sensorFaultDetection.entity.config_entity import PredictionConfig
 
 class TargetValueMapping:
@@ -70,46 +77,208 @@ class Prediction:
     @staticmethod
     def detect_dataset_drift(base_dataframe: pd.DataFrame, current_datafrme: pd.DataFrame, threshold: float):
         try:
-            status = True
-            report ={}
-            for column in base_dataframe.columns:
-                df1 = base_dataframe[column]
-                df2 = current_datafrme[column]
-                is_same_dist = ks_2samp(df1, df2)
-                if is_same_dist.pvalue >= threshold:
-                    is_found = False
-                else:
-                    is_found = True
-                    status = False
-                
-                report.update({column:{
-                    'p_value': float(is_same_dist.pvalue),
-                    'drift_status': is_found
-                            }})
-            return status, report
+            # all columns are tested in one pass by the shared drift engine
+            return detect_dataset_drift(base_dataframe, current_datafrme, threshold)
         except Exception as e:
             raise CustomException(e, sys)        
 
+    @staticmethod
+    def read_data(file_path, columns: list=None) -> pd.DataFrame:
+        try:
+            return read_dataframe(file_path, columns=columns)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4)
+    def load_drift_baseline(path: Path, modified_time: float) -> BaselineSketch:
+        # cached per process, a new baseline written by data validation has a new modified time
+        logging.info(f'Drift baseline is loaded from {path}!')
+        return BaselineSketch.load(path)
+
+    def get_drift_baseline(self) -> BaselineSketch:
+        try:
+            path = self.config.drift_baseline_file
+            return self.load_drift_baseline(path, os.path.getmtime(path))
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def get_model_registry(path: Path) -> ModelRegistry:
+        # the schema is created once per process, every lookup then opens its own connection
+        return ModelRegistry(path)
+
     def get_best_model_path(self) -> Path:
         try:
-            if self.is_dir_empty(self.config.best_model_dir) is False:                              
-                raise Exception("WARNING: there is no trained model available for prediction!")      
-                   
-            dir_name = self.only_directory_names(self.config.best_model_dir)[-1]                      
-            best_model_path = os.path.join(self.config.best_model_dir, dir_name, 'model.pkl')                     
+            # the best pointer of the registry is one lookup and always names a complete model file
+            pointer = self.get_model_registry(self.config.model_registry_file).get_pointer(ModelRegistry.BEST)
+            if pointer is not None:
+                best_model_path = pointer['model_path']
+            else:
+                # a best model saved before the registry existed is the newest timestamp directory
+                if self.is_dir_empty(self.config.best_model_dir) is False:                              
+                    raise Exception("WARNING: there is no trained model available for prediction!")      
+
+                dir_names = self.only_directory_names(self.config.best_model_dir)
+                if len(dir_names) == 0:
+                    raise Exception("WARNING: there is no trained model available for prediction!")
+                dir_name = max(dir_names, key= lambda name: datetime.datetime.strptime(name, '%Y-%m-%d_%H-%M-%S'))
+                best_model_path = get_model_path(os.path.join(self.config.best_model_dir, dir_name))
             if not os.path.exists(best_model_path):                              
                 raise Exception("WARNING:  there is no trained model available for prediction!")             
             
             return best_model_path
         
         except Exception as e:
-            CustomException(e, sys)
+            raise CustomException(e, sys)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def load_model(path: Path, modified_time: float):
+        # one model per process, a promoted best model has a new path or modified time and replaces it
+        return load_sensor_model(path)
+
+    def get_model(self):
+        try:
+            # a model bundle is loaded memory-mapped, its arrays are read from the page cache on demand
+            best_model_path = self.get_best_model_path()
+            return self.load_model(best_model_path, os.path.getmtime(best_model_path))
+        except Exception as e:
+            raise CustomException(e, sys)
     
+    def validate_input_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        # rows sent to the online endpoint must contain every numerical column of the schema
+        try:
+            input_variables = self.config.schema_numerical_columns
+            missing_columns = [column for column in input_variables if column not in df.columns]
+            if len(missing_columns) > 0:
+                raise Exception(f'WARNING: missing columns for prediction: {missing_columns}')
+
+            return df[input_variables].astype(np.float64)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def predict_classes(self, df: pd.DataFrame) -> np.ndarray:
+        try:
+            model = self.get_model()
+            y_pred = model.predict(df)
+            # the class names are looked up by index instead of mapping a series
+            reverse_mapping = TargetValueMapping().reverse_mapping()
+            class_names = np.array([reverse_mapping[value] for value in range(len(reverse_mapping))], dtype=object)
+            return class_names[np.asarray(y_pred, dtype=int)]
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def open_output(self, output_path: str, stack: ExitStack) -> DataFrameWriter:
+        # writer of the predictions entered on the stack, an s3 url is written by a multipart upload
+        if str(output_path).startswith('s3://'):
+            from sensorFaultDetection.cloud_storage.s3_syncer import S3Sync
+            from sensorFaultDetection.cloud_storage.s3_writer import S3MultipartWriter
+
+            bucket, key = S3Sync.parse_bucket_url(str(output_path))
+            s3_writer = stack.enter_context(S3MultipartWriter(bucket, key, part_size= self.config.s3_sync.multipart_chunksize))
+            return stack.enter_context(DataFrameWriter(key, self.config.schema_columns, file_obj= s3_writer))
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        return stack.enter_context(DataFrameWriter(output_path, self.config.schema_columns))
+
+    def initiate_batch_prediction(self, output_path: str=None, drift_report_file: Path=None) -> dict:
+        """
+        scores the input file chunk by chunk and writes the predictions as they are made, for files
+        larger than memory, one chunk of `chunk_size` rows is in memory at a time
+        Args:
+            output_path (str): optional, local file or s3://bucket/key, `prediction_file` by default
+            drift_report_file (Path): optional, `drift_report_file` of the config by default
+        Returns:
+            dict: rows and chunks scored, output path, drift status and the drifted columns
+        """
+        try:
+            with measure('prediction.initiate_batch_prediction') as metrics:
+                drift_report_file = drift_report_file or self.config.drift_report_file
+                summary = self.run_batch_prediction(output_path or self.config.prediction_file, drift_report_file)
+                metrics.rows = summary['rows']
+                metrics.columns = len(self.config.schema_numerical_columns)
+                metrics.bytes_read = get_files_size([self.filename])
+                metrics.bytes_written = get_files_size([summary['output_path'], drift_report_file])
+            return summary
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def run_batch_prediction(self, output_path: str, drift_report_file: Path) -> dict:
+        try:
+            input_variables = self.config.schema_numerical_columns
+            missing_columns = [column for column in input_variables if column not in get_columns(self.filename)]
+            if len(missing_columns) > 0:
+                raise Exception(f'WARNING: missing columns for prediction: {missing_columns}')
+
+            self.get_model()
+            baseline = self.get_drift_baseline()
+            # drift is tested once on the histograms of all chunks added up, they do not grow with the rows
+            le, lt = baseline.count_histograms(np.empty((0, len(baseline.columns))))
+            number_of_rows = 0
+            number_of_chunks = 0
+
+            # for a local file the predictions are written next to it and renamed once complete
+            is_local = not str(output_path).startswith('s3://')
+            partial_path = f'{os.path.splitext(output_path)[0]}.part{os.path.splitext(output_path)[1]}' if is_local else output_path
+            try:
+                with ExitStack() as stack:
+                    writer = self.open_output(partial_path, stack)
+                    # only the numerical columns of the schema are read
+                    for df in iter_dataframe(self.filename, columns=input_variables, chunk_size=self.config.chunk_size):
+                        with measure('prediction.batch_chunk', rows= len(df), columns= df.shape[1]):
+                            chunk_le, chunk_lt = baseline.count_histograms(
+                                df[baseline.columns].to_numpy(dtype=np.float64, na_value=np.nan))
+                            le += chunk_le
+                            lt += chunk_lt
+                            df['predicted_class'] = self.predict_classes(df)
+                            writer.write(df)
+                        number_of_rows += len(df)
+                        number_of_chunks += 1
+                    if number_of_chunks == 0:
+                        writer.write(pd.DataFrame(columns= input_variables + ['predicted_class']))
+            except BaseException:
+                # no partial predictions are left next to the outputs
+                if is_local and os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+            if is_local:
+                os.replace(partial_path, output_path)
+
+            status, drift_report = baseline.report_from_histograms(le, lt, self.config.pvalue_threshold)
+            write_yaml_file(path= drift_report_file, content= drift_report, replace= True)
+            if status:
+                logging.info('NO data drift issue!')
+            else:
+                logging.info(f'WARNING: We faced data drift issue, check {drift_report_file}')
+
+            logging.info(f'{number_of_rows} rows of {self.filename} are predicted in {number_of_chunks} chunks to {output_path}!')
+            return {'input_path': str(self.filename), 'output_path': str(output_path), 'rows': number_of_rows,
+                    'chunks': number_of_chunks, 'drift_status': bool(status),
+                    'drifted_columns': [column for column, column_report in drift_report.items() if column_report['drift_status']]}
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
     def initiate_prediction(self):
         try:
-            best_model_path = self.get_best_model_path()            
-            model = load_pickle(best_model_path)
-            df = pd.read_csv(self.filename)
+            with measure('prediction.initiate_prediction') as metrics:
+                df = self.run_prediction()
+                metrics.rows, metrics.columns = df.shape
+                metrics.bytes_read = get_files_size([self.filename])
+                metrics.bytes_written = get_files_size([self.config.drift_report_file])
+            return df
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def run_prediction(self) -> pd.DataFrame:
+        try:
+            with measure('prediction.read_data') as metrics:
+                df = self.read_data(self.filename)
+                metrics.rows, metrics.columns = df.shape
+                metrics.bytes_read = get_files_size([self.filename])
             input_variables = self.config.schema_numerical_columns  
 
             if self.config.target_column in df.columns:
@@ -118,22 +287,21 @@ class Prediction:
             if not self.is_required_column_exist(input_variables, df):
                 raise Exception('WARNING: missing column issue exists, check the input data for the prediction!')
             
-            df = df[input_variables]                                   
+            df = df[input_variables].copy()
             logging.info("Reading data is completed!")
 
-            base_dataframe = pd.read_csv(self.config.valid_train_file)
-            base_dataframe.drop(self.config.target_column, axis=1, inplace=True)
-            status, drift_report = self.detect_dataset_drift(base_dataframe, df, self.config.pvalue_threshold)
-            write_yaml_file(path= self.config.drift_report_file, content= drift_report, replace= True)
+            # drift is checked against the sketch of the train set written by data validation
+            with measure('prediction.drift_check', rows= len(df), columns= df.shape[1]):
+                baseline = self.get_drift_baseline()
+                status, drift_report = baseline.detect_dataset_drift(df, self.config.pvalue_threshold)
+                write_yaml_file(path= self.config.drift_report_file, content= drift_report, replace= True)
             
             if status:   
                 logging.info('NO data drift issue!') 
             else:
                  logging.info(f'WARNING: We faced data drift issue, check {self.config.drift_report_file}')
 
-            y_pred = model.predict(df)
-            df['predicted_class']= y_pred
-            df['predicted_class'].replace(TargetValueMapping().reverse_mapping(), inplace=True)
+            df['predicted_class']= self.predict_classes(df)
             logging.info("Implementation of the trained model on the new data is completed!")            
             return df
 
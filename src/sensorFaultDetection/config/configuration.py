@@ -1,12 +1,24 @@
 import os
 from sensorFaultDetection.constants import *
 from sensorFaultDetection.utils import read_yaml, create_directories
-from sensorFaultDetection.entity.config_entity import (DataIngestionConfig,
+from sensorFaultDetection.entity.config_entity import (OutOfCoreConfig,
+                                                       DataBalancingConfig,
+                                                       DataIngestionConfig,
                                                        DataValidationConfig,
                                                        DataTransformationConfig,
+                                                       TrainingProfileConfig,
+                                                       ModelBundleConfig,
+                                                       HyperParameterTuningConfig,
                                                        ModelTrainerConfig,
                                                        ModelEvaluationConfig,
                                                        PredictionConfig,
+                                                       BatchPredictionConfig,
+                                                       DriftMonitorConfig,
+                                                       StageCacheConfig,
+                                                       InstrumentationConfig,
+                                                       TrainingJobConfig,
+                                                       S3SyncConfig,
+                                                       ArtifactStoreConfig,
                                                        TrainingPipelineConfig)
 
 
@@ -27,6 +39,35 @@ class ConfigurationManager:
         
         create_directories([self.config.artifacts_root])
 
+    def get_data_file_path(self, path: str) -> str:
+        # data handed over between stages is written in `artifact_format`, config.yaml only names the files
+        extension = ARTIFACT_FILE_EXTENSIONS[self.config.artifact_format]
+        return str(Path(path).with_suffix(extension))
+
+    def get_out_of_core_config(self) -> OutOfCoreConfig:
+        params = self.params.OUT_OF_CORE
+
+        out_of_core_config = OutOfCoreConfig(
+            enabled= params.ENABLED,
+            chunk_size= params.CHUNK_SIZE,
+            sample_size= params.SAMPLE_SIZE,
+            column_block_size= params.COLUMN_BLOCK_SIZE
+        )
+
+        return out_of_core_config
+
+    def get_data_balancing_config(self) -> DataBalancingConfig:
+        params = self.params.DATA_BALANCING
+
+        data_balancing_config = DataBalancingConfig(
+            strategy= params.STRATEGY,
+            k_neighbors= params.K_NEIGHBORS,
+            n_jobs= params.N_JOBS,
+            random_state= params.RANDOM_STATE
+        )
+
+        return data_balancing_config
+
     def get_data_ingestion_config(self) -> DataIngestionConfig:
         config = self.config.data_ingestion
         secret = self.secret.aws_credential
@@ -39,11 +80,14 @@ class ConfigurationManager:
             s3_key= secret.S3_KEY,
             s3_secret_key= secret.S3_SECRET_KEY,
             object_key= secret.OBJECT_KEY,
-            local_data_file= config.LOCAL_DATA_FILE,
+            local_data_file= self.get_data_file_path(config.LOCAL_DATA_FILE),
             train_test_ratio= self.params.TRAIN_TEST_RATIO,
-            train_data_file= config.TRAIN_DATA_FILE,
-            test_data_file= config.TEST_DATA_FILE,
-            drop_columns= self.schema.drop_columns
+            train_data_file= self.get_data_file_path(config.TRAIN_DATA_FILE),
+            test_data_file= self.get_data_file_path(config.TEST_DATA_FILE),
+            drop_columns= self.schema.drop_columns,
+            chunk_size= config.CHUNK_SIZE,
+            schema_columns= self.schema.columns,
+            out_of_core= self.get_out_of_core_config()
 
         )        
 
@@ -59,16 +103,20 @@ class ConfigurationManager:
 
         data_validation_config = DataValidationConfig(
             root_dir= config.ROOT_DIR,
-            train_data_file= self.config.data_ingestion.TRAIN_DATA_FILE,
-            test_data_file= self.config.data_ingestion.TEST_DATA_FILE,
-            valid_train_file= config.VALID_TRAIN_FILE,
-            valid_test_file= config.VALID_TEST_FILE,
-            invalid_train_file= config.INVALID_TRAIN_FILE,
-            invalid_test_file= config.INVALID_TEST_FILE,
+            train_data_file= self.get_data_file_path(self.config.data_ingestion.TRAIN_DATA_FILE),
+            test_data_file= self.get_data_file_path(self.config.data_ingestion.TEST_DATA_FILE),
+            valid_train_file= self.get_data_file_path(config.VALID_TRAIN_FILE),
+            valid_test_file= self.get_data_file_path(config.VALID_TEST_FILE),
+            invalid_train_file= self.get_data_file_path(config.INVALID_TRAIN_FILE),
+            invalid_test_file= self.get_data_file_path(config.INVALID_TEST_FILE),
             drift_report_file= config.DRIFT_REPORT_FILE,
+            drift_baseline_file= config.DRIFT_BASELINE_FILE,
             schema_columns= self.schema.columns,
             schema_numerical_columns= self.schema.numerical_columns,            
             pvalue_threshold= self.params.PVALUE_THRESHOLD,
+            drift_baseline_quantiles= self.params.DRIFT_BASELINE_QUANTILES,
+            drift_n_jobs= self.params.DRIFT_N_JOBS,
+            out_of_core= self.get_out_of_core_config()
 
         )        
 
@@ -81,12 +129,17 @@ class ConfigurationManager:
 
         data_transformation_config = DataTransformationConfig(
             root_dir= config.ROOT_DIR,    
-            train_data_file= self.config.data_validation.VALID_TRAIN_FILE,
-            test_data_file= self.config.data_validation.VALID_TEST_FILE, 
-            train_npy_file = config.TRAIN_NPY_FILE,
-            test_npy_file= config.TEST_NPY_FILE,
+            train_data_file= self.get_data_file_path(self.config.data_validation.VALID_TRAIN_FILE),
+            test_data_file= self.get_data_file_path(self.config.data_validation.VALID_TEST_FILE), 
+            train_features_file= config.TRAIN_FEATURES_FILE,
+            train_labels_file= config.TRAIN_LABELS_FILE,
+            test_features_file= config.TEST_FEATURES_FILE,
+            test_labels_file= config.TEST_LABELS_FILE,
             target_column= self.params.TARGET_COLUMN,                       
-            preprocessor_file= config.PREPROCESSOR_FILE
+            preprocessor_file= config.PREPROCESSOR_FILE,
+            balancing_report_file= config.BALANCING_REPORT_FILE,
+            data_balancing= self.get_data_balancing_config(),
+            out_of_core= self.get_out_of_core_config()
 
         )
 
@@ -99,15 +152,69 @@ class ConfigurationManager:
 
         model_trainer_config = ModelTrainerConfig(
             root_dir= config.ROOT_DIR,             
-            train_npy_file = self.config.data_transformation.TRAIN_NPY_FILE,
-            test_npy_file = self.config.data_transformation.TEST_NPY_FILE,           
+            train_features_file= self.config.data_transformation.TRAIN_FEATURES_FILE,
+            train_labels_file= self.config.data_transformation.TRAIN_LABELS_FILE,
+            test_features_file= self.config.data_transformation.TEST_FEATURES_FILE,
+            test_labels_file= self.config.data_transformation.TEST_LABELS_FILE,
             expected_accuracy_threshold = self.params.EXPECTED_ACCURACY_THRESHOLD,
             overfit_underfit_threshold = self.params.OVERFIT_UNDERFIT_THRESHOLD,
-            preprocessor_file = self.config.data_transformation.PREPROCESSOR_FILE
+            preprocessor_file = self.config.data_transformation.PREPROCESSOR_FILE,
+            model_registry_file = self.config.model_registry.REGISTRY_FILE,
+            training_profile = self.get_training_profile_config(),
+            hyper_parameter_tuning = self.get_hyper_parameter_tuning_config(),
+            data_balancing = self.get_data_balancing_config(),
+            out_of_core = self.get_out_of_core_config(),
+            model_bundle = self.get_model_bundle_config()
 
         )
 
         return model_trainer_config
+
+    def get_model_bundle_config(self) -> ModelBundleConfig:
+        params = self.params.MODEL_BUNDLE
+
+        model_bundle_config = ModelBundleConfig(
+            enabled= params.ENABLED,
+            numpy_max_rows= params.NUMPY_MAX_ROWS,
+            parity_rows= params.PARITY_ROWS
+        )
+
+        return model_bundle_config
+
+    def get_training_profile_config(self) -> TrainingProfileConfig:
+        params = self.params.TRAINING_PROFILE
+
+        training_profile_config = TrainingProfileConfig(
+            tree_method= params.TREE_METHOD,
+            n_jobs= params.N_JOBS,
+            max_bin= params.MAX_BIN,
+            n_estimators= params.N_ESTIMATORS,
+            early_stopping_rounds= params.EARLY_STOPPING_ROUNDS,
+            eval_metric= params.EVAL_METRIC
+        )
+
+        return training_profile_config
+
+    def get_hyper_parameter_tuning_config(self) -> HyperParameterTuningConfig:
+        params = self.params.HYPER_PARAMETER_TUNING
+
+        hyper_parameter_tuning_config = HyperParameterTuningConfig(
+            enabled= params.ENABLED,
+            number_of_trials= params.NUMBER_OF_TRIALS,
+            reduction_factor= params.REDUCTION_FACTOR,
+            min_estimators= params.MIN_ESTIMATORS,
+            max_estimators= params.MAX_ESTIMATORS,
+            early_stopping_rounds= params.EARLY_STOPPING_ROUNDS,
+            validation_ratio= params.VALIDATION_RATIO,
+            n_jobs= params.N_JOBS,
+            threads_per_trial= params.THREADS_PER_TRIAL,
+            cpu_hours_budget= params.CPU_HOURS_BUDGET,
+            random_state= params.RANDOM_STATE,
+            search_space= params.SEARCH_SPACE.to_dict(),
+            log_scale= list(params.LOG_SCALE)
+        )
+
+        return hyper_parameter_tuning_config
     
     def get_model_evaluation_config(self) -> ModelEvaluationConfig:
         config = self.config.model_evaluation       
@@ -117,12 +224,15 @@ class ConfigurationManager:
         model_evaluation_config = ModelEvaluationConfig(
             root_dir= config.ROOT_DIR,
             trained_model_path= self.config.model_trainer.ROOT_DIR,           
-            valid_train_file= self.config.data_validation.VALID_TRAIN_FILE,
-            valid_test_file= self.config.data_validation.VALID_TEST_FILE,                
+            valid_train_file= self.get_data_file_path(self.config.data_validation.VALID_TRAIN_FILE),
+            valid_test_file= self.get_data_file_path(self.config.data_validation.VALID_TEST_FILE),
             evaluation_report_file= config.EVALUATION_REPORT_FILE,
             model_evaluation_changed_threshold= self.params.MODEL_EVALUATION_CHANGED_THRESHOLD,
             target_column = self.params.TARGET_COLUMN,
-            saved_model_path = self.saved_modelpath
+            saved_model_dir = self.saved_modelpath,
+            model_registry_file = self.config.model_registry.REGISTRY_FILE,
+            batch_size = self.params.MODEL_EVALUATION_BATCH_SIZE,
+            out_of_core = self.get_out_of_core_config()
         )
 
         return model_evaluation_config
@@ -136,22 +246,122 @@ class ConfigurationManager:
             root_dir = config.ROOT_DIR,
             drift_report_file= config.DRIFT_REPORT_FILE,
             best_model_dir = self.config.model_evaluation.ROOT_DIR,
-            valid_train_file= self.config.data_validation.VALID_TRAIN_FILE,
+            model_registry_file = self.config.model_registry.REGISTRY_FILE,
+            drift_baseline_file= self.config.data_validation.DRIFT_BASELINE_FILE,
             schema_numerical_columns= self.schema.numerical_columns,
             target_column= self.params.TARGET_COLUMN,
-            pvalue_threshold= self.params.PVALUE_THRESHOLD
+            pvalue_threshold= self.params.PVALUE_THRESHOLD,
+            prediction_file= config.PREDICTION_FILE,
+            schema_columns= self.schema.columns,
+            chunk_size= self.params.PREDICTION_CHUNK_SIZE,
+            s3_sync= self.get_s3_sync_config()
         )
         
         return prediction_config    
     
+    def get_drift_monitor_config(self) -> DriftMonitorConfig:
+        config = self.config.drift_monitor
+        params = self.params.DRIFT_MONITOR
+
+        create_directories([config.ROOT_DIR])
+
+        drift_monitor_config = DriftMonitorConfig(
+            root_dir= config.ROOT_DIR,
+            report_file= config.REPORT_FILE,
+            report_dir= config.REPORT_DIR,
+            enabled= params.ENABLED,
+            window_seconds= params.WINDOW_SECONDS,
+            slide_seconds= params.SLIDE_SECONDS,
+            min_rows= params.MIN_ROWS,
+            pvalue_threshold= self.params.PVALUE_THRESHOLD,
+            retrain_on_drift= params.RETRAIN_ON_DRIFT,
+            retrain_drifted_columns_ratio= params.RETRAIN_DRIFTED_COLUMNS_RATIO
+        )
+
+        return drift_monitor_config
+
+    def get_batch_prediction_config(self) -> BatchPredictionConfig:
+        config = self.config.batch_prediction
+        params = self.params.BATCH_PREDICTION
+
+        create_directories([config.ROOT_DIR])
+
+        batch_prediction_config = BatchPredictionConfig(
+            root_dir= config.ROOT_DIR,
+            output_dir= config.OUTPUT_DIR,
+            drift_report_dir= config.DRIFT_REPORT_DIR,
+            download_dir= config.DOWNLOAD_DIR,
+            report_file= config.REPORT_FILE,
+            n_jobs= params.N_JOBS,
+            threads_per_worker= params.THREADS_PER_WORKER,
+            output_format= params.OUTPUT_FORMAT,
+            prediction= self.get_prediction_config()
+        )
+
+        return batch_prediction_config
+
+
+    def get_stage_cache_config(self) -> StageCacheConfig:
+        config = self.config.stage_cache
+
+        stage_cache_config = StageCacheConfig(
+            manifest_file= config.MANIFEST_FILE,
+            enabled= config.ENABLED
+        )
+
+        return stage_cache_config
+
+    def get_instrumentation_config(self) -> InstrumentationConfig:
+        config = self.config.instrumentation
+
+        instrumentation_config = InstrumentationConfig(
+            run_report_file= config.RUN_REPORT_FILE
+        )
+
+        return instrumentation_config
+
+    def get_s3_sync_config(self) -> S3SyncConfig:
+        params = self.params.S3_SYNC
+
+        s3_sync_config = S3SyncConfig(
+            max_workers= params.MAX_WORKERS,
+            multipart_threshold= params.MULTIPART_THRESHOLD_MB * 1024 * 1024,
+            multipart_chunksize= params.MULTIPART_CHUNKSIZE_MB * 1024 * 1024,
+            multipart_concurrency= params.MULTIPART_CONCURRENCY
+        )
+
+        return s3_sync_config
+
+    def get_artifact_store_config(self) -> ArtifactStoreConfig:
+        config = self.config.artifact_store
+
+        artifact_store_config = ArtifactStoreConfig(
+            objects_prefix= config.OBJECTS_PREFIX,
+            runs_prefix= config.RUNS_PREFIX
+        )
+
+        return artifact_store_config
+
+    def get_training_job_config(self) -> TrainingJobConfig:
+        config = self.config.training_job
+
+        create_directories([config.ROOT_DIR])
+
+        training_job_config = TrainingJobConfig(
+            root_dir= config.ROOT_DIR,
+            lock_file= config.LOCK_FILE
+        )
+
+        return training_job_config
 
     def get_training_pipeline_config(self) -> TrainingPipelineConfig:               
 
         training_pipeline_config = TrainingPipelineConfig(
             artifacts_dir= self.config.artifacts_root,
             saved_model_dir= self.saved_modelpath,
-            training_bucket_name= self.secret.aws_credential.TRAINING_BUCKET_NAME
-            
+            training_bucket_name= self.secret.aws_credential.TRAINING_BUCKET_NAME,
+            s3_sync= self.get_s3_sync_config(),
+            artifact_store= self.get_artifact_store_config()
         )
         
         return training_pipeline_config   
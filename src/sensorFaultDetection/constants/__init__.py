@@ -4,4 +4,10 @@ CONFIG_FILE_PATH = Path('config/config.yaml')
 SECRET_FILE_PATH = Path('config/secrets.yaml')
 SCHEMA_FILE_PATH = Path('config/schema.yaml')
 PARAMS_FILE_PATH = Path('params.yaml')
-SAVED_MODEL_PATH = Path('saved_model')
\ No newline at end of file
+SAVED_MODEL_PATH = Path('saved_model')
+
+ARTIFACT_FILE_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# dtypes of the arrays written by data transformation, float32 is what xgboost trains on
+FEATURE_DTYPE = 'float32'
+LABEL_DTYPE = 'int8'
\ No newline at end of file
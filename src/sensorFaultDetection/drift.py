@@ -0,0 +1,419 @@
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.utils import get_n_jobs
+
+
+# scipy.stats.ks_2samp computes exact p-values up to this sample size and
+# switches to the asymptotic distribution above it, the same rule is kept here
+MAX_EXACT_SAMPLE_SIZE = 10000
+
+
+def to_numeric_arrays(base_dataframe: pd.DataFrame, current_dataframe: pd.DataFrame,
+                      base: np.ndarray=None, current: np.ndarray=None) -> tuple:
+    """
+    converts the columns of both dataframes into float arrays of shape (rows, columns)
+    Args:
+        base_dataframe (pd.DataFrame): reference data
+        current_dataframe (pd.DataFrame): data to compare with, must contain the base columns
+        base, current (np.ndarray): optional, float64 arrays of the right shape to write into
+    Returns:
+        tuple: (base array, current array), non numerical columns e.g. `class` are
+        encoded by the rank of their category so both samples share the same codes
+    """
+    columns = list(base_dataframe.columns)
+    # column-major so every column is written and later sorted as one contiguous block
+    if base is None:
+        base = np.empty((len(base_dataframe), len(columns)), dtype=np.float64, order='F')
+    if current is None:
+        current = np.empty((len(current_dataframe), len(columns)), dtype=np.float64, order='F')
+    for j, column in enumerate(columns):
+        base_column = base_dataframe[column]
+        current_column = current_dataframe[column]
+        if pd.api.types.is_numeric_dtype(base_column) and pd.api.types.is_numeric_dtype(current_column):
+            base[:, j] = base_column.to_numpy(dtype=np.float64, na_value=np.nan)
+            current[:, j] = current_column.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            codes, _ = pd.factorize(pd.concat([base_column, current_column], ignore_index=True), sort=True)
+            codes = codes.astype(np.float64)
+            codes[codes < 0] = np.nan
+            base[:, j] = codes[:len(base_column)]
+            current[:, j] = codes[len(base_column):]
+    return base, current
+
+
+def sort_columns(array: np.ndarray) -> tuple:
+    """
+    sorts every column of a (rows, columns) array once
+    Args:
+        array (np.ndarray): float array, NaN marks a missing value
+    Returns:
+        tuple: (sorted values of shape (columns, rows) with NaNs at the end of each row,
+        number of non-missing values per column)
+    """
+    sorted_array = np.sort(np.ascontiguousarray(array.T), axis=1)
+    counts = np.count_nonzero(~np.isnan(sorted_array), axis=1)
+    return sorted_array, counts
+
+
+def _ecdf_jumps(sorted_values: np.ndarray) -> np.ndarray:
+    # index of the last element of every run of tied values, the ecdf only changes there
+    is_last = np.ones(len(sorted_values), dtype=bool)
+    is_last[:-1] = sorted_values[1:] != sorted_values[:-1]
+    return np.flatnonzero(is_last)
+
+
+def ks_statistic(sorted_base: np.ndarray, base_counts: np.ndarray,
+                 sorted_current: np.ndarray, current_counts: np.ndarray) -> np.ndarray:
+    """
+    two-sample Kolmogorov-Smirnov statistic for every column of pre-sorted samples
+    Args:
+        sorted_base, base_counts: output of `sort_columns` for the base sample
+        sorted_current, current_counts: output of `sort_columns` for the current sample
+    Returns:
+        np.ndarray: sup |F_base - F_current| per column, NaN if one of the samples is empty
+    """
+    statistics = np.full(len(base_counts), np.nan)
+    for j, (n1, n2) in enumerate(zip(base_counts, current_counts)):
+        if n1 == 0 or n2 == 0:
+            continue
+        base = sorted_base[j, :n1]
+        current = sorted_current[j, :n2]
+        # both ecdfs are step functions, so the supremum is reached at one of the observed values:
+        # at the base values the base ecdf is known from the position, only the current one is searched
+        base_jumps = _ecdf_jumps(base)
+        current_jumps = _ecdf_jumps(current)
+        d_base = np.abs((base_jumps + 1) / n1 - np.searchsorted(current, base[base_jumps], side='right') / n2)
+        d_current = np.abs(np.searchsorted(base, current[current_jumps], side='right') / n1 - (current_jumps + 1) / n2)
+        statistics[j] = max(d_base.max(), d_current.max())
+    return statistics
+
+
+def ks_pvalue(statistics: np.ndarray, base_counts: np.ndarray, current_counts: np.ndarray) -> np.ndarray:
+    """
+    asymptotic two-sided p-values of the KS statistics, identical to ks_2samp(method='asymp')
+    Args:
+        statistics (np.ndarray): KS statistic per column
+        base_counts (np.ndarray): base sample size per column
+        current_counts (np.ndarray): current sample size per column
+    """
+    from scipy.stats import kstwo
+
+    n1 = np.asarray(base_counts, dtype=np.float64)
+    n2 = np.asarray(current_counts, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        en = np.round(n1 * n2 / (n1 + n2))
+        pvalues = np.clip(kstwo.sf(statistics, en), 0, 1)
+    pvalues[(n1 == 0) | (n2 == 0)] = np.nan
+    return pvalues
+
+
+def ks_2samp_columns(base: np.ndarray, current: np.ndarray) -> tuple:
+    """
+    column-wise two-sample KS test, equivalent to calling scipy.stats.ks_2samp on the
+    non-missing values of every column
+    Args:
+        base (np.ndarray): base sample of shape (rows, columns)
+        current (np.ndarray): current sample of shape (rows, columns)
+    Returns:
+        tuple: (statistics, p-values) per column
+    """
+    # scipy.stats takes longer to import than most drift checks take to run, it is loaded on first use
+    from scipy.stats import ks_2samp
+
+    sorted_base, base_counts = sort_columns(base)
+    sorted_current, current_counts = sort_columns(current)
+
+    statistics = ks_statistic(sorted_base, base_counts, sorted_current, current_counts)
+    pvalues = ks_pvalue(statistics, base_counts, current_counts)
+
+    # small samples get the exact p-value like ks_2samp(method='auto'), these are cheap to recompute
+    exact = (np.maximum(base_counts, current_counts) <= MAX_EXACT_SAMPLE_SIZE) & (base_counts > 0) & (current_counts > 0)
+    for j in np.flatnonzero(exact):
+        pvalues[j] = ks_2samp(sorted_base[j, :base_counts[j]], sorted_current[j, :current_counts[j]]).pvalue
+
+    return statistics, pvalues
+
+
+class SharedArray:
+    """
+    float64 array of shape (rows, columns) in column-major order backed by shared memory,
+    worker processes attach to it by name instead of receiving a pickled copy
+    """
+    def __init__(self, shape: tuple, name: str=None):
+        self.shape = tuple(shape)
+        size = max(int(np.prod(self.shape)) * np.dtype(np.float64).itemsize, 1)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # pool workers share the resource tracker of the creating process, which unlinks the block
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf, order='F')
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self) -> None:
+        self.array = None
+        self.shm.close()
+
+    def unlink(self) -> None:
+        self.close()
+        self.shm.unlink()
+
+
+# shared arrays of the drift check a worker process is attached to, set by `_attach_shared_arrays`
+_shared_arrays = {}
+
+
+def _attach_shared_arrays(base_name: str, base_shape: tuple, current_name: str, current_shape: tuple) -> None:
+    _shared_arrays['base'] = SharedArray(base_shape, name=base_name)
+    _shared_arrays['current'] = SharedArray(current_shape, name=current_name)
+
+
+def _ks_2samp_column_block(start: int, stop: int) -> tuple:
+    # column slices of a column-major array are views, the worker only copies what it sorts
+    return ks_2samp_columns(_shared_arrays['base'].array[:, start:stop], _shared_arrays['current'].array[:, start:stop])
+
+
+def ks_2samp_columns_parallel(base_dataframe: pd.DataFrame, current_dataframe: pd.DataFrame, n_jobs: int) -> tuple:
+    """
+    `ks_2samp_columns` with the columns partitioned across a process pool
+    Args:
+        base_dataframe (pd.DataFrame): reference data
+        current_dataframe (pd.DataFrame): data to compare with, must contain the base columns
+        n_jobs (int): number of worker processes, -1 for all cores
+    Returns:
+        tuple: (statistics, p-values) per column
+    """
+    number_of_columns = base_dataframe.shape[1]
+    n_jobs = min(get_n_jobs(n_jobs), max(number_of_columns, 1))
+    if n_jobs == 1:
+        return ks_2samp_columns(*to_numeric_arrays(base_dataframe, current_dataframe))
+
+    base = SharedArray((len(base_dataframe), number_of_columns))
+    current = SharedArray((len(current_dataframe), number_of_columns))
+    try:
+        to_numeric_arrays(base_dataframe, current_dataframe, base=base.array, current=current.array)
+
+        # a few blocks per worker even out columns that take longer, e.g. with fewer missing values
+        bounds = np.linspace(0, number_of_columns, min(4 * n_jobs, number_of_columns) + 1).astype(int)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach_shared_arrays,
+                                 initargs=(base.name, base.shape, current.name, current.shape)) as executor:
+            results = list(executor.map(_ks_2samp_column_block, bounds[:-1], bounds[1:]))
+
+        statistics = np.concatenate([block_statistics for block_statistics, _ in results])
+        pvalues = np.concatenate([block_pvalues for _, block_pvalues in results])
+        return statistics, pvalues
+
+    finally:
+        base.unlink()
+        current.unlink()
+
+
+def detect_dataset_drift(base_dataframe: pd.DataFrame, current_dataframe: pd.DataFrame, threshold: float,
+                         n_jobs: int=1) -> tuple:
+    """
+    checks every column of the base dataframe for drift with a two-sample KS test,
+    missing values are left out of both samples
+    Args:
+        base_dataframe (pd.DataFrame): reference data, e.g. train set
+        current_dataframe (pd.DataFrame): data to compare with, e.g. test set
+        threshold (float): p-value below which a column is reported as drifted
+        n_jobs (int): optional, processes the columns are partitioned across, -1 for all cores
+    Returns:
+        tuple: (True if no column drifted, {column: {'p_value': float, 'drift_status': bool}})
+    """
+    try:
+        _, pvalues = ks_2samp_columns_parallel(base_dataframe, current_dataframe, n_jobs)
+
+        report = {}
+        for column, pvalue in zip(base_dataframe.columns, pvalues):
+            # a column without observations cannot be checked and is reported as drifted
+            is_found = not pvalue >= threshold
+            report.update({column: {
+                'p_value': float(pvalue),
+                'drift_status': is_found
+                    }})
+        status = not any(column_report['drift_status'] for column_report in report.values())
+        return status, report
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def to_column_keys(columns: np.ndarray, values: np.ndarray) -> np.ndarray:
+    # (column index, value) pairs as complex numbers, which numpy orders by column first
+    keys = np.empty(np.shape(values), dtype=np.complex128)
+    keys.real = columns
+    keys.imag = values
+    return keys.ravel()
+
+
+class BaselineSketch:
+    """
+    compact drift baseline that replaces the full train set at prediction time
+
+    For every column it keeps up to K+1 distinct knots of the sorted non-missing values
+    (K = number_of_quantiles) together with the exact base ecdf at each knot, the number
+    of observations and the NaN rate. Between two knots the base ecdf is approximated by
+    its value at the lower knot. The knots are at most ceil((n-1)/K) ranks apart, so the
+    approximation is off by less than 1/K everywhere and the KS statistic computed against
+    the sketch satisfies |D_sketch - D_exact| < 1/K, columns with at most K+1 observations are
+    kept whole and D_sketch is exact. p-values are the asymptotic ones evaluated at D_sketch.
+    """
+    # `add_to_histograms` searches the knots of all columns at once up to this many rows, the search per
+    # column of `count_histograms` is faster for more rows
+    MAX_SEARCHED_ROWS = 32
+
+    def __init__(self, columns: list, values: np.ndarray, cdf: np.ndarray, counts: np.ndarray, nan_rates: np.ndarray):
+        self.columns = list(columns)
+        # (columns, knots) arrays, rows are padded with +inf knots at cdf 1
+        self.values = values
+        self.cdf = cdf
+        self.counts = counts
+        self.nan_rates = nan_rates
+
+    @classmethod
+    def from_dataframe(cls, dataframe: pd.DataFrame, number_of_quantiles: int=1000):
+        """
+        builds the sketch of every column of a numerical dataframe
+        Args:
+            dataframe (pd.DataFrame): base data, e.g. valid train set without target column
+            number_of_quantiles (int): K, the KS statistic error bound is 1/K
+        """
+        try:
+            array = dataframe.to_numpy(dtype=np.float64, na_value=np.nan)
+            sorted_array, counts = sort_columns(array)
+            values = np.full((len(counts), number_of_quantiles + 1), np.inf)
+            cdf = np.ones((len(counts), number_of_quantiles + 1))
+            for j, n in enumerate(counts):
+                if n == 0:
+                    continue
+                column = sorted_array[j, :n]
+                positions = np.arange(number_of_quantiles + 1) * (n - 1) // number_of_quantiles
+                knots = np.unique(column[positions])
+                values[j, :len(knots)] = knots
+                cdf[j, :len(knots)] = np.searchsorted(column, knots, side='right') / n
+            nan_rates = 1 - counts / max(len(array), 1)
+            return cls(list(dataframe.columns), values, cdf, counts, nan_rates)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    @classmethod
+    def concat(cls, sketches: list):
+        """
+        joins sketches of column blocks built with the same number of quantiles into one
+        """
+        return cls([column for sketch in sketches for column in sketch.columns],
+                   np.concatenate([sketch.values for sketch in sketches]),
+                   np.concatenate([sketch.cdf for sketch in sketches]),
+                   np.concatenate([sketch.counts for sketch in sketches]),
+                   np.concatenate([sketch.nan_rates for sketch in sketches]))
+
+    def save(self, path) -> None:
+        np.savez(path, columns=np.array(self.columns), values=self.values, cdf=self.cdf,
+                 counts=self.counts, nan_rates=self.nan_rates)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as sketch:
+            return cls(sketch['columns'].tolist(), sketch['values'], sketch['cdf'], sketch['counts'], sketch['nan_rates'])
+
+    def count_histograms(self, current: np.ndarray) -> tuple:
+        """
+        bins the current sample on the knots, the histograms of separate batches can be added up
+        Args:
+            current (np.ndarray): current sample of shape (rows, columns) in the order of `columns`
+        Returns:
+            tuple: (le, lt) integer arrays of shape (columns, knots + 1), cumsum(le)[i] is the number
+            of values <= knot i and cumsum(lt)[i] the number of values < knot i
+        """
+        number_of_knots = self.values.shape[1]
+        le = np.zeros((len(self.columns), number_of_knots + 1), dtype=np.int64)
+        lt = np.zeros((len(self.columns), number_of_knots + 1), dtype=np.int64)
+        for j in range(len(self.columns)):
+            column = current[:, j]
+            column = column[~np.isnan(column)]
+            le[j] = np.bincount(np.searchsorted(self.values[j], column, side='left'), minlength=number_of_knots + 1)
+            lt[j] = np.bincount(np.searchsorted(self.values[j], column, side='right'), minlength=number_of_knots + 1)
+        return le, lt
+
+    def add_to_histograms(self, le: np.ndarray, lt: np.ndarray, current: np.ndarray) -> None:
+        """
+        adds the current sample to histograms of `count_histograms` in place, in O(rows x columns)
+        instead of O(columns x knots), for the few rows of an online prediction request
+        """
+        if len(current) > self.MAX_SEARCHED_ROWS:
+            current_le, current_lt = self.count_histograms(current)
+            le += current_le
+            lt += current_lt
+            return
+        if getattr(self, 'column_knots', None) is None:
+            # complex numbers sort by real then imaginary part, so one search over (column, knot) pairs
+            # replaces a search per column, the parts are set directly as 1j * inf is nan + inf * 1j
+            self.column_knots = to_column_keys(np.arange(len(self.columns))[:, None], self.values)
+        # column by column, so the keys are searched in almost increasing order
+        current = current.T
+        is_observed = ~np.isnan(current)
+        columns = np.broadcast_to(np.arange(len(self.columns))[:, None], current.shape)[is_observed]
+        keys = to_column_keys(columns, current[is_observed])
+        # the position among all knots is shifted by one bin per previous column, the bin past the last knot
+        np.add.at(le.reshape(-1), np.searchsorted(self.column_knots, keys, side='left') + columns, 1)
+        np.add.at(lt.reshape(-1), np.searchsorted(self.column_knots, keys, side='right') + columns, 1)
+
+    def ks_statistic_from_histograms(self, le: np.ndarray, lt: np.ndarray) -> tuple:
+        """
+        KS statistic between the sketched base ecdf and the current sample summarized by `count_histograms`
+        Returns:
+            tuple: (statistics, number of current observations) per column
+        """
+        current_counts = le.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            current_le = np.cumsum(le, axis=1)[:, :-1] / current_counts[:, None]
+            current_lt = np.cumsum(lt, axis=1)[:, :-1] / current_counts[:, None]
+        # the difference of two step functions is largest at a knot or just below it,
+        # where the base ecdf still has the value of the previous knot
+        previous_cdf = np.concatenate([np.zeros((len(self.columns), 1)), self.cdf[:, :-1]], axis=1)
+        statistics = np.maximum(np.abs(self.cdf - current_le), np.abs(previous_cdf - current_lt)).max(axis=1)
+        statistics[(current_counts == 0) | (self.counts == 0)] = np.nan
+        return statistics, current_counts
+
+    def report_from_histograms(self, le: np.ndarray, lt: np.ndarray, threshold: float) -> tuple:
+        """
+        drift report in the same format as `detect_dataset_drift` from accumulated histograms
+        """
+        statistics, current_counts = self.ks_statistic_from_histograms(le, lt)
+        pvalues = ks_pvalue(statistics, self.counts, current_counts)
+
+        report = {}
+        for column, pvalue in zip(self.columns, pvalues):
+            is_found = not pvalue >= threshold
+            report.update({column: {
+                'p_value': float(pvalue),
+                'drift_status': is_found
+                    }})
+        status = not any(column_report['drift_status'] for column_report in report.values())
+        return status, report
+
+    def detect_dataset_drift(self, current_dataframe: pd.DataFrame, threshold: float) -> tuple:
+        """
+        checks every sketched column of the current dataframe for drift against the baseline
+        Args:
+            current_dataframe (pd.DataFrame): data to compare with, must contain the sketched columns
+            threshold (float): p-value below which a column is reported as drifted
+        Returns:
+            tuple: (True if no column drifted, {column: {'p_value': float, 'drift_status': bool}})
+        """
+        try:
+            current = current_dataframe[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+            le, lt = self.count_histograms(current)
+            return self.report_from_histograms(le, lt, threshold)
+
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -0,0 +1,172 @@
+import os
+import time
+import asyncio
+import datetime
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.drift import BaselineSketch
+from sensorFaultDetection.instrumentation import measure
+from sensorFaultDetection.utils import write_yaml_file
+from sensorFaultDetection.entity.config_entity import DriftMonitorConfig
+
+
+class OnlineDriftMonitor:
+    """
+    checks the rows sent to the online prediction endpoint for drift against the baseline of the train set
+
+    The rows are binned on the knots of the BaselineSketch as they arrive, into a histogram per column for
+    every `slide_seconds` bucket. A window is the sum of the last `window_seconds / slide_seconds` buckets,
+    tumbling windows have a single bucket. When a bucket ends the drift report of its window is computed
+    from the histograms, the same as `BaselineSketch.report_from_histograms` of all its rows, and written
+    if the window has at least `min_rows` rows. Memory is fixed by the number of columns, knots and
+    buckets, whatever the traffic, and a request costs O(rows x columns) to add. Bucket ends are aligned
+    to multiples of `slide_seconds`, e.g. every full hour.
+    Args:
+        config (DriftMonitorConfig): drift monitor config
+        get_baseline (callable): returns the current BaselineSketch, the windows start over when it changes
+        on_drift (callable): optional, called without arguments when at least `retrain_drifted_columns_ratio`
+            of the columns of a window drifted, e.g. `TrainingJobRunner.submit`
+        clock (callable): optional, current time in seconds since the epoch
+    """
+    def __init__(self, config: DriftMonitorConfig, get_baseline, on_drift=None, clock=time.time):
+        if config.window_seconds % config.slide_seconds != 0:
+            raise ValueError(f'window of {config.window_seconds}s is not a multiple of the slide of {config.slide_seconds}s!')
+        self.config = config
+        self.get_baseline = get_baseline
+        self.on_drift = on_drift
+        self.clock = clock
+        self.number_of_buckets = config.window_seconds // config.slide_seconds
+        self.lock = threading.Lock()
+        # reports are written one at a time, they are written to the same latest report file
+        self.report_lock = threading.Lock()
+        # end of the newest window written to the latest report file
+        self.last_window_end = None
+        self.baseline = None
+        self.bucket_end = None
+        self.task = None
+
+    def reset(self, baseline: BaselineSketch, now: float) -> None:
+        # counts of the current bucket, of the closed buckets of the window and their sum
+        shape = (len(baseline.columns), baseline.values.shape[1] + 1)
+        self.baseline = baseline
+        self.bucket = (np.zeros(shape, dtype=np.int64), np.zeros(shape, dtype=np.int64), 0)
+        self.buckets = deque()
+        self.window_le = np.zeros(shape, dtype=np.int64)
+        self.window_lt = np.zeros(shape, dtype=np.int64)
+        self.window_rows = 0
+        self.bucket_end = (now // self.config.slide_seconds + 1) * self.config.slide_seconds
+
+    def rotate(self, now: float) -> list:
+        """
+        closes the buckets that ended before `now`, must be called with the lock held
+        Returns:
+            list: (window end, le, lt, rows, baseline) of every window to report
+        """
+        windows = []
+        if self.bucket_end is None:
+            return windows
+        if now >= self.bucket_end + self.config.window_seconds:
+            # no rows for a whole window, the last window with rows is still reported
+            self.close_bucket(windows)
+            self.reset(self.baseline, now)
+            return windows
+        while now >= self.bucket_end:
+            self.close_bucket(windows)
+        return windows
+
+    def close_bucket(self, windows: list) -> None:
+        le, lt, rows = self.bucket
+        self.buckets.append(self.bucket)
+        self.window_le += le
+        self.window_lt += lt
+        self.window_rows += rows
+        if len(self.buckets) > self.number_of_buckets:
+            old_le, old_lt, old_rows = self.buckets.popleft()
+            self.window_le -= old_le
+            self.window_lt -= old_lt
+            self.window_rows -= old_rows
+        if self.window_rows >= self.config.min_rows:
+            windows.append((self.bucket_end, self.window_le.copy(), self.window_lt.copy(), self.window_rows, self.baseline))
+        self.bucket = (np.zeros_like(le), np.zeros_like(lt), 0)
+        self.bucket_end += self.config.slide_seconds
+
+    def update(self, dataframe: pd.DataFrame) -> None:
+        """
+        adds the rows of a prediction request or micro-batch to the current bucket, errors are logged
+        and not raised, so monitoring never fails a prediction
+        Args:
+            dataframe (pd.DataFrame): rows that were predicted, must contain the columns of the baseline
+        """
+        try:
+            baseline = self.get_baseline()
+            # the rows of the endpoint already have the columns of the baseline, selecting them again takes longer
+            if list(dataframe.columns) != baseline.columns:
+                dataframe = dataframe[baseline.columns]
+            current = dataframe.to_numpy(dtype=np.float64, na_value=np.nan)
+            with self.lock:
+                now = self.clock()
+                if baseline is not self.baseline:
+                    self.reset(baseline, now)
+                windows = self.rotate(now)
+                le, lt, rows = self.bucket
+                baseline.add_to_histograms(le, lt, current)
+                self.bucket = (le, lt, rows + len(current))
+            self.report(windows)
+        except Exception as e:
+            logging.info(f'WARNING: drift monitor could not be updated! {e}')
+
+    def check(self) -> None:
+        # reports the windows that ended without a request after them
+        try:
+            with self.lock:
+                windows = self.rotate(self.clock())
+            self.report(windows)
+        except Exception as e:
+            logging.info(f'WARNING: drift monitor could not be checked! {e}')
+
+    def report(self, windows: list) -> None:
+        # the baseline the window was binned on, another thread may already have loaded a new one
+        for window_end, le, lt, rows, baseline in windows:
+            with self.report_lock, measure('drift_monitor.report', rows= rows, columns= len(baseline.columns)):
+                status, drift_report = baseline.report_from_histograms(le, lt, self.config.pvalue_threshold)
+                name = datetime.datetime.fromtimestamp(window_end).strftime('%Y-%m-%d_%H-%M-%S')
+                write_yaml_file(path= os.path.join(self.config.report_dir, f'{name}.yaml'), content= drift_report)
+                # windows are collected under the lock but reported after it by several threads, a window
+                # reported after a newer one neither replaces the latest report nor triggers retraining
+                is_latest = self.last_window_end is None or window_end > self.last_window_end
+                if is_latest:
+                    self.last_window_end = window_end
+                    write_yaml_file(path= self.config.report_file, content= drift_report, replace= True)
+            drifted_columns = sum(column_report['drift_status'] for column_report in drift_report.values())
+            if status:
+                logging.info(f'NO data drift issue in the {rows} rows of the window ending at {name}!')
+            else:
+                logging.info(f'WARNING: {drifted_columns} columns drifted in the {rows} rows of the window ending at {name}, '
+                             f'check {self.config.report_file}')
+            if not is_latest:
+                continue
+            if self.on_drift is not None and drifted_columns >= self.config.retrain_drifted_columns_ratio * len(drift_report):
+                # a job already running is not started twice, the windows start over with the baseline of the new model
+                logging.info(f'Retraining is triggered by data drift: {self.on_drift()}')
+
+    def start(self):
+        # must be called from the running event loop, windows are then reported on time without traffic
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            bucket_end = self.bucket_end or self.clock() + self.config.slide_seconds
+            await asyncio.sleep(max(bucket_end - self.clock(), 0) + 1)
+            await loop.run_in_executor(None, self.check)
@@ -2,6 +2,20 @@ from pathlib import Path
 from dataclasses import dataclass
 
 
+@dataclass(frozen=True)
+class OutOfCoreConfig:
+    enabled: bool
+    chunk_size: int
+    sample_size: int
+    column_block_size: int
+
+@dataclass(frozen=True)
+class DataBalancingConfig:
+    strategy: str
+    k_neighbors: int
+    n_jobs: int
+    random_state: int
+
 @dataclass(frozen=True)
 class DataIngestionConfig:
     root_dir: Path
@@ -14,6 +28,9 @@ class DataIngestionConfig:
     train_data_file: Path
     test_data_file: Path
     drop_columns: list
+    chunk_size: int
+    schema_columns: list
+    out_of_core: OutOfCoreConfig
 
 @dataclass(frozen=True)
 class DataValidationConfig:
@@ -25,28 +42,76 @@ class DataValidationConfig:
     invalid_train_file: Path
     invalid_test_file: Path    
     drift_report_file: Path
+    drift_baseline_file: Path
     schema_columns: list
     schema_numerical_columns: list    
     pvalue_threshold: float
+    drift_baseline_quantiles: int
+    drift_n_jobs: int
+    out_of_core: OutOfCoreConfig
 
 @dataclass(frozen= True)
 class DataTransformationConfig:
     root_dir: Path  
     train_data_file: Path
     test_data_file: Path  
-    train_npy_file : Path
-    test_npy_file: Path 
+    train_features_file: Path
+    train_labels_file: Path
+    test_features_file: Path
+    test_labels_file: Path
     target_column: str 
     preprocessor_file: Path
+    balancing_report_file: Path
+    data_balancing: DataBalancingConfig
+    out_of_core: OutOfCoreConfig
+
+@dataclass(frozen=True)
+class HyperParameterTuningConfig:
+    enabled: bool
+    number_of_trials: int
+    reduction_factor: int
+    min_estimators: int
+    max_estimators: int
+    early_stopping_rounds: int
+    validation_ratio: float
+    n_jobs: int
+    threads_per_trial: int
+    cpu_hours_budget: float
+    random_state: int
+    search_space: dict
+    log_scale: list
+
+@dataclass(frozen=True)
+class TrainingProfileConfig:
+    tree_method: str
+    n_jobs: int
+    max_bin: int
+    n_estimators: int
+    early_stopping_rounds: int
+    eval_metric: str
+
+@dataclass(frozen=True)
+class ModelBundleConfig:
+    enabled: bool
+    numpy_max_rows: int
+    parity_rows: int
 
 @dataclass
 class ModelTrainerConfig:
     root_dir: Path
-    train_npy_file: Path
-    test_npy_file: Path
+    train_features_file: Path
+    train_labels_file: Path
+    test_features_file: Path
+    test_labels_file: Path
     expected_accuracy_threshold: float
     overfit_underfit_threshold: float
     preprocessor_file: Path
+    model_registry_file: Path
+    training_profile: TrainingProfileConfig
+    hyper_parameter_tuning: HyperParameterTuningConfig
+    data_balancing: DataBalancingConfig
+    out_of_core: OutOfCoreConfig
+    model_bundle: ModelBundleConfig
 
 @dataclass(frozen=True)
 class ModelEvaluationConfig:
@@ -57,21 +122,82 @@ class ModelEvaluationConfig:
     evaluation_report_file: Path
     model_evaluation_changed_threshold: float
     target_column: str
-    saved_model_path: Path
+    saved_model_dir: Path
+    model_registry_file: Path
+    batch_size: int
+    out_of_core: OutOfCoreConfig
+
+@dataclass(frozen=True)
+class S3SyncConfig:
+    max_workers: int
+    multipart_threshold: int
+    multipart_chunksize: int
+    multipart_concurrency: int
 
 @dataclass(frozen=True)
 class PredictionConfig:
     root_dir: Path   
     drift_report_file: Path
     best_model_dir: Path  
-    valid_train_file: Path  
+    model_registry_file: Path
+    drift_baseline_file: Path  
     schema_numerical_columns: list
     target_column: str
     pvalue_threshold: float
+    prediction_file: Path
+    schema_columns: list
+    chunk_size: int
+    s3_sync: S3SyncConfig
+
+@dataclass(frozen=True)
+class DriftMonitorConfig:
+    root_dir: Path
+    report_file: Path
+    report_dir: Path
+    enabled: bool
+    window_seconds: int
+    slide_seconds: int
+    min_rows: int
+    pvalue_threshold: float
+    retrain_on_drift: bool
+    retrain_drifted_columns_ratio: float
+
+@dataclass(frozen=True)
+class BatchPredictionConfig:
+    root_dir: Path
+    output_dir: str
+    drift_report_dir: Path
+    download_dir: Path
+    report_file: Path
+    n_jobs: int
+    threads_per_worker: int
+    output_format: str
+    prediction: PredictionConfig
+
+@dataclass(frozen=True)
+class InstrumentationConfig:
+    run_report_file: Path
+
+@dataclass(frozen=True)
+class StageCacheConfig:
+    manifest_file: Path
+    enabled: bool
+
+@dataclass(frozen=True)
+class TrainingJobConfig:
+    root_dir: Path
+    lock_file: Path
+
+@dataclass(frozen=True)
+class ArtifactStoreConfig:
+    objects_prefix: str
+    runs_prefix: str
 
 @dataclass(frozen=True)
 class TrainingPipelineConfig:
     artifacts_dir: Path
     saved_model_dir: Path
-    training_bucket_name: str   
+    training_bucket_name: str
+    s3_sync: S3SyncConfig
+    artifact_store: ArtifactStoreConfig   
    
@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+import datetime
+import threading
+import yaml
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.utils import write_yaml_file
+
+
+@dataclass
+class StepMetrics:
+    step: str
+    started_at: str
+    status: str = 'running'
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    rows: int = None
+    columns: int = None
+    bytes_read: int = 0
+    bytes_written: int = 0
+
+
+def reset_peak_rss() -> bool:
+    # linux resets the VmHWM high water mark of the process, returns False where it is not supported
+    try:
+        with open('/proc/self/clear_refs', 'w') as file_obj:
+            file_obj.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss() -> int:
+    """
+    Returns:
+        int: peak resident memory of the process in bytes since the last reset_peak_rss()
+    """
+    try:
+        with open('/proc/self/status') as file_obj:
+            for line in file_obj:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+
+class MetricsRegistry:
+    """
+    collects the metrics of measured steps in this process
+
+    Every finished step is kept as a record for the run report (the latest `max_records`)
+    and added to per step totals, which the prediction server exposes on /metrics in the
+    Prometheus text format. The cpu time is the one of the whole process, steps running
+    concurrently in threads count each other's cpu time.
+    """
+    COUNTERS = [
+        ('calls_total', 'number of finished calls'),
+        ('failures_total', 'number of calls that raised'),
+        ('wall_seconds_total', 'wall time spent in the step'),
+        ('cpu_seconds_total', 'process cpu time spent in the step'),
+        ('rows_total', 'rows processed'),
+        ('bytes_read_total', 'bytes read'),
+        ('bytes_written_total', 'bytes written'),
+    ]
+    GAUGES = [
+        ('last_wall_seconds', 'wall time of the last call'),
+        ('peak_rss_bytes', 'highest peak resident memory observed at the end of a call'),
+    ]
+
+    def __init__(self, max_records: int=10000):
+        self.lock = threading.Lock()
+        self.records = deque(maxlen=max_records)
+        self.totals = dict()
+
+    def record(self, metrics: StepMetrics) -> None:
+        with self.lock:
+            self.records.append(metrics)
+            totals = self.totals.setdefault(metrics.step, {name: 0 for name, _ in self.COUNTERS + self.GAUGES})
+            totals['calls_total'] += 1
+            totals['failures_total'] += int(metrics.status == 'failed')
+            totals['wall_seconds_total'] += metrics.wall_seconds
+            totals['cpu_seconds_total'] += metrics.cpu_seconds
+            totals['rows_total'] += metrics.rows or 0
+            totals['bytes_read_total'] += metrics.bytes_read
+            totals['bytes_written_total'] += metrics.bytes_written
+            totals['last_wall_seconds'] = metrics.wall_seconds
+            totals['peak_rss_bytes'] = max(totals['peak_rss_bytes'], metrics.peak_rss_bytes)
+
+    def get_records(self, since: str=None) -> list:
+        # since: isoformat time, only steps started at or after it
+        with self.lock:
+            return [asdict(metrics) for metrics in self.records if since is None or metrics.started_at >= since]
+
+    def write_run_report(self, path: str, since: str=None, **run_info) -> None:
+        """
+        writes the recorded steps started since `since` with the optional run_info to a yaml file
+        """
+        try:
+            write_yaml_file(path= path, content= {**run_info, 'steps': self.get_records(since)}, replace= True)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def to_prometheus(self, prefix: str='sensor_step') -> str:
+        with self.lock:
+            totals = {step: dict(values) for step, values in self.totals.items()}
+        lines = []
+        for name, description in self.COUNTERS + self.GAUGES:
+            metric = f'{prefix}_{name}'
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {"counter" if name.endswith("_total") else "gauge"}')
+            for step, values in sorted(totals.items()):
+                lines.append(f'{metric}{{step="{escape_label(step)}"}} {values[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def run_report_to_prometheus(path: str, prefix: str='sensor_training_step') -> str:
+    """
+    gauges of every step of the last training run, which runs in its own process, read from its run report
+    Returns:
+        str: Prometheus text format, empty if there is no run report yet
+    """
+    if not os.path.exists(path):
+        return ''
+    # read without read_yaml, which logs every read, as it is read on every scrape
+    with open(path) as yaml_file:
+        steps = (yaml.safe_load(yaml_file) or {}).get('steps') or []
+    lines = []
+    for name in ['wall_seconds', 'cpu_seconds', 'peak_rss_bytes', 'rows', 'bytes_read', 'bytes_written']:
+        metric = f'{prefix}_{name}'
+        lines.append(f'# HELP {metric} {name.replace("_", " ")} of the step in the last training run')
+        lines.append(f'# TYPE {metric} gauge')
+        for step in steps:
+            lines.append(f'{metric}{{step="{escape_label(step["step"])}",status="{step["status"]}"}} {step[name] or 0}')
+    return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+
+@contextmanager
+def measure(step: str, rows: int=None, columns: int=None, reset_peak: bool=False):
+    """
+    measures wall time, cpu time and peak memory of the block and records it in METRICS
+    Args:
+        step (str): name of the step, e.g. `prediction.read_data`
+        rows, columns (int): optional, size of the data processed, can also be set on the yielded record
+        reset_peak (bool): resets the process memory high water mark first, so the peak is the one
+            of this step, for steps that do not run concurrently with others e.g. training stages
+    Yields:
+        StepMetrics: record of the step, rows, columns, bytes_read and bytes_written can be set inside the block
+    """
+    metrics = StepMetrics(step= step, started_at= datetime.datetime.now().isoformat(), rows= rows, columns= columns)
+    if reset_peak:
+        reset_peak_rss()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield metrics
+        metrics.status = 'completed' if metrics.status == 'running' else metrics.status
+    except BaseException:
+        metrics.status = 'failed'
+        raise
+    finally:
+        metrics.wall_seconds = round(time.perf_counter() - start_wall, 6)
+        metrics.cpu_seconds = round(time.process_time() - start_cpu, 6)
+        metrics.peak_rss_bytes = get_peak_rss()
+        METRICS.record(metrics)
+
+
+def get_files_size(paths: list) -> int:
+    # total size of the existing files, used for bytes read and written by a stage
+    return sum(os.path.getsize(path) for path in paths if path is not None and os.path.isfile(path))
@@ -4,12 +4,20 @@ from datetime import datetime
 
 LOG_FILE = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
 logs_path = os.path.join(os.getcwd(),'logs')
-os.makedirs(logs_path,exist_ok=True)
 
 LOG_FILE_PATH = os.path.join(logs_path, LOG_FILE)
+
+
+class DelayedFileHandler(logging.FileHandler):
+    # the logs directory and the file are created with the first record instead of at import
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
 # over-writting the log files
 logging.basicConfig(
-    filename = LOG_FILE_PATH,
+    handlers = [DelayedFileHandler(LOG_FILE_PATH, delay=True)],
     format = '[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
     )
\ No newline at end of file
@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import sqlite3
+import datetime
+from pathlib import Path
+from contextlib import closing
+from sensorFaultDetection.exception import CustomException
+
+
+class ModelRegistry:
+    """
+    local index of the trained models and the `latest` and `best` pointers to them
+
+    Every trained model is registered once with its id (the timestamp of its training run),
+    path, metrics and the hash of its preprocessor. The trainer moves the `latest` pointer,
+    the evaluator the `best` pointer, each in a single sqlite transaction, so resolving a
+    model is one primary key lookup and concurrent readers e.g. prediction workers never see
+    a half-written update. The database is in WAL mode, readers do not block the writer.
+    """
+    LATEST = 'latest'
+    BEST = 'best'
+
+    def __init__(self, registry_file: Path):
+        self.registry_file = registry_file
+        os.makedirs(os.path.dirname(registry_file) or '.', exist_ok=True)
+        with closing(self.connect()) as connection, connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS models (model_id TEXT PRIMARY KEY, model_path TEXT NOT NULL, '
+                               'preprocessor_hash TEXT, metrics TEXT NOT NULL, registered_at TEXT NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS pointers (name TEXT PRIMARY KEY, model_id TEXT NOT NULL, '
+                               'model_path TEXT NOT NULL, updated_at TEXT NOT NULL)')
+
+    def connect(self) -> sqlite3.Connection:
+        # a writer holds the database for milliseconds, others wait for it instead of failing
+        return sqlite3.connect(self.registry_file, timeout=30)
+
+    def register_model(self, model_id: str, model_path: Path, metrics: dict, preprocessor_hash: str=None) -> None:
+        """
+        adds a trained model and moves the latest pointer to it
+        Args:
+            model_id (str): timestamp of the training run
+            model_path (Path): pickled SensorModel
+            metrics (dict): e.g. train and test f1-score
+            preprocessor_hash (str): sha256 of the preprocessor the model was trained with
+        """
+        try:
+            now = datetime.datetime.now().isoformat()
+            with closing(self.connect()) as connection, connection:
+                connection.execute('INSERT OR REPLACE INTO models VALUES (?, ?, ?, ?, ?)',
+                                   (model_id, str(model_path), preprocessor_hash, json.dumps(metrics), now))
+                connection.execute('INSERT OR REPLACE INTO pointers VALUES (?, ?, ?, ?)',
+                                   (self.LATEST, model_id, str(model_path), now))
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def set_pointer(self, name: str, model_id: str, model_path: Path, metrics: dict=None) -> None:
+        """
+        points `name` to a registered model, e.g. the best model at its deployed path
+        Args:
+            metrics (dict): optional, merged into the metrics of the model
+        """
+        try:
+            with closing(self.connect()) as connection, connection:
+                if metrics is not None:
+                    row = connection.execute('SELECT metrics FROM models WHERE model_id = ?', (model_id,)).fetchone()
+                    if row is not None:
+                        connection.execute('UPDATE models SET metrics = ? WHERE model_id = ?',
+                                           (json.dumps({**json.loads(row[0]), **metrics}), model_id))
+                connection.execute('INSERT OR REPLACE INTO pointers VALUES (?, ?, ?, ?)',
+                                   (name, model_id, str(model_path), datetime.datetime.now().isoformat()))
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def get_pointer(self, name: str) -> dict:
+        """
+        Returns:
+            dict: model_id, model_path and updated_at of the pointer, None if it is not set
+        """
+        try:
+            with closing(self.connect()) as connection:
+                row = connection.execute('SELECT model_id, model_path, updated_at FROM pointers WHERE name = ?',
+                                         (name,)).fetchone()
+            if row is None:
+                return None
+            return {'model_id': row[0], 'model_path': row[1], 'updated_at': row[2]}
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def get_model(self, model_id: str) -> dict:
+        try:
+            with closing(self.connect()) as connection:
+                row = connection.execute('SELECT model_id, model_path, preprocessor_hash, metrics, registered_at '
+                                         'FROM models WHERE model_id = ?', (model_id,)).fetchone()
+            if row is None:
+                return None
+            return {'model_id': row[0], 'model_path': row[1], 'preprocessor_hash': row[2],
+                    'metrics': json.loads(row[3]), 'registered_at': row[4]}
+        except Exception as e:
+            raise CustomException(e, sys)
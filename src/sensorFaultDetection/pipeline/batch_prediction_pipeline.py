@@ -0,0 +1,31 @@
+import sys
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.config.configuration import ConfigurationManager
+from sensorFaultDetection.components.batch_prediction import BatchPrediction
+
+
+STAGE_NAME = "Batch Prediction Pipeline"
+
+class BatchPredictionPipeline:
+    def __init__(self, input_path: str, output_dir: str=None):
+        self.input_path = input_path
+        self.output_dir = output_dir
+
+    def main(self) -> dict:
+        config = ConfigurationManager()
+        batch_prediction_config = config.get_batch_prediction_config()
+        batch_prediction = BatchPrediction(input_path=self.input_path, config=batch_prediction_config)
+        return batch_prediction.initiate_batch_prediction(self.output_dir)
+
+
+# e.g. `python -m sensorFaultDetection.pipeline.batch_prediction_pipeline s3://bucket/trucks [s3://bucket/predictions]`
+if __name__ == "__main__":
+    try:
+        logging.info(f'>>>>>>> stage {STAGE_NAME} started <<<<<<<<')
+        obj = BatchPredictionPipeline(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+        obj.main()
+        logging.info(f'>>>>>>> stage {STAGE_NAME} completed <<<<<<<<')
+
+    except Exception as e:
+        raise CustomException(e, sys)
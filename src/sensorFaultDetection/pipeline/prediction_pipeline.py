@@ -1,20 +1,146 @@
 import sys
+import json
+import asyncio
+import numpy as np
+import pandas as pd
 from sensorFaultDetection.logger import logging
 from sensorFaultDetection.exception import CustomException
 from sensorFaultDetection.config.configuration import ConfigurationManager
 from sensorFaultDetection.components.prediction import Prediction
+from sensorFaultDetection.entity.config_entity import PredictionConfig
 
 
 STAGE_NAME = "Prediction Pipeline"
 
 class PredictionPipeline:
-    def __init__(self, filename):
+    def __init__(self, filename, config: PredictionConfig=None):
         self.filename = filename
-        
+        # a long-lived server passes the config it created at startup, so no yaml file is read per request
+        self.config = config
+
+    def get_prediction_config(self) -> PredictionConfig:
+        if self.config is None:
+            config = ConfigurationManager()
+            self.config = config.get_prediction_config()
+        return self.config
+
+    def warm_up(self):
+        # load the best model and the drift baseline into the process cache before the first request
+        try:
+            prediction = Prediction(filename=self.filename, config=self.get_prediction_config())
+            prediction.get_model()
+            prediction.get_drift_baseline()
+            logging.info('Best model and drift baseline are loaded for prediction!')
+        except Exception as e:
+            raise CustomException(e, sys)
 
     def predict(self):
-        config = ConfigurationManager()
-        prediction_config = config.get_prediction_config()
+        prediction_config = self.get_prediction_config()
         prediction = Prediction(filename=self.filename, config=prediction_config)
         df = prediction.initiate_prediction()
-        return df
\ No newline at end of file
+        return df
+
+    def predict_in_batches(self, output_path: str=None) -> dict:
+        # streams files larger than memory through the model, the predictions are written instead of returned
+        prediction = Prediction(filename=self.filename, config=self.get_prediction_config())
+        return prediction.initiate_batch_prediction(output_path)
+
+
+def read_request_body(body: bytes, content_type: str) -> pd.DataFrame:
+    """
+    parses sensor rows sent to the online prediction endpoint
+    Args:
+        body (bytes): request body, an Arrow IPC stream or JSON
+        content_type (str): `application/vnd.apache.arrow.stream` for Arrow, JSON otherwise
+    Returns:
+        pd.DataFrame: one row per record, JSON is either a list of records or {"rows": [...]}
+    """
+    try:
+        if 'arrow' in content_type:
+            import pyarrow as pa
+
+            return pa.ipc.open_stream(body).read_pandas()
+
+        payload = json.loads(body)
+        rows = payload['rows'] if isinstance(payload, dict) else payload
+        return pd.DataFrame.from_records(rows)
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+class MicroBatcher:
+    """
+    coalesces concurrent online prediction requests into batches, so the model is called once per
+    batch instead of once per request
+    Args:
+        predict (callable): blocking function mapping a dataframe to one prediction per row
+        max_batch_size (int): maximum number of rows in one model call
+        max_latency_ms (float): how long the first request of a batch waits for others to join
+        on_batch (callable): optional, called with the rows of every predicted batch in a worker thread
+            after the predictions are returned, e.g. `OnlineDriftMonitor.update`
+    """
+    def __init__(self, predict, max_batch_size: int, max_latency_ms: float, on_batch=None):
+        self.predict_fn = predict
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.queue = None
+        self.task = None
+
+    def start(self):
+        # must be called from the running event loop, e.g. an app startup hook
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def predict(self, df: pd.DataFrame) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((df, future))
+        return await future
+
+    async def collect_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        number_of_rows = len(batch[0][0])
+        deadline = loop.time() + self.max_latency
+        while number_of_rows < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            number_of_rows += len(item[0])
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect_batch()
+            frames = [df for df, _ in batch]
+            try:
+                # the model runs in a worker thread so the event loop keeps accepting requests
+                df = pd.concat(frames, ignore_index=True)
+                y_pred = await loop.run_in_executor(None, self.predict_fn, df)
+                offsets = np.cumsum([len(df) for df in frames])[:-1]
+                for (_, future), predictions in zip(batch, np.split(np.asarray(y_pred), offsets)):
+                    if not future.done():
+                        future.set_result(predictions)
+                if self.on_batch is not None:
+                    # not awaited, the next batch is collected meanwhile
+                    loop.run_in_executor(None, self.on_batch, df)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            logging.info(f'Predicted a batch of {len(batch)} requests with {sum(len(df) for df in frames)} rows!')
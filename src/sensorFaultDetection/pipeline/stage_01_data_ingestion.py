@@ -1,8 +1,10 @@
 import sys
+from dataclasses import asdict
 from sensorFaultDetection.logger import logging
 from sensorFaultDetection.exception import CustomException
 from sensorFaultDetection.config.configuration import ConfigurationManager
 from sensorFaultDetection.components.data_ingestion import DataIngestion
+from sensorFaultDetection.instrumentation import measure
 
 
 STAGE_NAME = "Data Ingestion Stage"
@@ -15,8 +17,25 @@ class DataIngestionPipeline:
         config = ConfigurationManager()
         data_ingestion_config = config.get_data_ingestion_config()
         data_ingestion = DataIngestion(config=data_ingestion_config)
-        data_ingestion.dowload_file()
-        data_ingestion.train_test_creation()
+        with measure('data_ingestion.download'):
+            data_ingestion.dowload_file()
+        with measure('data_ingestion.train_test_split'):
+            data_ingestion.train_test_creation()
+
+    def get_cache_inputs(self) -> dict:
+        config = ConfigurationManager()
+        data_ingestion_config = config.get_data_ingestion_config()
+        data_ingestion = DataIngestion(config=data_ingestion_config)
+        params = asdict(data_ingestion_config)
+        # rotating credentials does not change the data
+        del params['s3_key'], params['s3_secret_key']
+        params['s3_etag'] = data_ingestion.get_source_etag()
+        return {'params': params, 'files': []}
+
+    def get_outputs(self) -> list:
+        config = ConfigurationManager()
+        data_ingestion_config = config.get_data_ingestion_config()
+        return [data_ingestion_config.train_data_file, data_ingestion_config.test_data_file]
 
 
 if __name__ == "__main__":    
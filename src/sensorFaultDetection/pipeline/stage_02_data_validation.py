@@ -1,4 +1,6 @@
 import sys
+import os
+from dataclasses import asdict
 from sensorFaultDetection.logger import logging
 from sensorFaultDetection.exception import CustomException
 from sensorFaultDetection.config.configuration import ConfigurationManager
@@ -17,6 +19,21 @@ class DataValidationPipeline:
         data_validation = DataValidation(config=data_validation_config)
         data_validation.initiate_data_validation()
 
+    def get_cache_inputs(self) -> dict:
+        config = ConfigurationManager()
+        data_validation_config = config.get_data_validation_config()
+        return {'params': asdict(data_validation_config),
+                'files': [data_validation_config.train_data_file, data_validation_config.test_data_file]}
+
+    def get_outputs(self) -> list:
+        config = ConfigurationManager()
+        data_validation_config = config.get_data_validation_config()
+        # valid or invalid sets are written depending on the drift check
+        outputs = [data_validation_config.drift_report_file, data_validation_config.drift_baseline_file,
+                   data_validation_config.valid_train_file, data_validation_config.valid_test_file,
+                   data_validation_config.invalid_train_file, data_validation_config.invalid_test_file]
+        return [path for path in outputs if os.path.exists(path)]
+
 
 if __name__ == "__main__":    
     try:        
@@ -1,8 +1,8 @@
 import sys
+from dataclasses import asdict
 from sensorFaultDetection.logger import logging
 from sensorFaultDetection.exception import CustomException
 from sensorFaultDetection.config.configuration import ConfigurationManager
-from sensorFaultDetection.components.data_transformation import DataTransformation
 
 
 STAGE_NAME = "Data Transformation Stage"
@@ -12,11 +12,27 @@ class DataTransformationPipeline:
         pass
 
     def main(self):
+        # scikit-learn is imported when the stage runs, not when a cached run skips it
+        from sensorFaultDetection.components.data_transformation import DataTransformation
+
         config = ConfigurationManager()
         data_transformation_config = config.get_data_transformation_config()
         data_transformation = DataTransformation(config=data_transformation_config)
         data_transformation.initiate_data_transformation()
 
+    def get_cache_inputs(self) -> dict:
+        config = ConfigurationManager()
+        data_transformation_config = config.get_data_transformation_config()
+        return {'params': asdict(data_transformation_config),
+                'files': [data_transformation_config.train_data_file, data_transformation_config.test_data_file]}
+
+    def get_outputs(self) -> list:
+        config = ConfigurationManager()
+        data_transformation_config = config.get_data_transformation_config()
+        return [data_transformation_config.train_features_file, data_transformation_config.train_labels_file,
+                data_transformation_config.test_features_file, data_transformation_config.test_labels_file,
+                data_transformation_config.preprocessor_file, data_transformation_config.balancing_report_file]
+
 
 if __name__ == "__main__":    
     try:        
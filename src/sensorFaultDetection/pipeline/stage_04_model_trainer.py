@@ -1,21 +1,37 @@
 import sys
+from dataclasses import asdict
 from sensorFaultDetection.logger import logging
 from sensorFaultDetection.exception import CustomException
 from sensorFaultDetection.config.configuration import ConfigurationManager
-from sensorFaultDetection.components.model_trainer import ModelTrainer
+from sensorFaultDetection.compiled_model import get_model_files
 
 
 STAGE_NAME = "Model Training Stage"
 
 class ModelTrainerPipeline:
     def __init__(self):
-        pass
+        self.trained_model_path = None
 
     def main(self):
+        # xgboost is imported when the stage runs, not when a cached run skips it
+        from sensorFaultDetection.components.model_trainer import ModelTrainer
+
         config = ConfigurationManager()
         model_trainer_config = config.get_model_trainer_config()
         model_trainer = ModelTrainer(config=model_trainer_config)
-        model_trainer.initiate_model_trainer()    
+        self.trained_model_path = model_trainer.initiate_model_trainer()    
+
+    def get_cache_inputs(self) -> dict:
+        config = ConfigurationManager()
+        model_trainer_config = config.get_model_trainer_config()
+        return {'params': asdict(model_trainer_config),
+                'files': [model_trainer_config.train_features_file, model_trainer_config.train_labels_file,
+                          model_trainer_config.test_features_file, model_trainer_config.test_labels_file,
+                          model_trainer_config.preprocessor_file]}
+
+    def get_outputs(self) -> list:
+        # every run writes a new timestamped model bundle or pickle
+        return get_model_files(self.trained_model_path)
 
 
 if __name__ == "__main__":    
@@ -1,8 +1,11 @@
 import sys
+from dataclasses import asdict
 from sensorFaultDetection.logger import logging
 from sensorFaultDetection.exception import CustomException
 from sensorFaultDetection.config.configuration import ConfigurationManager
-from sensorFaultDetection.components.model_evaluation import ModelEvaluation
+from sensorFaultDetection.components.model_evaluation import ModelEvaluation, ModelResolver
+from sensorFaultDetection.model_registry import ModelRegistry
+from sensorFaultDetection.compiled_model import get_model_path, get_model_files
 
 
 STAGE_NAME = "Model Evaluation Stage"
@@ -19,6 +22,21 @@ class ModelEvaluationPipeline:
         model_evaluation.initiate_model_evaluation() 
         ModelEvaluationPipeline.is_model_accepted =  model_evaluation.is_model_accepted  
 
+    def get_cache_inputs(self) -> dict:
+        config = ConfigurationManager()
+        model_evaluation_config = config.get_model_evaluation_config()
+        model_resolver = ModelResolver(model_evaluation_config.trained_model_path, model_evaluation_config.root_dir,
+                                       ModelRegistry(model_evaluation_config.model_registry_file))
+        latest_model_path = model_resolver.get_latest_model_path(model_evaluation_config.trained_model_path)
+        return {'params': asdict(model_evaluation_config),
+                'files': [model_evaluation_config.valid_train_file, model_evaluation_config.valid_test_file]
+                         + get_model_files(latest_model_path)}
+
+    def get_outputs(self) -> list:
+        config = ConfigurationManager()
+        model_evaluation_config = config.get_model_evaluation_config()
+        return [model_evaluation_config.evaluation_report_file] + get_model_files(get_model_path(model_evaluation_config.saved_model_dir))
+
 
 if __name__ == "__main__":    
     try:        
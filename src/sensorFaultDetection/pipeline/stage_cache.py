@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import hashlib
+from pathlib import Path
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.utils import read_yaml, write_yaml_file, get_file_hash
+from sensorFaultDetection.instrumentation import measure, get_files_size
+from sensorFaultDetection.entity.config_entity import StageCacheConfig
+
+
+class StageCache:
+    """
+    skips pipeline stages whose inputs did not change since their last successful run
+
+    Every stage pipeline describes its inputs with `get_cache_inputs()`, a dict with the
+    settings it depends on under 'params' and the upstream artifacts it reads under 'files',
+    and its artifacts with `get_outputs()`. The fingerprint of a stage is the sha256 of its
+    params and the content hashes of its files. It is stored in `manifest_file` together with
+    the hashes of the outputs once the stage completes. A stage is skipped when its fingerprint
+    matches and its outputs are unchanged; once a stage runs, every later stage runs as well.
+    """
+    def __init__(self, config: StageCacheConfig):
+        self.config = config
+        self.is_upstream_changed = False
+        if os.path.exists(self.config.manifest_file):
+            self.manifest = read_yaml(self.config.manifest_file).to_dict()
+        else:
+            self.manifest = {'stages': {}, 'files': {}}
+
+    def save_manifest(self) -> None:
+        write_yaml_file(path= self.config.manifest_file, content= self.manifest, replace= True)
+
+    def get_file_hash(self, path: Path) -> str:
+        # content hashes are reused while the size and modified time of a file are unchanged
+        if path is None or not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        cached = self.manifest['files'].get(str(path))
+        if cached is not None and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+
+        sha256 = get_file_hash(path)
+        self.manifest['files'][str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        return sha256
+
+    def get_fingerprint(self, cache_inputs: dict) -> str:
+        content = {
+            'params': cache_inputs.get('params', {}),
+            'files': {str(path): self.get_file_hash(path) for path in cache_inputs.get('files', [])}
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_stage_up_to_date(self, stage_name: str, fingerprint: str) -> bool:
+        stage = self.manifest['stages'].get(stage_name)
+        if stage is None or stage['fingerprint'] != fingerprint:
+            return False
+        return all(self.get_file_hash(path) == sha256 for path, sha256 in stage['outputs'].items())
+
+    @staticmethod
+    def run_measured(stage_name: str, stage_obj: object, cache_inputs: dict) -> None:
+        # timing, peak memory and the size of the input and output artifacts go to the run report
+        with measure(stage_name, reset_peak=True) as metrics:
+            metrics.bytes_read = get_files_size(cache_inputs.get('files', []))
+            stage_obj.main()
+            metrics.bytes_written = get_files_size(stage_obj.get_outputs())
+
+    def run_stage(self, stage_name: str, stage_obj: object) -> bool:
+        """
+        runs the stage unless it is up to date
+        Args:
+            stage_name (str): key of the stage in the manifest
+            stage_obj (object): stage pipeline with main(), get_cache_inputs() and get_outputs()
+        Returns:
+            bool: True if the stage was run, False if it was skipped
+        """
+        try:
+            cache_inputs = stage_obj.get_cache_inputs()
+            if not self.config.enabled:
+                self.run_measured(stage_name, stage_obj, cache_inputs)
+                return True
+
+            fingerprint = self.get_fingerprint(cache_inputs)
+            if not self.is_upstream_changed and self.is_stage_up_to_date(stage_name, fingerprint):
+                with measure(stage_name) as metrics:
+                    metrics.status = 'skipped'
+                logging.info(f'{stage_name} is skipped, its inputs did not change since the last run!')
+                return False
+
+            # the stage is forgotten before it runs, so a failed run is not taken as up to date
+            self.is_upstream_changed = True
+            self.manifest['stages'].pop(stage_name, None)
+            self.save_manifest()
+
+            self.run_measured(stage_name, stage_obj, cache_inputs)
+
+            self.manifest['stages'][stage_name] = {
+                'fingerprint': fingerprint,
+                'outputs': {str(path): self.get_file_hash(path) for path in stage_obj.get_outputs()}
+            }
+            self.save_manifest()
+            return True
+
+        except Exception as e:
+            raise CustomException(e, sys)
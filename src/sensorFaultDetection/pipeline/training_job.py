@@ -0,0 +1,136 @@
+import os
+import sys
+import uuid
+import fcntl
+import datetime
+import threading
+import subprocess
+from pathlib import Path
+from sensorFaultDetection.logger import logging
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.utils import read_yaml, write_yaml_file
+from sensorFaultDetection.config.configuration import ConfigurationManager
+from sensorFaultDetection.entity.config_entity import TrainingJobConfig
+
+
+class TrainingJobRunner:
+    """
+    runs the training pipeline as a background job in a separate process
+
+    Only one training job runs at a time across all app workers and processes: the job holds
+    an exclusive flock on `lock_file`, which the kernel releases when the job process exits,
+    including when it crashes. Status and progress of every job are kept in
+    `<root_dir>/<job_id>.yaml`, so any worker can answer status requests.
+    """
+    def __init__(self, config: TrainingJobConfig):
+        self.config = config
+
+    def get_status_file(self, job_id: str) -> Path:
+        return os.path.join(self.config.root_dir, f'{job_id}.yaml')
+
+    def get_log_file(self, job_id: str) -> Path:
+        return os.path.join(self.config.root_dir, f'{job_id}.log')
+
+    def update_status(self, job_id: str, **status) -> None:
+        status_file = self.get_status_file(job_id)
+        job_status = read_yaml(status_file).to_dict() if os.path.exists(status_file) else {'job_id': job_id}
+        job_status.update(status)
+        write_yaml_file(path= status_file, content= job_status, replace= True)
+
+    def get_status(self, job_id: str) -> dict:
+        try:
+            status_file = self.get_status_file(job_id)
+            if not os.path.exists(status_file):
+                raise Exception(f'There is no training job with id {job_id}!')
+            job_status = read_yaml(status_file).to_dict()
+            if job_status['status'] in ('queued', 'running') and not self.is_running(job_id):
+                job_status.update(status= 'failed', error= 'The training job process exited unexpectedly!')
+            return job_status
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def is_running(self, job_id: str) -> bool:
+        lock_fd = os.open(self.config.lock_file, os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            return False
+        except BlockingIOError:
+            return self.get_running_job_id() == job_id
+        finally:
+            os.close(lock_fd)
+
+    def get_running_job_id(self) -> str:
+        # the job holding the lock writes its id into the lock file
+        try:
+            with open(self.config.lock_file, 'r') as lock_file:
+                return lock_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def submit(self) -> tuple:
+        """
+        starts a training job unless one is already running
+        Returns:
+            tuple: (job id, True if a new job was started, False if the returned job was already running)
+        """
+        try:
+            lock_fd = os.open(self.config.lock_file, os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(lock_fd)
+                return self.get_running_job_id(), False
+
+            try:
+                job_id = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S_') + uuid.uuid4().hex[:8]
+                os.ftruncate(lock_fd, 0)
+                os.write(lock_fd, job_id.encode())
+                self.update_status(job_id, status= 'queued', stage= None, stage_index= 0, progress= 0.0,
+                                   submitted_at= datetime.datetime.now().isoformat(), error= None)
+
+                # the job process inherits the locked file descriptor and keeps the lock until it exits
+                with open(self.get_log_file(job_id), 'ab') as log_file:
+                    process = subprocess.Popen(
+                        [sys.executable, '-m', 'sensorFaultDetection.pipeline.training_job', job_id],
+                        pass_fds= (lock_fd,), stdout= log_file, stderr= subprocess.STDOUT,
+                        start_new_session= True
+                        )
+            finally:
+                os.close(lock_fd)
+
+            # reap the job process when it finishes so it does not stay a zombie
+            threading.Thread(target= process.wait, daemon= True).start()
+            logging.info(f'Training job {job_id} is started in process {process.pid}!')
+            return job_id, True
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def run(self, job_id: str) -> None:
+        # entry point of the job process
+        from sensorFaultDetection.pipeline.training_pipeline import TrainingPipeline
+
+        def progress_callback(stage_name, stage_index, number_of_stages):
+            self.update_status(job_id, stage= stage_name, stage_index= stage_index,
+                               progress= round(stage_index / (number_of_stages + 1), 2))
+
+        self.update_status(job_id, status= 'running', pid= os.getpid(), started_at= datetime.datetime.now().isoformat())
+        try:
+            training_pipeline = TrainingPipeline()
+            training_pipeline.run_pipeline(progress_callback= progress_callback)
+            self.update_status(job_id, status= 'succeeded', progress= 1.0,
+                               is_new_model_accepted= bool(TrainingPipeline.is_new_model_accepted),
+                               finished_at= datetime.datetime.now().isoformat())
+        except Exception as e:
+            self.update_status(job_id, status= 'failed', error= str(e), finished_at= datetime.datetime.now().isoformat())
+            raise e
+
+
+if __name__ == '__main__':
+    try:
+        config = ConfigurationManager()
+        training_job_runner = TrainingJobRunner(config=config.get_training_job_config())
+        training_job_runner.run(job_id=sys.argv[1])
+    except Exception as e:
+        raise CustomException(e, sys)
@@ -7,8 +7,11 @@ from sensorFaultDetection.pipeline.stage_02_data_validation import DataValidatio
 from sensorFaultDetection.pipeline.stage_03_data_transformation import DataTransformationPipeline
 from sensorFaultDetection.pipeline.stage_04_model_trainer import ModelTrainerPipeline
 from sensorFaultDetection.pipeline.stage_05_model_evaluation import ModelEvaluationPipeline
+from sensorFaultDetection.pipeline.stage_cache import StageCache
+from sensorFaultDetection.instrumentation import METRICS, measure
 from sensorFaultDetection.config.configuration import ConfigurationManager
 from sensorFaultDetection.cloud_storage.s3_syncer import S3Sync
+from sensorFaultDetection.cloud_storage.artifact_store import ArtifactStore
 
 
 
@@ -25,77 +28,93 @@ class TrainingPipeline:
         return training_pipeline_config
 
     
+    def sync_folder_to_s3(self, folder, aws_bucket_url):
+        # unchanged files are skipped, a failed file fails the upload once all others are transferred
+        result = S3Sync(self.config.s3_sync).sync_folder_to_s3(folder= folder, aws_bucket_url= aws_bucket_url)
+        if len(result.errors) > 0:
+            raise Exception(f'{len(result.errors)} files could not be uploaded to {aws_bucket_url}: {result.errors}')
+        return result
+
     def sync_artifact_dir_to_s3(self):
         try:
-            now = datetime.now
-            timestamp = format(now().strftime('%Y-%m-%d_%H:%M:%S'))
-            aws_bucket_url = f's3://{self.config.training_bucket_name}/artifacts/{timestamp}'
-            S3Sync.sync_folder_to_s3(folder= self.config.artifacts_dir, aws_bucket_url= aws_bucket_url)
+            # every run gets its own manifest, only files with a content not stored before are uploaded
+            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            artifact_store = ArtifactStore(self.config.artifact_store, self.config.s3_sync)
+            result = artifact_store.upload_run(folder= self.config.artifacts_dir, bucket= self.config.training_bucket_name,
+                                               run_id= timestamp)
+            if len(result.errors) > 0:
+                raise Exception(f'{len(result.errors)} artifacts could not be uploaded, run {timestamp} is not stored: {result.errors}')
+            return result
         except Exception as e:
             raise CustomException(e, sys)
         
     def sync_saved_model_dir_to_s3(self):
         try:
             aws_bucket_url = f's3://{self.config.training_bucket_name}/{self.config.saved_model_dir}'
-            S3Sync.sync_folder_to_s3(folder= self.config.saved_model_dir, aws_bucket_url= aws_bucket_url)
+            return self.sync_folder_to_s3(folder= self.config.saved_model_dir, aws_bucket_url= aws_bucket_url)
         except Exception as e:
             raise CustomException(e, sys)
     
-    def run_pipeline(self):
+    # stages in the order they run, every stage pipeline reads its config and artifacts on its own
+    stages = [
+        ("Data Ingestion Stage", DataIngestionPipeline),
+        ("Data Validation Stage", DataValidationPipeline),
+        ("Data Transformation Stage", DataTransformationPipeline),
+        ("Model Training Stage", ModelTrainerPipeline),
+        ("Model Evaluation Stage", ModelEvaluationPipeline),
+    ]
+
+    def run_pipeline(self, progress_callback=None):
+        """
+        runs all stages and uploads the artifacts
+        Args:
+            progress_callback (callable): optional, called as progress_callback(stage_name, stage_index, number_of_stages)
+                before every stage and once more with stage_index == number_of_stages before the upload
+        """
+        instrumentation_config = ConfigurationManager().get_instrumentation_config()
+        started_at = datetime.now().isoformat()
         try: 
             self.config = self.setup_config()            
             logging.info(f'>>>>>>> Training Pipeline started <<<<<<<<')
             
             TrainingPipeline.is_pipeline_running = True       
-            STAGE_NAME = "Data Ingestion Stage"
-
-            logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
-            dataIngestion_obj = DataIngestionPipeline()
-            dataIngestion_obj.main()
-            logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<') 
-
-            STAGE_NAME = "Data Validation Stage"
-
-            logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
-            dataValidation_obj = DataValidationPipeline()
-            dataValidation_obj.main()
-            logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
-
-            STAGE_NAME = "Data Transformation Stage"
-
-            logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
-            dataTransformation_obj = DataTransformationPipeline()
-            dataTransformation_obj.main()
-            logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
-
-            STAGE_NAME = "Model Training Stage"
-
-            logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
-            modelTrainer_obj = ModelTrainerPipeline()
-            modelTrainer_obj.main()
-            logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
-
-            STAGE_NAME = "Model Evaluation Stage"
-            logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
-            modelEvaluation_obj = ModelEvaluationPipeline()
-            modelEvaluation_obj.main()            
-            logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<')
+            ModelEvaluationPipeline.is_model_accepted = False
+            TrainingPipeline.is_new_model_accepted = False
+            # unchanged stages are skipped, a changed stage runs together with all stages after it
+            stage_cache = StageCache(config= ConfigurationManager().get_stage_cache_config())
+            for stage_index, (STAGE_NAME, stage_pipeline) in enumerate(self.stages):
+                if progress_callback is not None:
+                    progress_callback(STAGE_NAME, stage_index, len(self.stages))
+
+                logging.info(f'>>>>>>> {STAGE_NAME} started <<<<<<<<')
+                stage_obj = stage_pipeline()
+                stage_cache.run_stage(STAGE_NAME, stage_obj)
+                logging.info(f'>>>>>>> {STAGE_NAME} completed <<<<<<<<') 
+
+            if progress_callback is not None:
+                progress_callback("Artifact Upload", len(self.stages), len(self.stages))
             
-            TrainingPipeline.is_new_model_accepted = modelEvaluation_obj.is_model_accepted
-            if TrainingPipeline.is_new_model_accepted:
-                self.sync_artifact_dir_to_s3()
-                self.sync_saved_model_dir_to_s3()
-                logging.info('The artifacts and model are uploaded in aws s3!')
-                
-            else:
-                self.sync_artifact_dir_to_s3()
-                logging.info('The artifacts are uploaded in aws s3!')  
+            TrainingPipeline.is_new_model_accepted = ModelEvaluationPipeline.is_model_accepted
+            with measure("Artifact Upload") as metrics:
+                metrics.bytes_written = self.sync_artifact_dir_to_s3().bytes_transferred
+                if TrainingPipeline.is_new_model_accepted:
+                    metrics.bytes_written += self.sync_saved_model_dir_to_s3().bytes_transferred
+                    logging.info('The artifacts and model are uploaded in aws s3!')
+                else:
+                    logging.info('The artifacts are uploaded in aws s3!')  
 
             TrainingPipeline.is_pipeline_running = False  
             logging.info(f'>>>>>>> Training Pipeline completed <<<<<<<<') 
         
         except Exception as e:            
+            TrainingPipeline.is_pipeline_running = False
             raise CustomException(e, sys) 
+
+        finally:
+            # the report is also written for a failed run, its last step is the one that failed
+            METRICS.write_run_report(instrumentation_config.run_report_file, since= started_at, started_at= started_at,
+                                     finished_at= datetime.now().isoformat(),
+                                     is_new_model_accepted= bool(TrainingPipeline.is_new_model_accepted))
  
 
 
@@ -1,14 +1,14 @@
 import os
 import sys
 import yaml
+import hashlib
 import pickle
+import tempfile
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from sensorFaultDetection.logger import logging
 from sensorFaultDetection.exception import CustomException
-from sklearn.metrics import ConfusionMatrixDisplay, confusion_matrix, precision_recall_fscore_support
 
 from typing import Any
 from box import ConfigBox
@@ -40,13 +40,20 @@ def read_yaml(path: Path) -> ConfigBox:
 
 def write_yaml_file(path: Path, content: object, replace:bool=False) -> None:
     try:
-        if replace:
-            if os.path.exists(path):
-                os.remove(path)
+        # an existing file is always replaced, `replace` is kept for the callers
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w') as yaml_file:
+        # written to a temporary file of its own next to the target and renamed over it, concurrent readers
+        # see the old or the new file and never a missing or partial one, concurrent writers do not collide
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), prefix=f'.{os.path.basename(path)}.',
+                                         suffix='.tmp', delete=False) as yaml_file:
             yaml.dump(content, yaml_file)
-        logging.info(f'yaml file {yaml_file.name} saved successfully!')
+        try:
+            os.chmod(yaml_file.name, 0o644)
+            os.replace(yaml_file.name, path)
+        except Exception:
+            os.remove(yaml_file.name)
+            raise
+        logging.info(f'yaml file {path} saved successfully!')
 
     except Exception as e:
         raise CustomException(e, sys)        
@@ -69,22 +76,230 @@ def save_numpy_array(path: Path, array: np.array):
         raise CustomException(e, sys)
 
     
-def load_numpy_array(path: Path):
+def load_numpy_array(path: Path, mmap_mode: str=None):
     """
     load numpy array from file
     Args:
         path (str): path to load the file        
+        mmap_mode (str): optional, 'r' maps the file read-only instead of reading it into memory
     """
     try:        
-        with open(path, 'rb') as file_obj:
-            npy_file = np.load(file_obj)
-            logging.info(f'.npy file is loaded successfully from {path}!')
+        # np.load needs the path, not an open file object, to memory-map the array
+        npy_file = np.load(path, mmap_mode=mmap_mode)
+        logging.info(f'.npy file is loaded successfully from {path}!')
         return  npy_file       
 
     except Exception as e:
         raise CustomException(e, sys)
 
 
+def get_arrow_schema(columns: list, schema_columns: list=None):
+    """
+    build an explicit arrow schema for the given columns from schema.yaml
+    Args:
+        columns (list): dataframe columns in the order they are written
+        schema_columns (list): `columns` entries of schema.yaml, e.g. [{'aa_000': 'int'}, ...]
+    Returns:
+        pyarrow.Schema: sensor readings are nullable so integer columns are stored as float64
+    """
+    import pyarrow as pa
+
+    arrow_types = {'int': pa.float64(), 'float': pa.float64(), 'category': pa.string()}
+    column_types = {}
+    for column in schema_columns or []:
+        column_types.update(dict(column))
+
+    fields = []
+    for column in columns:
+        if column in column_types:
+            fields.append(pa.field(column, arrow_types[column_types[column]]))
+        else:
+            # columns outside schema.yaml, e.g. `predicted_class`
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def get_file_format(path: Path) -> str:
+    """
+    returns artifact format of a data file based on its extension
+    Args:
+        path (Path): path to .csv, .parquet or .feather file
+    """
+    file_format = os.path.splitext(str(path))[1].lstrip('.').lower()
+    if file_format not in ('csv', 'parquet', 'feather'):
+        raise ValueError(f'Unsupported data file format: {path}')
+    return file_format
+
+
+def read_dataframe(path: Path, columns: list=None) -> pd.DataFrame:
+    """
+    reads csv, parquet or feather file into a dataframe
+    Args:
+        path (Path): path to the data file, format is taken from the extension
+        columns (list): only read these columns (column projection). Defaults to all columns
+    Returns:
+        pd.DataFrame
+    """
+    try:
+        file_format = get_file_format(path)
+        if file_format == 'parquet':
+            return pd.read_parquet(path, columns=columns)
+        elif file_format == 'feather':
+            return pd.read_feather(path, columns=columns)
+        else:
+            df = pd.read_csv(path, usecols=columns)
+            # usecols does not keep the requested order
+            return df if columns is None else df[list(columns)]
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def iter_dataframe(path: Path, columns: list=None, chunk_size: int=100000):
+    """
+    reads csv, parquet or feather file in chunks, so files larger than memory can be processed
+    Args:
+        path (Path): path to the data file, format is taken from the extension
+        columns (list): only read these columns (column projection). Defaults to all columns
+        chunk_size (int): maximum number of rows per chunk
+    Yields:
+        pd.DataFrame
+    """
+    try:
+        file_format = get_file_format(path)
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()
+        elif file_format == 'feather':
+            import pyarrow as pa
+
+            # the file is memory-mapped, only the rows of the current chunk are converted
+            with pa.memory_map(str(path)) as source:
+                table = pa.ipc.open_file(source).read_all()
+                if columns is not None:
+                    table = table.select(list(columns))
+                for offset in range(0, table.num_rows, chunk_size):
+                    yield table.slice(offset, chunk_size).to_pandas()
+        else:
+            for df in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+                yield df if columns is None else df[list(columns)]
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def get_columns(path: Path) -> list:
+    """
+    column names of a csv, parquet or feather file without reading its rows
+    """
+    try:
+        file_format = get_file_format(path)
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(path).schema_arrow.names
+        elif file_format == 'feather':
+            import pyarrow as pa
+            with pa.memory_map(str(path)) as source:
+                return pa.ipc.open_file(source).schema.names
+        else:
+            return list(pd.read_csv(path, nrows=0).columns)
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def get_number_of_rows(path: Path) -> int:
+    """
+    number of rows of a csv, parquet or feather file, parquet and feather only read metadata
+    """
+    try:
+        file_format = get_file_format(path)
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(path).metadata.num_rows
+        elif file_format == 'feather':
+            import pyarrow as pa
+            with pa.memory_map(str(path)) as source:
+                reader = pa.ipc.open_file(source)
+                return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        else:
+            first_column = get_columns(path)[:1]
+            return sum(len(df) for df in iter_dataframe(path, columns=first_column))
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+class DataFrameWriter:
+    """
+    writes dataframe chunks one after another into a single csv, parquet or feather file
+    Args:
+        path (Path): path to the data file, format is taken from the extension
+        schema_columns (list): `columns` entries of schema.yaml used to type columnar files
+        file_obj: optional, binary file object written to instead of `path`, e.g. an s3 upload,
+            it is not closed by the writer
+    """
+    def __init__(self, path: Path, schema_columns: list=None, file_obj=None):
+        self.path = path
+        self.file_obj = file_obj
+        self.schema_columns = schema_columns
+        self.file_format = get_file_format(path)
+        self.schema = None
+        self.writer = None
+        self.number_of_chunks = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.file_format == 'csv' and self.file_obj is not None:
+            self.file_obj.write(df.to_csv(index=False, header=(self.number_of_chunks == 0)).encode('utf-8'))
+        elif self.file_format == 'csv':
+            df.to_csv(self.path, mode='w' if self.number_of_chunks == 0 else 'a',
+                      index=False, header=(self.number_of_chunks == 0))
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self.schema is None:
+                self.schema = get_arrow_schema(list(df), self.schema_columns)
+                sink = self.path if self.file_obj is None else self.file_obj
+                if self.file_format == 'parquet':
+                    self.writer = pq.ParquetWriter(sink, self.schema)
+                else:
+                    self.writer = pa.ipc.new_file(sink, self.schema)
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            self.writer.write_table(table)
+        self.number_of_chunks += 1
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_dataframe(df: pd.DataFrame, path: Path, schema_columns: list=None) -> None:
+    """
+    writes dataframe to csv, parquet or feather file
+    Args:
+        df (pd.DataFrame): data to be saved
+        path (Path): path to the data file, format is taken from the extension
+        schema_columns (list): `columns` entries of schema.yaml used to type columnar files
+    """
+    try:
+        with DataFrameWriter(path, schema_columns) as writer:
+            writer.write(df)
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
 @ensure_annotations
 def create_directories(path_to_directories: list, verbos=True):
     """
@@ -117,6 +332,33 @@ def get_size(path: Path) -> str:
     except Exception as e:
         raise CustomException(e, sys)
 
+def get_file_hash(path: Path) -> str:
+    """
+    sha256 of the file content, read in blocks so large artifacts are not loaded at once
+    Args:
+        path (Path): path of the file
+    Returns:
+        str: hex digest
+    """
+    try:
+        file_hash = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def get_n_jobs(n_jobs: int) -> int:
+    """
+    number of processes or threads for an n_jobs setting, -1 uses every core like scikit-learn
+    """
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(os.cpu_count() + 1 + n_jobs, 1)
+    return n_jobs
+
 #@ensure_annotations
 def save_pickle(path: Path, obj: object) -> None:
     """
@@ -128,8 +370,11 @@ def save_pickle(path: Path, obj: object) -> None:
     try:
         dir_path = os.path.dirname(path)
         os.makedirs(dir_path, exist_ok=True)
-        with open(path, 'wb') as file_obj:
+        # write next to the target and rename, readers never see a partially written file
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as file_obj:
             pickle.dump(obj, file_obj)
+        os.replace(temp_path, path)
         logging.info(f"pickle file saved at {path}!")
     
     except Exception as e:
@@ -167,6 +412,10 @@ def confusion_matrix_display(y_true: np.array, y_pred: np.array, path: Path, cla
         
     """
     try:
+        # imported on first use, the prediction server and most stages never plot
+        import matplotlib.pyplot as plt
+        from sklearn.metrics import ConfusionMatrixDisplay, confusion_matrix
+
         cm = confusion_matrix(y_true, y_pred)
         disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=classes)
         disp.plot(cmap=plt.cm.Blues)
@@ -187,15 +436,26 @@ def classifier_performance_report(y_true: np.array, y_pred: np.array,  path: Pat
 
     """
     try:
-        metrics_summary = precision_recall_fscore_support(y_true=y_true, y_pred=y_pred)    
-        avg = list(precision_recall_fscore_support(y_true=y_true, y_pred=y_pred, average='weighted'))
-        metrics_sum_index = ['precision', 'recall', 'f1-score', 'support']
-        class_report_df = pd.DataFrame(list(metrics_summary), index=metrics_sum_index)
+        # every metric is derived from one confusion matrix, built in a single pass over the labels
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
+        labels = np.union1d(y_true, y_pred)
+        codes = np.searchsorted(labels, y_true) * len(labels) + np.searchsorted(labels, y_pred)
+        cm = np.bincount(codes, minlength=len(labels) ** 2).reshape(len(labels), len(labels))
 
-        support = class_report_df.loc['support']
-        total = support.sum() 
-        avg[-1] = total
+        true_positives = np.diag(cm).astype(np.float64)
+        support = cm.sum(axis=1)
+        predicted = cm.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # undefined ratios are 0, like zero_division='warn' of scikit-learn
+            precision = np.nan_to_num(true_positives / predicted)
+            recall = np.nan_to_num(true_positives / support)
+            f1 = np.nan_to_num(2 * true_positives / (support + predicted))
+        total = support.sum()
+        avg = [float(np.dot(metric, support) / total) for metric in (precision, recall, f1)] + [total]
 
+        metrics_sum_index = ['precision', 'recall', 'f1-score', 'support']
+        class_report_df = pd.DataFrame([precision, recall, f1, support], index=metrics_sum_index)
         class_report_df['avg / total'] = avg              
         metrics_table = class_report_df.T
         metrics_table.index = classes + ['avg / total']
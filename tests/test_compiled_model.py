@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from xgboost import XGBClassifier
+from sensorFaultDetection.components.model_trainer import SensorModel
+from sensorFaultDetection.components.data_transformation import DataTransformation
+from sensorFaultDetection.compiled_model import CompiledSensorModel, load_sensor_model
+
+
+NUMPY_MAX_ROWS = 16
+
+
+@pytest.fixture(scope='module')
+def sensor_model_and_rows():
+    # a small SensorModel fitted like the trainer does, on sensor-like columns with missing cells
+    random_generator = np.random.default_rng(0)
+    columns = [f'a{j}_000' for j in range(12)]
+    X = pd.DataFrame(random_generator.lognormal(2, 1, (3000, len(columns))), columns=columns)
+    X[X < 3] = 0
+    y = ((X['a0_000'] + 0.5 * X['a1_000'] - X['a2_000'] + random_generator.normal(0, 3, len(X))) > 8).astype(int)
+    X = X.mask(random_generator.random(X.shape) < 0.1)
+
+    preprocessor = DataTransformation.get_data_transformer_object().fit(X[:2000])
+    model = XGBClassifier(n_estimators=200, max_depth=4, learning_rate=0.1, early_stopping_rounds=10,
+                          eval_metric='logloss')
+    model.fit(preprocessor.transform(X[:2000]), y[:2000], eval_set=[(preprocessor.transform(X[2000:]), y[2000:])],
+              verbose=False)
+    return SensorModel(preprocessor, model), X[2000:].reset_index(drop=True)
+
+
+@pytest.mark.parametrize('number_of_rows', [1, 40, 1000])
+def test_compiled_model_predicts_like_sensor_model(sensor_model_and_rows, number_of_rows):
+    # 1 and 16 rows or less are scored by the numpy tree walk, more rows by xgboost inplace_predict
+    sensor_model, rows = sensor_model_and_rows
+    compiled_model = CompiledSensorModel.from_sensor_model(sensor_model, numpy_max_rows=NUMPY_MAX_ROWS)
+    for start in range(0, len(rows), number_of_rows):
+        batch = rows.iloc[start: start + number_of_rows]
+        np.testing.assert_array_equal(compiled_model.predict(batch), sensor_model.predict(batch))
+
+
+def test_numpy_tree_walk_predicts_like_sensor_model(sensor_model_and_rows):
+    sensor_model, rows = sensor_model_and_rows
+    compiled_model = CompiledSensorModel.from_sensor_model(sensor_model, numpy_max_rows=len(rows))
+    assert rows.isna().any().any()
+    np.testing.assert_array_equal(compiled_model.predict(rows), sensor_model.predict(rows))
+    report = compiled_model.check_parity(sensor_model, rows)
+    assert report['passed'] and report['numpy_mismatches'] == 0 and report['booster_mismatches'] == 0
+
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_model_bundle_round_trip(sensor_model_and_rows, tmp_path, mmap_mode):
+    sensor_model, rows = sensor_model_and_rows
+    compiled_model = CompiledSensorModel.from_sensor_model(sensor_model, numpy_max_rows=NUMPY_MAX_ROWS)
+    bundle_path = tmp_path / 'model_bundle'
+    compiled_model.save(str(bundle_path), model_id='test')
+
+    loaded_model = load_sensor_model(str(bundle_path), mmap_mode=mmap_mode)
+    assert isinstance(loaded_model, CompiledSensorModel)
+    assert loaded_model.columns == compiled_model.columns
+    assert loaded_model.get_preprocessor_fingerprint() == compiled_model.get_preprocessor_fingerprint()
+    for number_of_rows in (1, 40, len(rows)):
+        batch = rows.iloc[:number_of_rows]
+        np.testing.assert_array_equal(loaded_model.predict(batch), sensor_model.predict(batch))
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import ks_2samp
+from sensorFaultDetection.drift import BaselineSketch
+
+
+def make_samples(n: int, seed: int) -> tuple:
+    # continuous, tied and mostly missing columns, the current sample is shifted so some columns drift
+    random_generator = np.random.default_rng(seed)
+    def sample(size, shift):
+        columns = {
+            'normal': random_generator.normal(shift, 1, size),
+            'tied': np.round(random_generator.exponential(2 + shift, size)),
+            'zeros': np.where(random_generator.random(size) < 0.7, 0, random_generator.normal(shift, 5, size)),
+            'nan_heavy': np.where(random_generator.random(size) < 0.6, np.nan, random_generator.normal(shift, 1, size)),
+        }
+        return pd.DataFrame(columns)
+    return sample(n, 0), sample(max(n // 2, 1), 0.3)
+
+
+def sketch_statistics(base: pd.DataFrame, current: pd.DataFrame, number_of_quantiles: int) -> np.ndarray:
+    sketch = BaselineSketch.from_dataframe(base, number_of_quantiles)
+    le, lt = sketch.count_histograms(current[sketch.columns].to_numpy(dtype=np.float64, na_value=np.nan))
+    statistics, _ = sketch.ks_statistic_from_histograms(le, lt)
+    return statistics
+
+
+def exact_statistics(base: pd.DataFrame, current: pd.DataFrame) -> np.ndarray:
+    return np.array([ks_2samp(base[column].dropna(), current[column].dropna()).statistic for column in base.columns])
+
+
+@pytest.mark.parametrize('number_of_quantiles', [10, 100, 1000])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_sketch_statistic_within_one_over_k(number_of_quantiles, seed):
+    base, current = make_samples(20000, seed)
+    error = np.abs(sketch_statistics(base, current, number_of_quantiles) - exact_statistics(base, current))
+    assert np.all(error < 1 / number_of_quantiles)
+
+
+@pytest.mark.parametrize('number_of_quantiles', [10, 100, 1000])
+def test_sketch_is_exact_up_to_k_observations(number_of_quantiles):
+    # every non-missing value of the base is a knot, the missing ones are left out like in ks_2samp
+    for n in (number_of_quantiles // 2, number_of_quantiles):
+        base, current = make_samples(n, n)
+        np.testing.assert_allclose(sketch_statistics(base, current, number_of_quantiles),
+                                   exact_statistics(base, current), rtol=0, atol=1e-12)
+
+
+def test_report_from_histograms_matches_asymptotic_ks_2samp():
+    base, current = make_samples(50000, 3)
+    sketch = BaselineSketch.from_dataframe(base, 1000)
+    status, report = sketch.detect_dataset_drift(current, threshold=0.05)
+    for column in base.columns:
+        expected = ks_2samp(base[column].dropna(), current[column].dropna(), method='asymp')
+        assert report[column]['drift_status'] == (expected.pvalue < 0.05)
+    assert status == (not any(column_report['drift_status'] for column_report in report.values()))
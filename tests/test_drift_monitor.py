@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+from sensorFaultDetection.drift import BaselineSketch
+from sensorFaultDetection.drift_monitor import OnlineDriftMonitor
+from sensorFaultDetection.entity.config_entity import DriftMonitorConfig
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def config(tmp_path):
+    return DriftMonitorConfig(root_dir=str(tmp_path), report_file=str(tmp_path / 'report.yaml'),
+                              report_dir=str(tmp_path / 'windows'), enabled=True, window_seconds=300,
+                              slide_seconds=100, min_rows=1, pvalue_threshold=0.05, retrain_on_drift=True,
+                              retrain_drifted_columns_ratio=0.5)
+
+
+def make_rows(number_of_rows: int, shift: float, seed: int) -> pd.DataFrame:
+    random_generator = np.random.default_rng(seed)
+    rows = pd.DataFrame(random_generator.normal(shift, 1, (number_of_rows, 3)), columns=['a', 'b', 'c'])
+    return rows.mask(random_generator.random(rows.shape) < 0.1)
+
+
+def test_windows_report_like_detect_dataset_drift(config):
+    baseline = BaselineSketch.from_dataframe(make_rows(5000, 0, 0), 100)
+    clock = Clock(1000.0)
+    monitor = OnlineDriftMonitor(config, get_baseline=lambda: baseline, clock=clock)
+    batches = [make_rows(50, 0.05 * bucket, bucket) for bucket in range(5)]
+    windows = []
+    for bucket, batch in enumerate(batches):
+        for start in range(0, len(batch), 7):
+            monitor.update(batch.iloc[start: start + 7])
+        clock.now += config.slide_seconds
+        with monitor.lock:
+            windows.extend(monitor.rotate(clock.now))
+    assert len(windows) == len(batches)
+    for bucket, (_, le, lt, rows, window_baseline) in enumerate(windows):
+        window_rows = pd.concat(batches[max(bucket - 2, 0): bucket + 1])
+        _, expected = baseline.detect_dataset_drift(window_rows, config.pvalue_threshold)
+        _, report = window_baseline.report_from_histograms(le, lt, config.pvalue_threshold)
+        assert rows == len(window_rows)
+        assert report == expected
+
+
+def test_older_window_does_not_replace_latest_report(config):
+    baseline = BaselineSketch.from_dataframe(make_rows(5000, 0, 0), 100)
+    monitor = OnlineDriftMonitor(config, get_baseline=lambda: baseline, on_drift=lambda: calls.append(1), clock=Clock(0))
+    calls = []
+    histograms = {shift: baseline.count_histograms(make_rows(500, shift, 1).to_numpy()) for shift in (0, 3)}
+    # the newer window is reported before the older drifted one, e.g. by another thread
+    monitor.report([(200, *histograms[0], 500, baseline)])
+    monitor.report([(100, *histograms[3], 500, baseline)])
+
+    with open(config.report_file) as report_file:
+        latest_report = yaml.safe_load(report_file)
+    assert latest_report == baseline.report_from_histograms(*histograms[0], config.pvalue_threshold)[1]
+    assert calls == []
+    assert monitor.last_window_end == 200
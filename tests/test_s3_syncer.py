@@ -0,0 +1,170 @@
+import os
+import boto3
+import pytest
+from moto import mock_aws
+from sensorFaultDetection.exception import CustomException
+from sensorFaultDetection.cloud_storage.s3_syncer import S3Sync
+from sensorFaultDetection.cloud_storage.s3_writer import S3MultipartWriter, MIN_PART_SIZE
+from sensorFaultDetection.cloud_storage.artifact_store import ArtifactStore
+from sensorFaultDetection.entity.config_entity import S3SyncConfig, ArtifactStoreConfig
+
+
+BUCKET = 'sensor-artifacts'
+# s3 and moto reject parts below 5 MiB, a multipart file needs at least two parts of that size
+LARGE_FILE_SIZE = 2 * MIN_PART_SIZE + 1024
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def s3_sync_config():
+    return S3SyncConfig(max_workers=4, multipart_threshold=MIN_PART_SIZE, multipart_chunksize=MIN_PART_SIZE,
+                        multipart_concurrency=2)
+
+
+def write_file(path, content: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file_obj:
+        file_obj.write(content)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'artifacts'
+    write_file(folder / 'schema.yaml', b'columns: 3\n')
+    write_file(folder / 'model' / 'model.pkl', os.urandom(1000))
+    write_file(folder / 'model' / 'copy.pkl', b'same content')
+    write_file(folder / 'data' / 'copy.csv', b'same content')
+    write_file(folder / 'data' / 'train.npy', os.urandom(LARGE_FILE_SIZE))
+    return folder
+
+
+def test_sync_to_s3_skips_unchanged_files(client, s3_sync_config, folder):
+    s3_sync = S3Sync(s3_sync_config, client=client)
+    result = s3_sync.sync_folder_to_s3(folder, f's3://{BUCKET}/runs/1')
+    assert (result.files_transferred, result.files_skipped, result.errors) == (5, 0, [])
+
+    remote = s3_sync.list_objects(BUCKET, 'runs/1')
+    # the etag of the large file is the one of a multipart upload, the local etag has to match it
+    assert remote['runs/1/data/train.npy'][1].endswith('-3')
+    assert s3_sync.get_etag(folder / 'data' / 'train.npy', LARGE_FILE_SIZE) == remote['runs/1/data/train.npy'][1]
+
+    result = s3_sync.sync_folder_to_s3(folder, f's3://{BUCKET}/runs/1')
+    assert (result.files_transferred, result.files_skipped, result.bytes_transferred, result.errors) == (0, 5, 0, [])
+
+
+def test_sync_to_s3_uploads_changed_file_only(client, s3_sync_config, folder):
+    s3_sync = S3Sync(s3_sync_config, client=client)
+    s3_sync.sync_folder_to_s3(folder, f's3://{BUCKET}/runs/1')
+    # same size, another content
+    write_file(folder / 'schema.yaml', b'columns: 4\n')
+
+    uploaded = []
+    upload_file = client.upload_file
+    def record_upload(path, bucket, key, **kwargs):
+        uploaded.append(key)
+        return upload_file(path, bucket, key, **kwargs)
+    client.upload_file = record_upload
+
+    result = s3_sync.sync_folder_to_s3(folder, f's3://{BUCKET}/runs/1')
+    assert uploaded == ['runs/1/schema.yaml']
+    assert (result.files_transferred, result.files_skipped, result.bytes_transferred) == (1, 4, 11)
+    assert client.get_object(Bucket=BUCKET, Key='runs/1/schema.yaml')['Body'].read() == b'columns: 4\n'
+
+
+def test_sync_to_s3_reports_failed_uploads(client, s3_sync_config, folder):
+    s3_sync = S3Sync(s3_sync_config, client=client)
+    upload_file = client.upload_file
+    def fail_upload(path, bucket, key, **kwargs):
+        if key.endswith('model.pkl'):
+            raise OSError('connection reset')
+        return upload_file(path, bucket, key, **kwargs)
+    client.upload_file = fail_upload
+
+    result = s3_sync.sync_folder_to_s3(folder, f's3://{BUCKET}/runs/1')
+    assert result.files_transferred == 4
+    assert len(result.errors) == 1
+    assert 'model.pkl' in result.errors[0] and 'connection reset' in result.errors[0]
+    assert 'runs/1/model/model.pkl' not in s3_sync.list_objects(BUCKET, 'runs/1')
+
+
+def test_sync_from_s3_skips_unchanged_files(client, s3_sync_config, folder, tmp_path):
+    s3_sync = S3Sync(s3_sync_config, client=client)
+    s3_sync.sync_folder_to_s3(folder, f's3://{BUCKET}/runs/1')
+
+    restored = tmp_path / 'restored'
+    result = s3_sync.sync_folder_from_s3(restored, f's3://{BUCKET}/runs/1')
+    assert (result.files_transferred, result.files_skipped, result.errors) == (5, 0, [])
+    assert (restored / 'data' / 'train.npy').read_bytes() == (folder / 'data' / 'train.npy').read_bytes()
+
+    write_file(restored / 'model' / 'copy.pkl', b'other content')
+    result = s3_sync.sync_folder_from_s3(restored, f's3://{BUCKET}/runs/1')
+    assert (result.files_transferred, result.files_skipped) == (1, 4)
+    assert (restored / 'model' / 'copy.pkl').read_bytes() == b'same content'
+
+
+def test_artifact_store_uploads_every_content_once(client, s3_sync_config, folder, tmp_path):
+    store = ArtifactStore(ArtifactStoreConfig(objects_prefix='objects', runs_prefix='runs'), s3_sync_config, client=client)
+    result = store.upload_run(folder, BUCKET, 'run-1')
+    # the two files with the same content are one object
+    assert (result.files_transferred, result.files_skipped, result.errors) == (4, 0, [])
+    assert sorted(store.get_manifest(BUCKET, 'run-1')['files']) == [
+        'data/copy.csv', 'data/train.npy', 'model/copy.pkl', 'model/model.pkl', 'schema.yaml']
+
+    write_file(folder / 'schema.yaml', b'columns: 4\n')
+    result = store.upload_run(folder, BUCKET, 'run-2')
+    assert (result.files_transferred, result.files_skipped, result.bytes_transferred) == (1, 3, 11)
+
+    restored = tmp_path / 'restored'
+    result = store.download_run(restored, BUCKET, 'run-1')
+    assert (result.files_transferred, result.errors) == (5, [])
+    assert (restored / 'schema.yaml').read_bytes() == b'columns: 3\n'
+    assert (restored / 'data' / 'train.npy').read_bytes() == (folder / 'data' / 'train.npy').read_bytes()
+
+    result = store.download_run(restored, BUCKET, 'run-2')
+    assert (result.files_transferred, result.files_skipped) == (1, 4)
+    assert (restored / 'schema.yaml').read_bytes() == b'columns: 4\n'
+
+
+def test_artifact_store_writes_no_manifest_after_failed_upload(client, s3_sync_config, folder):
+    store = ArtifactStore(ArtifactStoreConfig(objects_prefix='objects', runs_prefix='runs'), s3_sync_config, client=client)
+    upload_file = client.upload_file
+    def fail_upload(path, bucket, key, **kwargs):
+        if path.endswith('model.pkl'):
+            raise OSError('connection reset')
+        return upload_file(path, bucket, key, **kwargs)
+    client.upload_file = fail_upload
+
+    result = store.upload_run(folder, BUCKET, 'run-1')
+    assert len(result.errors) == 1
+    with pytest.raises(CustomException):
+        store.get_manifest(BUCKET, 'run-1')
+
+
+# content below one part is put in one request, above it in parts with the rest as the last one
+@pytest.mark.parametrize('size, parts', [(0, 0), (1000, 0), (2 * MIN_PART_SIZE + 1000, 3)])
+def test_multipart_writer(client, size, parts):
+    content = os.urandom(size)
+    with S3MultipartWriter(BUCKET, 'predictions/a.csv', part_size=MIN_PART_SIZE, client=client) as writer:
+        for start in range(0, size, 1024 * 1024):
+            writer.write(content[start:start + 1024 * 1024])
+    assert client.get_object(Bucket=BUCKET, Key='predictions/a.csv')['Body'].read() == content
+    assert len(writer.parts) == parts
+
+
+def test_multipart_writer_aborts_on_error(client):
+    with pytest.raises(RuntimeError):
+        with S3MultipartWriter(BUCKET, 'predictions/a.csv', part_size=MIN_PART_SIZE, client=client) as writer:
+            writer.write(os.urandom(MIN_PART_SIZE + 1000))
+            raise RuntimeError('prediction failed')
+    assert 'Contents' not in client.list_objects_v2(Bucket=BUCKET)
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket=BUCKET)
@@ -0,0 +1,57 @@
+import os
+import threading
+import yaml
+from sensorFaultDetection.utils import write_yaml_file
+
+
+def test_write_yaml_file_replace_is_never_missing_or_partial(tmp_path):
+    path = str(tmp_path / 'status.yaml')
+    write_yaml_file(path=path, content={'status': 'running', 'step': 0}, replace=True)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        while not stop.is_set():
+            try:
+                with open(path) as yaml_file:
+                    content = yaml.safe_load(yaml_file)
+                assert set(content) == {'status', 'step'}
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    try:
+        for step in range(300):
+            write_yaml_file(path=path, content={'status': 'running', 'step': step}, replace=True)
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    assert errors == []
+    assert yaml.safe_load(open(path)) == {'status': 'running', 'step': 299}
+    assert os.listdir(tmp_path) == ['status.yaml']
+
+
+def test_write_yaml_file_concurrent_writers(tmp_path):
+    path = str(tmp_path / 'report.yaml')
+    errors = []
+
+    def write(writer):
+        try:
+            for step in range(100):
+                write_yaml_file(path=path, content={'writer': writer, 'step': step}, replace=True)
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=write, args=(writer,)) for writer in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert errors == []
+    assert yaml.safe_load(open(path))['step'] == 99
+    assert os.listdir(tmp_path) == ['report.yaml']